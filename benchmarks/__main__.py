@@ -0,0 +1,54 @@
+import argparse
+import os
+import sys
+
+from .suite import DEFAULT_SIZES, GROUPS, append_history, find_regressions, measure, save_baseline
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description="Benchmark the OPF, PID, PSS and scenario hot paths.")
+    parser.add_argument("groups", nargs="*", metavar="group", help=f"benchmark groups to run, of {', '.join(GROUPS)} (default: all)")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="network buses / fleet sizes")
+    parser.add_argument("--scenario-sizes", type=int, nargs="+", default=[1, 10], help="PSS units in the scenario runs")
+    parser.add_argument("--formulation", default="angle", choices=["angle", "ptdf"])
+    parser.add_argument("--solver", default="auto")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--history", default=os.path.join(HERE, "history.json"))
+    parser.add_argument("--baseline", default=os.path.join(HERE, "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the new baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative slowdown that counts as a regression")
+    args = parser.parse_args(argv)
+    unknown = [group for group in args.groups if group not in GROUPS]
+    if unknown:
+        parser.error(f"unknown benchmark groups {unknown}, expected some of {list(GROUPS)}")
+
+    groups = args.groups or list(GROUPS)
+    cases = []
+    for group in groups:
+        if group == "opf":
+            cases += GROUPS[group](args.sizes, formulation=args.formulation, solver=args.solver)
+        elif group == "scenario":
+            cases += GROUPS[group](args.scenario_sizes)
+        else:
+            cases += GROUPS[group](args.sizes)
+
+    results = []
+    print(f"{'case':<32}{'seconds':>12}{'ops/s':>14}{'peak MB':>10}")
+    for case in cases:
+        result = measure(case, args.repeat)
+        results.append(result)
+        print(f"{result.name:<32}{result.seconds:>12.4f}{result.throughput:>14.1f}{result.peak_mb:>10.1f}", flush=True)
+
+    append_history(args.history, results)
+    regressions = find_regressions(results, args.baseline, args.threshold)
+    for name, metric, before, after in regressions:
+        print(f"REGRESSION {name}: {metric} {before:.4g} -> {after:.4g}")
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,18 @@
+import numpy as np
+
+# Network generators live in phaseone.testing
+
+
+def synthetic_pss_params(n, seed=0):
+    # Per-unit parameters as used by PSSSimulator.create / PSSFleet.add
+    rng = np.random.default_rng(seed)
+    return {
+        "pressure_wave_runtime": rng.uniform(0.5, 3.0, n),
+        "nominal_power": rng.uniform(1e5, 1e6, n),
+        "energy": rng.uniform(1e5, 1e6, n),
+    }
+
+
+def synthetic_pid_gains(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(1e-4, 1e-2, n), rng.uniform(1e-6, 1e-4, n), rng.uniform(0, 1e-3, n)
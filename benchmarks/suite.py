@@ -0,0 +1,296 @@
+import gc
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from phaseone import model as opf_model
+from phaseone import solve_network, solve_network_decomposed, utils
+from phaseone.testing import TOPOLOGIES, perturb_loads, synthetic_network
+from phasetwo import PIDController, PIDControllerBank
+
+from .generators import synthetic_pid_gains, synthetic_pss_params
+
+DEFAULT_SIZES = (10, 100, 1000)
+
+
+@dataclass
+class Case:
+    # setup() builds fresh state outside the timed region, run(state) is
+    # timed. ops is the number of work units per run (solves, controller
+    # steps, ...) used for the throughput.
+    name: str
+    setup: object
+    run: object
+    ops: int = 1
+    group: str = ""
+
+
+@dataclass
+class BenchResult:
+    name: str
+    group: str
+    seconds: float  # best of the repeats
+    ops: int
+    throughput: float  # ops per second
+    peak_mb: float  # peak traced Python allocations during one run
+
+
+def measure(case, repeat=3):
+    times = []
+    for _ in range(repeat):
+        state = case.setup()
+        gc.collect()
+        start = time.perf_counter()
+        case.run(state)
+        times.append(time.perf_counter() - start)
+
+    # Separate run for memory, tracemalloc slows down the timed runs
+    state = case.setup()
+    gc.collect()
+    tracemalloc.start()
+    case.run(state)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = min(times)
+    return BenchResult(case.name, case.group, seconds, case.ops, case.ops / seconds if seconds > 0 else float("inf"), peak / 2**20)
+
+
+# ==== Cases ====
+
+def ptdf_cases(sizes, topologies=TOPOLOGIES):
+    for topology in topologies:
+        for n in sizes:
+            net = synthetic_network(n, topology=topology)
+            buses = net.bus_id.tolist()
+            lines = [
+                {"from_bus_id": f, "to_bus_id": t, "b_siemens": b}
+                for f, t, b in zip(net.line_from.tolist(), net.line_to.tolist(), net.line_b.tolist())
+            ]
+
+            def setup():
+                utils._ptdf_cache.clear()
+
+            def run(_, buses=buses, lines=lines):
+                utils.build_ptdf_matrix(buses, lines, 0)
+
+            yield Case(f"ptdf.build[{topology}-{n}]", setup, run, group="ptdf")
+
+
+def n1_cases(sizes, topologies=TOPOLOGIES, intervals=10):
+    # N-1 screening of all line outages for changing loads
+    from phaseone import contingency
+
+    for topology in topologies:
+        for n in sizes:
+            net = synthetic_network(n, topology=topology)
+            variants = [perturb_loads(net, seed=k) for k in range(intervals)]
+
+            def setup(net=net):
+                contingency.get_screener(net)
+
+            def run(_, variants=variants):
+                for variant in variants:
+                    contingency.screen_contingencies(variant)
+
+            yield Case(f"n1.screen[{topology}-{n}]", setup, run, ops=intervals * len(net.line_from), group="n1")
+
+
+def opf_cases(sizes, topologies=TOPOLOGIES, formulation="angle", solver="auto", solves=10):
+    for topology in topologies:
+        for n in sizes:
+            net = synthetic_network(n, topology=topology)
+            variants = [perturb_loads(net, seed=k) for k in range(solves)]
+
+            def cold_setup():
+                opf_model._engines.clear()
+                utils._ptdf_cache.clear()
+
+            def cold_run(_, net=net):
+                solve_network(net, solver, formulation)
+
+            def warm_setup(net=net):
+                solve_network(net, solver, formulation)
+
+            def warm_run(_, variants=variants):
+                for variant in variants:
+                    solve_network(variant, solver, formulation)
+
+            yield Case(f"opf.cold[{topology}-{n}]", cold_setup, cold_run, group="opf")
+            yield Case(f"opf.warm[{topology}-{n}]", warm_setup, warm_run, ops=solves, group="opf")
+
+
+def zonal_cases(sizes, zone_buses=100, workers=None, solves=10):
+    # Decomposed solve of radial feeders against the monolithic opf cases
+    from phaseone import decomposition
+
+    for n in sizes:
+        net = synthetic_network(n, topology="radial")
+        variants = [perturb_loads(net, seed=k) for k in range(solves)]
+
+        def cold_setup():
+            decomposition._zone_engines.clear()
+
+        def cold_run(_, net=net):
+            solve_network_decomposed(net, max_zone_buses=zone_buses, workers=workers)
+
+        def warm_setup(net=net):
+            solve_network_decomposed(net, max_zone_buses=zone_buses, workers=workers)
+
+        def warm_run(_, variants=variants):
+            for variant in variants:
+                solve_network_decomposed(variant, max_zone_buses=zone_buses, workers=workers)
+
+        yield Case(f"zonal.cold[{n}]", cold_setup, cold_run, group="zonal")
+        yield Case(f"zonal.warm[{n}]", warm_setup, warm_run, ops=solves, group="zonal")
+
+
+def pid_cases(sizes, steps=100):
+    for n in sizes:
+        kp, ki, kd = synthetic_pid_gains(n)
+        process = np.random.default_rng(0).normal(0, 100, (steps, n))
+
+        def scalar_setup(kp=kp, ki=ki, kd=kd):
+            return [PIDController(p, i, d, max_cumulative=1, min_cumulative=0) for p, i, d in zip(kp, ki, kd)]
+
+        def scalar_run(controllers, process=process):
+            for t, row in enumerate(process.tolist()):
+                for controller, value in zip(controllers, row):
+                    controller.step(t, 0.0, value)
+
+        def bank_setup(kp=kp, ki=ki, kd=kd):
+            return PIDControllerBank(kp, ki, kd, max_cumulative=1, min_cumulative=0)
+
+        def bank_run(bank, process=process):
+            for t, row in enumerate(process):
+                bank.step(t, 0.0, row)
+
+        yield Case(f"pid.scalar[{n}]", scalar_setup, scalar_run, ops=n * steps, group="pid")
+        yield Case(f"pid.bank[{n}]", bank_setup, bank_run, ops=n * steps, group="pid")
+
+
+def pss_cases(sizes, steps=600):
+    from phasethree.pss_simulator import PSSFleet
+
+    for n in sizes:
+        params = synthetic_pss_params(n)
+        valve = np.random.default_rng(0).uniform(0, 1, n)
+
+        def setup(n=n, params=params):
+            fleet = PSSFleet()
+            fleet.add(n, params["pressure_wave_runtime"], params["nominal_power"], params["energy"])
+            return fleet
+
+        def run(fleet, n=n, valve=valve):
+            indices = np.arange(n)
+            pump = np.zeros(n)
+            for _ in range(steps):
+                fleet.step(indices, 1, valve, pump)
+
+        yield Case(f"pss.fleet[{n}]", setup, run, ops=n * steps, group="pss")
+
+
+def synthetic_assets(n_pss, n_loads=2, seed=0):
+    # asset_description.json style input for the headless scenario
+    params = synthetic_pss_params(n_pss, seed)
+    return {
+        "loads": [{"bus": i} for i in range(n_loads)],
+        "pss": [
+            {
+                "bus": i,
+                "E_PSS_max_wh": 1e6,
+                "E_PSS_init_wh": float(params["energy"][i]),
+                "P_PSS_max_w": float(params["nominal_power"][i]),
+                "K_p": 1e-3,
+                "K_i": 1e-5,
+                "K_d": 0.0,
+                "pressure_wave_runtime": float(params["pressure_wave_runtime"][i]),
+            }
+            for i in range(n_pss)
+        ],
+    }
+
+
+def run_scenario(n_pss, duration=3600, pss_step="exact"):
+    from phasethree.headless import HeadlessScenario
+
+    HeadlessScenario(synthetic_assets(n_pss), pss_step=pss_step, cache_size=0).run(duration)
+
+
+def scenario_cases(sizes, duration=3600):
+    for n in sizes:
+        for pss_step in ("exact", "held"):
+            def run(_, n=n, pss_step=pss_step):
+                run_scenario(n, duration, pss_step)
+
+            yield Case(f"scenario.{pss_step}[{n}]", lambda: None, run, ops=duration, group="scenario")
+
+
+GROUPS = {
+    "ptdf": ptdf_cases,
+    "opf": opf_cases,
+    "zonal": zonal_cases,
+    "n1": n1_cases,
+    "pid": pid_cases,
+    "pss": pss_cases,
+    "scenario": scenario_cases,
+}
+
+
+# ==== History and regressions ====
+
+def environment():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+    }
+
+
+def append_history(path, results):
+    history = []
+    if os.path.exists(path):
+        with open(path) as f:
+            history = json.load(f)
+    history.append(dict(environment(), results=[asdict(result) for result in results]))
+    with open(path, "w") as f:
+        json.dump(history, f, indent=2)
+
+
+def save_baseline(path, results):
+    with open(path, "w") as f:
+        json.dump({result.name: asdict(result) for result in results}, f, indent=2)
+
+
+def find_regressions(results, baseline_path, threshold=0.2):
+    # Cases that got slower or use more memory than the baseline by more
+    # than `threshold` (relative). Memory differences below 1 MB are ignored.
+    if not os.path.exists(baseline_path):
+        return []
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    regressions = []
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None:
+            continue
+        if result.seconds > base["seconds"] * (1 + threshold):
+            regressions.append((result.name, "seconds", base["seconds"], result.seconds))
+        if result.peak_mb > base["peak_mb"] * (1 + threshold) and result.peak_mb - base["peak_mb"] > 1:
+            regressions.append((result.name, "peak_mb", base["peak_mb"], result.peak_mb))
+    return regressions
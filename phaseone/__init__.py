@@ -1,8 +1,16 @@
 import json
-from .model import solve_dc_opf
+from .batch import BatchOPFEngine, solve_dc_opf_batch, solve_network_batch
+from .cache import SolutionCache
+from .contingency import ContingencyScreener, ScreeningReport, screen_contingencies
+from .decomposition import DecompositionReport, partition_zones, solve_network_decomposed
+from .horizon import MultiPeriodOPFEngine
+from .model import DCOPFEngine, get_engine, solve_dc_opf, solve_network
+from .network import ADNArrays, OPFResult
+from .solvers import STATS, SolveReport, SolveStats, resolve_solver
 
 
 def run_dc_opf(config: str) -> str:
+    # JSON compatibility wrapper around solve_network
     data = json.loads(config)
-    result = solve_dc_opf(data["adn"])
-    return json.dumps({"result": result})
+    result = solve_network(ADNArrays.from_config(data["adn"]))
+    return json.dumps({"result": result.to_dict()})
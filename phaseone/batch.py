@@ -0,0 +1,203 @@
+import atexit
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+
+from pyomo.environ import Block, ConcreteModel, Objective, Set, SolverFactory, minimize
+
+from .model import DCOPFEngine
+from .network import as_network
+from .solvers import DEFAULT_SOLVER, STATS, SolveReport, check_problem, resolve_solver, run_solver
+
+MAX_CACHED_BATCHES = 8
+BATCH_MODES = ("stack", "pool")
+
+
+class BatchOPFEngine:
+    # Stacks one DCOPFEngine block per network/scenario into a single model.
+    # The blocks share no variables, so minimising the summed objective
+    # solves every scenario in one solver call. An infeasible scenario makes
+    # the whole batch fail.
+    #
+    # update/solve take optional scenario indices: the other blocks are
+    # deactivated and left out of the objective, so changing subsets of a
+    # fleet are re-solved on this one model instead of a new one per subset.
+
+    def __init__(self, adn_configs, solver=DEFAULT_SOLVER, formulation="angle", problem="auto"):
+        check_problem(problem)
+        start = time.perf_counter()
+        adn_configs = [as_network(cfg) for cfg in adn_configs]
+        self.key = tuple(net.topology_key() for net in adn_configs)
+        self.problem = problem
+        self.solver_name = resolve_solver(solver)
+        self.solver = SolverFactory(self.solver_name)
+        self.report = SolveReport(self.solver_name, formulation, problem)
+
+        model = ConcreteModel()
+        model.S = Set(initialize=range(len(adn_configs)))
+        model.scenario = Block(model.S)
+        self.engines = [
+            DCOPFEngine(cfg, solver=None, formulation=formulation, problem=problem, block=model.scenario[s])
+            for s, cfg in enumerate(adn_configs)
+        ]
+        for engine in self.engines:
+            engine.model.obj.deactivate()
+        model.obj = Objective(expr=sum(engine.model.obj.expr for engine in self.engines), sense=minimize)
+        self.model = model
+        self.active = None
+        self.report.build_s = time.perf_counter() - start
+        STATS.add("build", self.report.build_s)
+
+    def update(self, adn_configs, indices=None):
+        if len(adn_configs) != len(self.engines):
+            raise ValueError("Number of scenarios differs from the one this batch was built for")
+        start = time.perf_counter()
+        for i in range(len(self.engines)) if indices is None else indices:
+            self.engines[i].update(adn_configs[i])
+        self.report.update_s = time.perf_counter() - start
+        STATS.add("update", self.report.update_s)
+
+    def _activate(self, indices):
+        active = None if indices is None else tuple(indices)
+        if active == self.active:
+            return
+        selected = set(range(len(self.engines)) if active is None else active)
+        for s, engine in enumerate(self.engines):
+            if s in selected:
+                engine.model.activate()
+            else:
+                engine.model.deactivate()
+        self.model.obj.set_value(sum(self.engines[s].model.obj.expr for s in sorted(selected)))
+        self.active = active
+
+    def _selected(self):
+        return self.engines if self.active is None else [self.engines[s] for s in self.active]
+
+    def solve(self, indices=None):
+        self._activate(indices)
+        engines = self._selected()
+        for engine in engines:
+            engine.check_fixed_flows()
+        binaries = [engine.model.M for engine in engines]
+        run_solver(self.solver, self.model, binaries, self.problem, self.report)
+
+        start = time.perf_counter()
+        results = [engine.extract() for engine in engines]
+        self.report.extract_s = time.perf_counter() - start
+        STATS.add("extract", self.report.extract_s)
+        for result in results:
+            result.report = replace(self.report)
+        return results
+
+
+_batches = {}
+
+
+def get_batch_engine(adn_configs, solver=DEFAULT_SOLVER, formulation="angle", problem="auto", indices=None):
+    # With indices only those scenarios are updated on a cached batch
+    nets = [as_network(cfg) for cfg in adn_configs]
+    key = (tuple(net.topology_key() for net in nets), solver, formulation, problem)
+    batch = _batches.get(key)
+    if batch is not None:
+        batch.update(nets, indices)
+        return batch
+
+    if len(_batches) >= MAX_CACHED_BATCHES:
+        _batches.pop(next(iter(_batches)))
+    batch = _batches[key] = BatchOPFEngine(nets, solver, formulation, problem)
+    return batch
+
+
+def _solve_chunk(args):
+    adn_configs, solver, formulation, problem = args
+    return get_batch_engine(adn_configs, solver, formulation, problem).solve()
+
+
+_pool = None
+_pool_workers = None
+
+
+def _get_pool(workers):
+    global _pool, _pool_workers
+    if _pool is None or _pool_workers != workers:
+        shutdown_pool()
+        _pool = ProcessPoolExecutor(max_workers=workers)
+        _pool_workers = workers
+    return _pool
+
+
+def shutdown_pool():
+    global _pool, _pool_workers
+    if _pool is not None:
+        _pool.shutdown()
+    _pool = None
+    _pool_workers = None
+
+
+atexit.register(shutdown_pool)
+
+
+def solve_network_batch(adn_configs, solver=DEFAULT_SOLVER, formulation="angle", problem="auto", mode="stack",
+                        workers=None, cache=None, indices=None):
+    # mode="stack" solves all configs as one block-structured model in this
+    # process; mode="pool" splits them into one stacked chunk per worker
+    # process. Results are returned in input order either way. With a
+    # SolutionCache only configs whose state is not cached are solved, and
+    # identical configs within the batch are solved once.
+    #
+    # indices solves only those configs and returns their results in that
+    # order. In mode="stack" they are solved on the model of the full list
+    # with the other scenarios deactivated, so a fleet whose changed members
+    # differ every call keeps reusing one model.
+    if mode not in BATCH_MODES:
+        raise ValueError(f"Unknown batch mode {mode!r}, expected one of {BATCH_MODES}")
+
+    adn_configs = list(adn_configs)
+    if indices is not None:
+        indices = list(indices)
+        if indices == list(range(len(adn_configs))):
+            indices = None
+        elif not indices:
+            return []
+    if not adn_configs:
+        return []
+    if cache is not None:
+        return _solve_cached(adn_configs, solver, formulation, problem, mode, workers, cache, indices)
+    if mode == "stack":
+        return get_batch_engine(adn_configs, solver, formulation, problem, indices).solve(indices)
+    if indices is not None:
+        adn_configs = [adn_configs[i] for i in indices]
+
+    workers = workers or os.cpu_count() or 1
+    pool = _get_pool(workers)
+    size = -(-len(adn_configs) // workers)
+    chunks = [(adn_configs[i:i + size], solver, formulation, problem) for i in range(0, len(adn_configs), size)]
+    return [result for chunk in pool.map(_solve_chunk, chunks) for result in chunk]
+
+
+def _solve_cached(adn_configs, solver, formulation, problem, mode, workers, cache, indices):
+    nets = [as_network(cfg) for cfg in adn_configs]
+    selected = range(len(nets)) if indices is None else indices
+    keys = {i: cache.key(nets[i], solver, formulation, problem) for i in selected}
+    results = {i: cache.get(key) for i, key in keys.items()}
+
+    pending = {}
+    for i, key in keys.items():
+        if results[i] is None:
+            pending.setdefault(key, []).append(i)
+    if pending:
+        # The uncached configs are solved on the model of the full list
+        first = [positions[0] for positions in pending.values()]
+        solved = solve_network_batch(nets, solver, formulation, problem, mode, workers, indices=first)
+        for (key, positions), result in zip(pending.items(), solved):
+            cache.put(key, result)
+            for i in positions:
+                results[i] = replace(result)
+    return [results[i] for i in selected]
+
+
+def solve_dc_opf_batch(adn_configs, solver=DEFAULT_SOLVER, formulation="angle", problem="auto", mode="stack",
+                       workers=None, cache=None):
+    results = solve_network_batch(adn_configs, solver, formulation, problem, mode, workers, cache)
+    return [result.to_dict() for result in results]
@@ -0,0 +1,94 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+from dataclasses import replace
+
+import numpy as np
+
+from .network import as_network
+
+
+class SolutionCache:
+    # LRU cache of OPF results keyed by a hash of the network topology and
+    # its state (loads, generation, battery state, costs, imbalance) rounded
+    # to `quantum`. States that only differ below the quantum share a result.
+    # With a path the cache is loaded on creation and written by save().
+
+    def __init__(self, max_entries=4096, quantum=1e-3, path=None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1")
+        self.max_entries = max_entries
+        self.quantum = quantum
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def key(self, net, *options):
+        net = as_network(net)
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(repr((net.topology_key(), options)).encode())
+        state = np.concatenate([
+            net.bus_P_G_w,
+            net.bus_P_D_w,
+            net.bss_P_max_w,
+            net.bss_E_max_wh,
+            net.bss_E_init_wh,
+            [net.costs[name] for name in sorted(net.costs)],
+            [net.energy_imbalance_next_W],
+        ])
+        digest.update(np.round(state / self.quantum).astype(np.int64).tobytes())
+        return digest.hexdigest()
+
+    def get(self, key):
+        result = self._entries.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return replace(result)
+
+    def put(self, key, result):
+        stored = replace(result, P_BSS_ch_w=result.P_BSS_ch_w.copy(), P_BSS_dis_w=result.P_BSS_dis_w.copy())
+        stored.P_BSS_ch_w.flags.writeable = False
+        stored.P_BSS_dis_w.flags.writeable = False
+        self._entries[key] = stored
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self._entries),
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def save(self, path=None):
+        path = path or self.path
+        if path is None:
+            raise ValueError("No path given to save the solution cache to")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(list(self._entries.items()), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+
+    def load(self, path=None):
+        path = path or self.path
+        with open(path, "rb") as f:
+            for key, result in pickle.load(f):
+                self.put(key, result)
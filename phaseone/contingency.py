@@ -0,0 +1,180 @@
+import time
+from dataclasses import dataclass, field, replace
+
+import numpy as np
+
+from .decomposition import solve_network_decomposed
+from .model import solve_network
+from .network import OPFResult, as_network
+from .solvers import DEFAULT_SOLVER
+from .utils import build_ptdf_matrix, lodf_matrix
+
+MAX_CACHED_SCREENERS = 16
+
+
+@dataclass
+class Contingency:
+    outage: int  # index of the lost line
+    from_bus: object
+    to_bus: object
+    max_loading: float  # largest post-outage |flow| / limit (NaN if the outage islands the network)
+    worst_line: int
+    overloaded: int  # lines above the screening threshold
+    islanding: bool = False
+    result: OPFResult = None  # re-optimized dispatch without the line
+    error: str = None  # why the re-optimization failed, if it did
+
+    @property
+    def secure(self):
+        # Whether a feasible dispatch without the line was found
+        return self.result is not None
+
+
+@dataclass
+class ScreeningReport:
+    screened: int
+    base_loading: float  # largest pre-outage |flow| / limit
+    critical: list = field(default_factory=list)  # overloading outages, worst first
+    islanding: list = field(default_factory=list)
+    screen_s: float = 0.0
+    resolve_s: float = 0.0
+
+
+def without_line(net, outage):
+    net = as_network(net)
+    keep = np.arange(len(net.line_from)) != outage
+    return replace(
+        net, line_from=net.line_from[keep], line_to=net.line_to[keep], line_b=net.line_b[keep],
+        line_P_max_w=net.line_P_max_w[keep],
+    )
+
+
+class ContingencyScreener:
+    # N-1 screening for one network topology. The PTDF and the LODF of all
+    # line outages are computed once, so screening an interval is a single
+    # vectorized update of the line flows: the flow on line l after losing
+    # line k is f_l + LODF[l, k] * f_k. The LODF takes lines^2 floats.
+
+    def __init__(self, net):
+        net = as_network(net)
+        self.key = net.topology_key()
+        self.buses = net.bus_id.tolist()
+        lines = [
+            {"from_bus_id": f, "to_bus_id": t, "b_siemens": b}
+            for f, t, b in zip(net.line_from.tolist(), net.line_to.tolist(), net.line_b.tolist())
+        ]
+        self.ptdf, self.line_map = build_ptdf_matrix(self.buses, lines, net.slack_bus)
+        self.lodf = lodf_matrix(self.ptdf, self.line_map, self.buses)
+        self.islanding = np.flatnonzero(np.isnan(self.lodf[0])) if len(lines) else np.zeros(0, dtype=int)
+        self.limits = net.line_P_max_w
+        # LODF rows pre-scaled by 1 / limit, so the post-outage loadings are
+        # a single multiply-add per chunk (lines without capacity count as
+        # infinitely loaded as soon as they carry a flow)
+        with np.errstate(divide="ignore"):
+            self.inverse_limits = np.where(self.limits > 0, 1.0 / self.limits, np.inf)
+        with np.errstate(invalid="ignore"):
+            self.scaled_lodf = self.lodf * self.inverse_limits[:, None]
+        id_map = {bus: idx for idx, bus in enumerate(self.buses)}
+        self.bss_cols = np.array([id_map[bus] for bus in net.bss_bus_id.tolist()], dtype=int)
+
+    def flows(self, net, dispatch=None):
+        # Pre-outage line flows for the loads of `net` and a battery
+        # dispatch (OPFResult or net power per battery, None for idle)
+        net = as_network(net)
+        injection = net.bus_P_G_w - net.bus_P_D_w
+        if dispatch is not None:
+            power = dispatch.P_BSS_total_w if isinstance(dispatch, OPFResult) else np.asarray(dispatch, dtype=float)
+            np.add.at(injection, self.bss_cols, power)
+        return self.ptdf @ injection
+
+    def screen(self, net, dispatch=None, threshold=1.0, rating=1.0, outages=None, chunk=1024):
+        # Ranks the outages that load any remaining line above `threshold`
+        # times its limit scaled by `rating` (e.g. 1.2 for emergency
+        # ratings). Outages are processed in chunks to bound the memory of
+        # the post-outage flow matrix.
+        start = time.perf_counter()
+        flows = self.flows(net, dispatch)
+        with np.errstate(invalid="ignore"):
+            base = np.nan_to_num(np.abs(flows) * self.inverse_limits, nan=0.0, posinf=np.inf) / rating
+        outages = np.arange(len(self.limits)) if outages is None else np.asarray(outages, dtype=int)
+        islanding = np.isin(outages, self.islanding)
+        screened = outages[~islanding]
+
+        max_loading = np.empty(len(screened))
+        worst_line = np.empty(len(screened), dtype=int)
+        overloaded = np.empty(len(screened), dtype=int)
+        scaled_flows = flows * self.inverse_limits
+        for i in range(0, len(screened), chunk):
+            cols = screened[i:i + chunk]
+            span = np.arange(len(cols))
+            with np.errstate(invalid="ignore"):
+                loading = scaled_flows[:, None] + self.scaled_lodf[:, cols] * flows[cols]
+            np.abs(loading, out=loading)
+            if not np.all(self.limits > 0):
+                np.nan_to_num(loading, copy=False, nan=0.0, posinf=np.inf)
+            loading[cols, span] = 0.0  # the lost line carries nothing
+            worst = loading.argmax(axis=0)
+            worst_line[i:i + len(cols)] = worst
+            max_loading[i:i + len(cols)] = loading[worst, span] / rating
+            overloaded[i:i + len(cols)] = np.count_nonzero(loading > threshold * rating, axis=0)
+
+        ranked = np.flatnonzero(max_loading > threshold)
+        ranked = ranked[np.argsort(-max_loading[ranked], kind="stable")]
+        critical = [
+            Contingency(int(screened[j]), *self.line_map[int(screened[j])], float(max_loading[j]), int(worst_line[j]),
+                        int(overloaded[j]))
+            for j in ranked.tolist()
+        ]
+        return ScreeningReport(
+            screened=len(screened),
+            base_loading=float(base.max()) if base.size else 0.0,
+            critical=critical,
+            islanding=[
+                Contingency(int(k), *self.line_map[int(k)], float("nan"), -1, 0, islanding=True)
+                for k in outages[islanding].tolist()
+            ],
+            screen_s=time.perf_counter() - start,
+        )
+
+
+_screeners = {}
+
+
+def get_screener(net):
+    net = as_network(net)
+    key = net.topology_key()
+    screener = _screeners.get(key)
+    if screener is None:
+        if len(_screeners) >= MAX_CACHED_SCREENERS:
+            _screeners.pop(next(iter(_screeners)))
+        screener = _screeners[key] = ContingencyScreener(net)
+    return screener
+
+
+def screen_contingencies(net, dispatch=None, threshold=1.0, rating=1.0, outages=None, resolve=False,
+                        max_resolves=None, resolve_islanding=False, solver=DEFAULT_SOLVER, formulation="angle",
+                        problem="auto"):
+    # N-1 screening of `net` under `dispatch` (see ContingencyScreener).
+    # With resolve=True only the critical outages (worst first, at most
+    # max_resolves) are re-optimized without the lost line, and with
+    # resolve_islanding=True also the outages the LODF cannot screen
+    # because they island the network (solved per island). A failed
+    # re-optimization means the batteries cannot secure that outage.
+    net = as_network(net)
+    report = get_screener(net).screen(net, dispatch, threshold, rating, outages)
+    if not resolve:
+        return report
+
+    start = time.perf_counter()
+    pending = report.critical[:max_resolves] + (report.islanding if resolve_islanding else [])
+    for contingency in pending:
+        outaged = without_line(net, contingency.outage)
+        try:
+            if contingency.islanding:
+                contingency.result = solve_network_decomposed(outaged, solver)
+            else:
+                contingency.result = solve_network(outaged, solver, formulation, problem)
+        except (RuntimeError, ValueError) as e:
+            contingency.error = str(e)
+    report.resolve_s = time.perf_counter() - start
+    return report
@@ -0,0 +1,450 @@
+import time
+from dataclasses import dataclass
+
+import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from pyomo.environ import ConcreteModel, Constraint, Objective, Param, Set, SolverFactory, Var, minimize, value
+
+from .network import OPFResult, as_network
+from .solvers import DEFAULT_SOLVER, SolveReport, resolve_solver, run_solver
+
+MAX_CACHED_ZONES = 256
+# Stored energy changes by 0.25 Wh per W of battery power per step
+STEP_H = 0.25
+
+
+@dataclass
+class DecompositionReport(SolveReport):
+    islands: int = 0
+    zones: int = 0
+    levels: int = 0
+    iterations: int = 0  # coordination rounds (zone LP levels solved)
+    residual_w: float = 0.0  # largest power balance mismatch of the merged dispatch
+    tolerance_w: float = 0.0
+
+
+@dataclass
+class Zone:
+    # Part of the network that is solved on its own. The zone exchanges
+    # `F` with its parent zone over the tie line at `root` (for the top
+    # zone of an island: with the upstream grid, or nothing if the island
+    # has no slack bus). Child zones are attached over `ties` (bus in this
+    # zone, index of the child zone, tie line index).
+    buses: list
+    root: object
+    lines: list  # indices of the lines inside the zone
+    parent: int = -1
+    parent_line: int = -1
+    island: int = 0
+    level: int = 0
+    ties: list = None
+
+
+# ==== Partitioning ====
+
+def find_islands(net):
+    # Connected components of the network as a bus -> island label array
+    net = as_network(net)
+    id_map = {bus: idx for idx, bus in enumerate(net.bus_id.tolist())}
+    n = len(id_map)
+    rows = [id_map[bus] for bus in net.line_from.tolist()]
+    cols = [id_map[bus] for bus in net.line_to.tolist()]
+    graph = sp.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def find_bridges(n, edges):
+    # Lines whose outage splits their island (iterative Tarjan lowlink,
+    # parallel lines are never bridges)
+    adjacency = [[] for _ in range(n)]
+    for k, (u, v) in enumerate(edges):
+        adjacency[u].append((v, k))
+        adjacency[v].append((u, k))
+    order = np.full(n, -1)
+    low = np.zeros(n, dtype=int)
+    bridges = set()
+    counter = 0
+    for start in range(n):
+        if order[start] >= 0:
+            continue
+        order[start] = low[start] = counter
+        counter += 1
+        stack = [(start, -1, iter(adjacency[start]))]
+        while stack:
+            node, via, neighbours = stack[-1]
+            for other, k in neighbours:
+                if k == via:
+                    continue
+                if order[other] < 0:
+                    order[other] = low[other] = counter
+                    counter += 1
+                    stack.append((other, k, iter(adjacency[other])))
+                    break
+                low[node] = min(low[node], order[other])
+            else:
+                stack.pop()
+                if stack:
+                    parent = stack[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                    if low[node] > order[parent]:
+                        bridges.add(via)
+    return bridges
+
+
+def partition_zones(net, max_zone_buses=None):
+    # Splits every island into zones of at most max_zone_buses buses where
+    # the network allows it. Zones are only cut at bridge lines, so zones
+    # form a tree per island and the flow on a tie line is exactly the
+    # exchange of the zone below it (radial feeders split anywhere, meshed
+    # parts stay in one zone). max_zone_buses=None keeps one zone per island.
+    net = as_network(net)
+    buses = net.bus_id.tolist()
+    n = len(buses)
+    id_map = {bus: idx for idx, bus in enumerate(buses)}
+    edges = [(id_map[f], id_map[t]) for f, t in zip(net.line_from.tolist(), net.line_to.tolist())]
+    labels = find_islands(net)
+    n_islands = int(labels.max()) + 1 if n else 0
+
+    # Reference bus per island: the slack bus or the first bus
+    roots = {}
+    for idx in range(n):
+        roots.setdefault(int(labels[idx]), idx)
+    if net.slack_bus is not None:
+        roots[int(labels[id_map[net.slack_bus]])] = id_map[net.slack_bus]
+
+    if max_zone_buses is None:
+        block_of = labels
+        bridges = set()
+    else:
+        bridges = find_bridges(n, edges)
+        inner = [k for k in range(len(edges)) if k not in bridges]
+        graph = sp.coo_matrix(
+            (np.ones(len(inner)), ([edges[k][0] for k in inner], [edges[k][1] for k in inner])), shape=(n, n)
+        )
+        _, block_of = connected_components(graph, directed=False)
+
+    # Tree of blocks (2-edge-connected parts) per island, rooted at the
+    # block of the reference bus
+    block_size = np.bincount(block_of, minlength=int(block_of.max()) + 1 if n else 0)
+    tree = {}
+    for k in bridges:
+        u, v = edges[k]
+        tree.setdefault(block_of[u], []).append((block_of[v], v, k))
+        tree.setdefault(block_of[v], []).append((block_of[u], u, k))
+    parent = {}
+    order = []
+    for island in range(n_islands):
+        root_block = block_of[roots[island]]
+        parent[root_block] = (None, roots[island], -1)
+        stack = [root_block]
+        while stack:
+            block = stack.pop()
+            order.append(block)
+            for child, bus, k in tree.get(block, []):
+                if child not in parent:
+                    parent[child] = (block, bus, k)
+                    stack.append(child)
+
+    # Greedy bottom-up merge of child blocks into their parent's zone while
+    # the zone stays within max_zone_buses. A meshed block that is too
+    # large on its own also keeps its small (< half a zone) subtrees
+    # instead of splitting them into tiny zones.
+    load = {block: int(block_size[block]) for block in order}
+    merged = set()
+    children = {}
+    for block in order:
+        if parent[block][0] is not None:
+            children.setdefault(parent[block][0], []).append(block)
+    for block in reversed(order):
+        oversized = max_zone_buses is not None and block_size[block] > max_zone_buses
+        for child in sorted(children.get(block, []), key=lambda c: load[c]):
+            if (max_zone_buses is None or load[block] + load[child] <= max_zone_buses
+                    or (oversized and 2 * load[child] < max_zone_buses)):
+                load[block] += load[child]
+                merged.add(child)
+
+    zone_of_block = {}
+    zones = []
+    for block in order:
+        up, bus, k = parent[block]
+        if up is not None and block in merged:
+            zone_of_block[block] = zone_of_block[up]
+            continue
+        zone_of_block[block] = len(zones)
+        island = int(labels[bus])
+        zone = Zone(buses=[], root=buses[bus], lines=[], island=island, ties=[])
+        if up is not None:
+            zone.parent = zone_of_block[up]
+            zone.parent_line = k
+            zone.level = zones[zone.parent].level + 1
+            tie_bus = edges[k][0] if edges[k][1] == bus else edges[k][1]
+            zones[zone.parent].ties.append((buses[tie_bus], len(zones), k))
+        zones.append(zone)
+
+    zone_of_bus = np.array([zone_of_block[block_of[idx]] for idx in range(n)], dtype=int)
+    for idx in range(n):
+        zones[zone_of_bus[idx]].buses.append(buses[idx])
+    for k, (u, v) in enumerate(edges):
+        if zone_of_bus[u] == zone_of_bus[v]:
+            zones[zone_of_bus[u]].lines.append(k)
+    return zones, zone_of_bus
+
+
+# ==== Zone LP ====
+
+class ZoneEngine:
+    # LP of a single zone. Batteries are modelled by their net power
+    # p = discharge - charge: the MILP of DCOPFEngine only depends on this
+    # difference, and its power and energy limits become bounds on p. Each
+    # child tie line injects c (within the feasible exchange range of the
+    # child zone) and the zone exports F at its root bus. mode="range"
+    # returns the feasible range of F, mode="dispatch" a dispatch for a
+    # given F.
+
+    def __init__(self, key, solver=DEFAULT_SOLVER):
+        self.key = key
+        self.solver_name = resolve_solver(solver)
+        self.solver = SolverFactory(self.solver_name)
+        self.report = SolveReport(self.solver_name, "angle", "lp")
+        buses, root, lines, bss_buses, tie_buses = key
+
+        model = ConcreteModel()
+        model.B = Set(initialize=buses)
+        model.BSS = Set(initialize=bss_buses)
+        model.L = Set(initialize=range(len(lines)))
+        model.T = Set(initialize=range(len(tie_buses)))
+
+        model.injection = Param(model.B, initialize=0, mutable=True)
+        model.p_lo = Param(model.BSS, initialize=0, mutable=True)
+        model.p_hi = Param(model.BSS, initialize=0, mutable=True)
+        model.c_lo = Param(model.T, initialize=0, mutable=True)
+        model.c_hi = Param(model.T, initialize=0, mutable=True)
+        model.F_lo = Param(initialize=0, mutable=True)
+        model.F_hi = Param(initialize=0, mutable=True)
+        model.weight = Param(initialize=0, mutable=True)
+
+        model.p = Var(model.BSS)
+        model.c = Var(model.T)
+        model.F = Var()
+        model.theta = Var(model.B, initialize=0)
+        model.P_line = Var(model.L, bounds=lambda m, k: (-lines[k][3], lines[k][3]))
+        model.theta[root].fix(0)
+
+        model.p_limits = Constraint(model.BSS, rule=lambda m, i: (m.p_lo[i], m.p[i], m.p_hi[i]))
+        model.c_limits = Constraint(model.T, rule=lambda m, t: (m.c_lo[t], m.c[t], m.c_hi[t]))
+        model.F_limits = Constraint(expr=(model.F_lo, model.F, model.F_hi))
+
+        def line_flow(m, k):
+            from_bus, to_bus, susceptance, _ = lines[k]
+            return m.P_line[k] == susceptance * (m.theta[from_bus] - m.theta[to_bus])
+
+        model.line_flow = Constraint(model.L, rule=line_flow)
+
+        inflow = {bus: [] for bus in buses}
+        outflow = {bus: [] for bus in buses}
+        for k, (from_bus, to_bus, _, _) in enumerate(lines):
+            outflow[from_bus].append(k)
+            inflow[to_bus].append(k)
+        ties = {bus: [] for bus in buses}
+        for t, bus in enumerate(tie_buses):
+            ties[bus].append(t)
+
+        def node_balance(m, i):
+            net_flow = sum(m.P_line[k] for k in inflow[i]) - sum(m.P_line[k] for k in outflow[i])
+            injection = m.injection[i] + (m.p[i] if i in m.BSS else 0) + sum(m.c[t] for t in ties[i])
+            export = m.F if i == root else 0
+            return net_flow + injection == export
+
+        model.node_bal = Constraint(model.B, rule=node_balance)
+        model.obj = Objective(expr=model.weight * model.F, sense=minimize)
+        self.model = model
+
+    def update(self, injection, p_lo, p_hi, c_lo, c_hi, F_lo, F_hi):
+        model = self.model
+        buses, _, _, bss_buses, _ = self.key
+        model.injection.store_values(dict(zip(buses, injection)))
+        model.p_lo.store_values(dict(zip(bss_buses, p_lo)))
+        model.p_hi.store_values(dict(zip(bss_buses, p_hi)))
+        model.c_lo.store_values(dict(enumerate(c_lo)))
+        model.c_hi.store_values(dict(enumerate(c_hi)))
+        model.F_lo = F_lo
+        model.F_hi = F_hi
+
+    def _solve(self):
+        run_solver(self.solver, self.model, [], "lp", self.report)
+
+    def feasible_range(self):
+        model = self.model
+        model.F.unfix()
+        model.weight = 1
+        self._solve()
+        low = value(model.F)
+        model.weight = -1
+        self._solve()
+        return low, value(model.F)
+
+    def dispatch(self, export):
+        model = self.model
+        model.weight = 0
+        model.F.fix(export)
+        self._solve()
+        p = np.fromiter((value(model.p[i]) for i in model.BSS), dtype=float, count=len(model.BSS))
+        c = np.fromiter((value(model.c[t]) for t in model.T), dtype=float, count=len(model.T))
+        return p, c
+
+
+_zone_engines = {}
+
+
+def _solve_zone(args):
+    key, values, export, solver = args
+    engine = _zone_engines.get((key, solver))
+    if engine is None:
+        if len(_zone_engines) >= MAX_CACHED_ZONES:
+            _zone_engines.pop(next(iter(_zone_engines)))
+        engine = _zone_engines[(key, solver)] = ZoneEngine(key, solver)
+    engine.update(*values)
+    if export is None:
+        return engine.feasible_range()
+    return engine.dispatch(export)
+
+
+def _run_level(tasks, workers):
+    if workers is None or workers <= 1 or len(tasks) <= 1:
+        return [_solve_zone(task) for task in tasks]
+    from .batch import _get_pool
+
+    return list(_get_pool(workers).map(_solve_zone, tasks, chunksize=max(1, len(tasks) // (4 * workers))))
+
+
+# ==== Decomposed solve ====
+
+def solve_network_decomposed(net, solver=DEFAULT_SOLVER, max_zone_buses=None, workers=None, tolerance_w=1e-3):
+    # Solves the DC-OPF of a large network as independent zone LPs instead
+    # of one monolithic MILP (see partition_zones). Islands are independent
+    # apart from the total battery power fixed by future_balance. Zones of
+    # an island are coordinated over their tie lines in two passes: bottom
+    # up, each zone computes the feasible range of its exchange given the
+    # ranges of its children; top down, each zone dispatches its batteries
+    # for the exchange chosen by its parent. Both passes solve all zones of
+    # a tree level in parallel (workers > 1 uses the phaseone.batch process
+    # pool). The decomposition is exact, so the merged dispatch is optimal
+    # for the full network; the report holds the number of coordination
+    # rounds and the largest balance mismatch, which must stay below
+    # tolerance_w.
+    start = time.perf_counter()
+    net = as_network(net)
+    solver_name = resolve_solver(solver)
+    zones, zone_of_bus = partition_zones(net, max_zone_buses)
+    buses = net.bus_id.tolist()
+    id_map = {bus: idx for idx, bus in enumerate(buses)}
+    injection = net.bus_P_G_w - net.bus_P_D_w
+
+    # Battery net power bounds from the power and energy limits
+    p_lo = np.maximum(-net.bss_P_max_w, (net.bss_E_init_wh - net.bss_E_max_wh) / STEP_H)
+    p_hi = np.minimum(net.bss_P_max_w, net.bss_E_init_wh / STEP_H)
+    bss_index = {bus: k for k, bus in enumerate(net.bss_bus_id.tolist())}
+    bss_zone = [zone_of_bus[id_map[bus]] for bus in net.bss_bus_id.tolist()]
+
+    # Exchange of each island's top zone: with a slack bus, future_balance
+    # and the node balances fix the total battery power, so the slack
+    # island takes (delta_ps + sum(P_G - P_D)) / 2; islands without a slack
+    # bus have to balance themselves
+    delta_ps = net.energy_imbalance_next_W
+    targets = {}
+    if net.slack_bus is not None:
+        targets[zones[zone_of_bus[id_map[net.slack_bus]]].island] = (delta_ps + injection.sum()) / 2
+
+    keys = []
+    for z, zone in enumerate(zones):
+        zone_bss = [bus for bus in zone.buses if bus in bss_index]
+        lines = tuple(
+            (net.line_from[k].item(), net.line_to[k].item(), float(net.line_b[k]), float(net.line_P_max_w[k]))
+            for k in zone.lines
+        )
+        keys.append((tuple(zone.buses), zone.root, lines, tuple(zone_bss), tuple(bus for bus, _, _ in zone.ties)))
+
+    def values(z, c_lo, c_hi, F_lo, F_hi):
+        zone = zones[z]
+        bss = [bss_index[bus] for bus in keys[z][3]]
+        return (
+            injection[[id_map[bus] for bus in zone.buses]].tolist(), p_lo[bss].tolist(), p_hi[bss].tolist(),
+            c_lo, c_hi, F_lo, F_hi,
+        )
+
+    def tie_limit(z):
+        limit = float(net.line_P_max_w[zones[z].parent_line])
+        return -limit, limit
+
+    levels = max((zone.level for zone in zones), default=-1) + 1
+    by_level = [[z for z, zone in enumerate(zones) if zone.level == level] for level in range(levels)]
+    iterations = 0
+
+    # Bottom-up: feasible exchange range of every zone below an island top
+    ranges = {}
+    for level in reversed(range(1, levels)):
+        tasks = []
+        for z in by_level[level]:
+            children = [child for _, child, _ in zones[z].ties]
+            tasks.append((
+                keys[z],
+                values(z, [ranges[c][0] for c in children], [ranges[c][1] for c in children], *tie_limit(z)),
+                None, solver_name,
+            ))
+        for z, result in zip(by_level[level], _run_level(tasks, workers)):
+            ranges[z] = result
+        iterations += 1
+
+    # Top-down: dispatch every zone for the exchange chosen by its parent
+    exports = {}
+    p = np.zeros(len(net.bss_bus_id))
+    for level in range(levels):
+        tasks = []
+        for z in by_level[level]:
+            zone = zones[z]
+            children = [child for _, child, _ in zone.ties]
+            if zone.parent < 0:
+                exports[z] = targets.get(zone.island, 0.0)
+                bounds = (exports[z], exports[z])
+            else:
+                bounds = tie_limit(z)
+            tasks.append((
+                keys[z],
+                values(z, [ranges[c][0] for c in children], [ranges[c][1] for c in children], *bounds),
+                exports[z], solver_name,
+            ))
+        for z, (zone_p, zone_c) in zip(by_level[level], _run_level(tasks, workers)):
+            p[[bss_index[bus] for bus in keys[z][3]]] = zone_p
+            for (_, child, _), exchange in zip(zones[z].ties, zone_c.tolist()):
+                # Keep solver round-off from leaving the child's range
+                exports[child] = min(max(exchange, ranges[child][0]), ranges[child][1])
+        iterations += 1
+
+    # Balance of every island from the merged dispatch
+    island_injection = np.zeros(max((zone.island for zone in zones), default=-1) + 1)
+    np.add.at(island_injection, [zones[z].island for z in zone_of_bus], injection)
+    np.add.at(island_injection, [zones[z].island for z in bss_zone], p)
+    residual = max((abs(total - targets.get(island, 0.0)) for island, total in enumerate(island_injection)), default=0.0)
+    if residual > tolerance_w:
+        raise RuntimeError(f"Solver did not converge: balance mismatch of {residual:.3g} W exceeds {tolerance_w:.3g} W")
+
+    # Objective of the full model: import/export follow from future_balance
+    costs = net.costs
+    exchange = delta_ps - p.sum()
+    cost_next = costs["import_next"] * delta_ps if delta_ps >= 0 else -costs["export_next"] * (-delta_ps)
+    objective = costs["import_now"] * max(exchange, 0.0) - costs["export_now"] * max(-exchange, 0.0) + cost_next
+
+    report = DecompositionReport(
+        solver_name, "zonal", "lp", islands=len(island_injection), zones=len(zones), levels=levels,
+        iterations=iterations, residual_w=float(residual), tolerance_w=tolerance_w,
+    )
+    report.solve_s = time.perf_counter() - start
+    return OPFResult(
+        objective_value_w=float(objective),
+        bss_bus_id=net.bss_bus_id,
+        P_BSS_ch_w=np.maximum(-p, 0.0),
+        P_BSS_dis_w=np.maximum(p, 0.0),
+        report=report,
+    )
@@ -0,0 +1,170 @@
+import time
+
+import numpy as np
+from pyomo.environ import Block, ConcreteModel, Constraint, NonNegativeReals, Objective, Param, Set, SolverFactory, Var, minimize, value
+
+from .model import DCOPFEngine, topology_key
+from .solvers import DEFAULT_SOLVER, STATS, SolveReport, check_problem, resolve_solver, run_solver
+
+SERIES_TYPES = (list, tuple)
+
+
+def _at(series, t):
+    return series[t] if isinstance(series, SERIES_TYPES) else series
+
+
+def period_config(adn_config, t):
+    # Single-period view of a multi-period config. Bus P_G_w/P_D_w, costs and
+    # energy_imbalance_next_W may be given per period (lists) or as scalars.
+    return {
+        "bus": [
+            {"id": bus["id"], "P_G_w": _at(bus["P_G_w"], t), "P_D_w": _at(bus["P_D_w"], t), "slack": bus["slack"]}
+            for bus in adn_config["bus"]
+        ],
+        "bss": adn_config.get("bss", []),
+        "line": adn_config["line"],
+        "costs": {name: _at(cost, t) for name, cost in adn_config["costs"].items()},
+        "energy_imbalance_next_W": _at(adn_config["energy_imbalance_next_W"], t),
+    }
+
+
+def _check_horizon(adn_config, horizon):
+    series = [bus[key] for bus in adn_config["bus"] for key in ("P_G_w", "P_D_w")]
+    series += list(adn_config["costs"].values()) + [adn_config["energy_imbalance_next_W"]]
+    for values in series:
+        if isinstance(values, SERIES_TYPES) and len(values) != horizon:
+            raise ValueError(f"Time series of length {len(values)} does not match the horizon of {horizon} periods")
+
+
+class MultiPeriodOPFEngine:
+    # Horizon-T DC-OPF. Each period is a DCOPFEngine block; their single-step
+    # energy limits are replaced by a stored-energy variable E[i, t] that
+    # links the battery state across periods. advance() moves the window
+    # forward, carries the battery state over and warm-starts the next solve
+    # from the shifted previous solution on the same model.
+
+    def __init__(self, adn_config, horizon, dt_h=0.25, solver=DEFAULT_SOLVER, formulation="angle", problem="auto"):
+        if horizon < 1:
+            raise ValueError("Horizon must be at least one period")
+        _check_horizon(adn_config, horizon)
+        check_problem(problem)
+
+        start = time.perf_counter()
+        self.key = topology_key(period_config(adn_config, 0))
+        self.horizon = horizon
+        self.dt_h = dt_h
+        self.problem = problem
+        self.solver_name = resolve_solver(solver)
+        self.solver = SolverFactory(self.solver_name)
+        self.report = SolveReport(self.solver_name, formulation, problem)
+        self.warm_start = None
+        self.solved = False
+
+        model = ConcreteModel()
+        model.T = Set(initialize=range(horizon))
+        model.period = Block(model.T)
+        self.engines = [
+            DCOPFEngine(period_config(adn_config, t), solver=None, formulation=formulation, problem=problem, block=model.period[t])
+            for t in range(horizon)
+        ]
+        for engine in self.engines:
+            engine.model.obj.deactivate()
+            engine.model.energy_limits.deactivate()
+
+        # ==== Intertemporal battery coupling ====
+        model.BSS = Set(initialize=list(self.engines[0].model.BSS))
+        model.E_BSS_init = Param(model.BSS, initialize=0, mutable=True)
+        model.E_BSS_max = Param(model.BSS, initialize=0, mutable=True)
+        model.E = Var(model.BSS, model.T, within=NonNegativeReals)
+
+        def state_of_charge(m, i, t):
+            previous = m.E_BSS_init[i] if t == 0 else m.E[i, t - 1]
+            return m.E[i, t] == previous + dt_h * (m.period[t].PCh[i] - m.period[t].PDis[i])
+
+        def energy_max(m, i, t):
+            return m.E[i, t] <= m.E_BSS_max[i]
+
+        model.soc = Constraint(model.BSS, model.T, rule=state_of_charge)
+        model.energy_max = Constraint(model.BSS, model.T, rule=energy_max)
+
+        model.obj = Objective(expr=sum(engine.model.obj.expr for engine in self.engines), sense=minimize)
+        self.model = model
+        self._update_storage(adn_config)
+        self.report.build_s = time.perf_counter() - start
+        STATS.add("build", self.report.build_s)
+
+    def _update_storage(self, adn_config):
+        for bss in adn_config.get("bss", []):
+            self.model.E_BSS_init[bss["bus_id"]] = bss["E_BSS_init_wh"]
+            self.model.E_BSS_max[bss["bus_id"]] = bss["E_BSS_max_wh"]
+
+    def update(self, adn_config):
+        start = time.perf_counter()
+        _check_horizon(adn_config, self.horizon)
+        for t, engine in enumerate(self.engines):
+            engine.update(period_config(adn_config, t))
+        self._update_storage(adn_config)
+        self.report.update_s = time.perf_counter() - start
+        STATS.add("update", self.report.update_s)
+
+    def solve(self):
+        for engine in self.engines:
+            engine.check_fixed_flows()
+
+        if self.warm_start is None:
+            self.warm_start = bool(self.solver.warm_start_capable())
+        solve_kwargs = {"warmstart": True} if self.solved and self.warm_start else {}
+        binaries = [engine.model.M for engine in self.engines]
+        run_solver(self.solver, self.model, binaries, self.problem, self.report, **solve_kwargs)
+        self.solved = True
+        return self.extract()
+
+    def extract(self):
+        start = time.perf_counter()
+        model = self.model
+        bss = []
+        for i in model.BSS:
+            ch = np.array([value(model.period[t].PCh[i]) for t in model.T])
+            dis = np.array([value(model.period[t].PDis[i]) for t in model.T])
+            # Netted like DCOPFEngine.extract, a relaxed solution may charge
+            # and discharge in the same period
+            ch, dis = np.maximum(ch - dis, 0.0), np.maximum(dis - ch, 0.0)
+            bss.append({
+                "bus_id": i,
+                "P_BSS_ch_w": ch.tolist(),
+                "P_BSS_dis_w": dis.tolist(),
+                "E_BSS_wh": [value(model.E[i, t]) for t in model.T],
+            })
+        result = {"objective_value_w": value(model.obj), "bss": bss}
+        self.report.extract_s = time.perf_counter() - start
+        STATS.add("extract", self.report.extract_s)
+        return result
+
+    def advance(self, adn_config, steps=1, carry_soc=True):
+        # Move the window forward by `steps` periods. With carry_soc the
+        # battery state is taken from the previous solution at the end of the
+        # executed periods instead of from adn_config.
+        if not 1 <= steps <= self.horizon:
+            raise ValueError(f"Can only advance by 1 to {self.horizon} periods")
+
+        model = self.model
+        if carry_soc and self.solved:
+            soc = {i: value(model.E[i, steps - 1]) for i in model.BSS}
+        self.update(adn_config)
+        if carry_soc and self.solved:
+            model.E_BSS_init.store_values(soc)
+
+        if self.solved:
+            self._shift_solution(steps)
+        return self.solve()
+
+    def _shift_solution(self, steps):
+        model = self.model
+        for t in range(self.horizon - steps):
+            current = model.period[t].component_data_objects(Var, sort=True)
+            shifted = model.period[t + steps].component_data_objects(Var, sort=True)
+            for var, source in zip(current, shifted):
+                if not var.fixed:
+                    var.set_value(source.value, skip_validation=True)
+            for i in model.BSS:
+                model.E[i, t].set_value(model.E[i, t + steps].value, skip_validation=True)
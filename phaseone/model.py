@@ -1,118 +1,287 @@
+import time
+from dataclasses import replace
+
+import numpy as np
 from pyomo.environ import *
+from .network import OPFResult, as_network
+from .solvers import DEFAULT_SOLVER, STATS, SolveReport, check_problem, resolve_solver, run_solver
 from .utils import build_ptdf_matrix
 
+MAX_CACHED_ENGINES = 64
+FORMULATIONS = ("angle", "ptdf")
+
+
+def topology_key(adn_config):
+    return as_network(adn_config).topology_key()
+
+
+class DCOPFEngine:
+    # Builds the DC-OPF model once per network topology. Loads, generation,
+    # battery state, costs and imbalance are mutable Params, so consecutive
+    # solves only push new values instead of rebuilding the model. Solvers
+    # from the appsi family (e.g. "appsi_highs") stay loaded between solves
+    # and pick up the Param changes incrementally.
+    #
+    # formulation="angle" carries bus angles and line flows as variables;
+    # formulation="ptdf" writes line flows as PTDF-weighted nodal injections
+    # so the model only holds battery and import/export variables. PTDFs
+    # need every bus connected to a slack bus: for networks without a slack
+    # bus or with islands the ptdf engine raises ValueError when it is
+    # built, while the angle engine builds them (islands that cannot balance
+    # themselves are then reported as infeasible by solve()).
+    #
+    # Passing a Block builds the model into it instead of a new ConcreteModel,
+    # so several engines can be stacked into one model (see phaseone.batch).
+    #
+    # adn_config may be a config dict or an already validated ADNArrays.
+    # solver is a backend name understood by phaseone.solvers.resolve_solver
+    # and problem selects the MILP, its LP relaxation or "auto" (see PROBLEMS).
+    # The timings of the last build/update/solve are kept in self.report.
+
+    def __init__(self, adn_config, solver=DEFAULT_SOLVER, formulation="angle", problem="auto", block=None):
+        if formulation not in FORMULATIONS:
+            raise ValueError(f"Unknown formulation {formulation!r}, expected one of {FORMULATIONS}")
+        check_problem(problem)
+
+        start = time.perf_counter()
+        adn_config = as_network(adn_config)
+        self.key = adn_config.topology_key()
+        self.formulation = formulation
+        self.problem = problem
+        self.solver_name = resolve_solver(solver) if solver is not None else None
+        self.solver = SolverFactory(self.solver_name) if solver is not None else None
+        self.report = SolveReport(self.solver_name, formulation, problem)
+        self.model = self._build(ConcreteModel() if block is None else block)
+        self.update(adn_config)
+        self.report.build_s = time.perf_counter() - start
+        if self.solver is not None:
+            STATS.add("build", self.report.build_s - self.report.update_s)
+
+    def _build(self, model):
+        buses, slack_bus, lines, bss_buses = self.key
+        self.bss_ids = np.array(bss_buses)
+
+        # ==== Sets ====
+        model.B = Set(initialize=buses)
+        model.BSS = Set(initialize=bss_buses)
+        model.L = Set(initialize=range(len(lines)))
+
+        # === Parameters ===
+        model.P_G = Param(model.B, initialize=0, mutable=True)
+        model.P_D = Param(model.B, initialize=0, mutable=True)
+
+        model.P_BSS_max = Param(model.BSS, initialize=0, mutable=True)
+        model.E_BSS_max = Param(model.BSS, initialize=0, mutable=True)
+        model.E_BSS_init = Param(model.BSS, initialize=0, mutable=True)
+
+        model.import_now = Param(initialize=0, mutable=True)
+        model.export_now = Param(initialize=0, mutable=True)
+        model.cost_next = Param(initialize=0, mutable=True)
+        model.delta_ps = Param(initialize=0, mutable=True)
+
+        # ==== Decision Variables ====
+        model.P_Im = Var(within=NonNegativeReals)
+        model.P_Ex = Var(within=NonNegativeReals)
 
-def solve_dc_opf(adn_config):
-    model = ConcreteModel()
-
-    # ==== Sets ====
-    buses = [bus["id"] for bus in adn_config["bus"]]
-    model.B = Set(initialize=buses)
-
-    slack_bus = next(bus["id"] for bus in adn_config["bus"] if bus["slack"])
-    gen = {bus["id"]: bus["P_G_w"] or 0 for bus in adn_config["bus"]}
-    load = {bus["id"]: bus["P_D_w"] or 0 for bus in adn_config["bus"]}
-
-    bss_list = adn_config.get("bss", [])
-    bss_buses = [bss["bus_id"] for bss in bss_list]
-    model.BSS = Set(initialize=bss_buses)
-
-    bss_params = {bss["bus_id"]: bss for bss in bss_list}
-    lines = adn_config["line"]
-    costs = adn_config["costs"]
-    delta_ps = adn_config["energy_imbalance_next_W"]
-
-    # === Parameters ===
-    model.P_G = Param(model.B, initialize=gen)
-    model.P_D = Param(model.B, initialize=load)
-
-    # ==== Decision Variables ====
-    model.P_Im = Var(within=NonNegativeReals)
-    model.P_Ex = Var(within=NonNegativeReals)
-
-    model.PCh = Var(model.BSS, within=NonNegativeReals)
-    model.PDis = Var(model.BSS, within=NonNegativeReals)
-    model.M = Var(model.BSS, within=Binary)
-
-    model.theta = Var(model.B, initialize=0)
-    model.P_line = Var(range(len(lines)), within=Reals)
-
-    # ==== Battery constraints ====
-    def battery_constraints(m, i):
-        bss = bss_params[i]
-        Pmax = bss["P_BSS_max_w"]
-        Emax = bss["E_BSS_max_wh"]
-        Einit = bss["E_BSS_init_wh"]
-
-        return [
-            m.PCh[i] <= Pmax * m.M[i],
-            m.PDis[i] <= Pmax * (1 - m.M[i]),
-            Einit + 0.25 * m.PCh[i] - 0.25 * m.PDis[i] <= Emax,
-            Einit + 0.25 * m.PCh[i] - 0.25 * m.PDis[i] >= 0
-        ]
-
-    model.battery_cons = ConstraintList()
-    for i in model.BSS:
-        for con in battery_constraints(model, i):
-            model.battery_cons.add(con)
-
-    # ==== Power flow constraints (DC + PTDF) ====
-    PTDF, line_map = build_ptdf_matrix(buses, lines, slack_bus)
-
-    for idx, (from_bus, to_bus) in line_map.items():
-        susceptance = next(l["b_siemens"] for l in lines if l["from_bus_id"] == from_bus and l["to_bus_id"] == to_bus)
-        model.P_line[idx] = susceptance * (model.theta[from_bus] - model.theta[to_bus])
-
-    for i, line in enumerate(lines):
-        Pmax = line["P_line_max_w"]
-        model.add_component(f"line_flow_limit_{i}", Constraint(expr=abs(model.P_line[i]) <= Pmax))
-
-    # ==== Nodal power balance ====
-    def node_balance(m, i):
-        gen_i = m.P_G[i]
-        load_i = m.P_D[i]
-        ch = m.PCh[i] if i in model.BSS else 0
-        dis = m.PDis[i] if i in model.BSS else 0
-
-        if i == slack_bus:
-            return (
-                m.P_Im - m.P_Ex + sum(model.P_line[j] for j, (f, t) in line_map.items() if t == i)
-                - sum(model.P_line[j] for j, (f, t) in line_map.items() if f == i)
-                == gen_i - load_i + dis - ch
-            )
+        model.PCh = Var(model.BSS, within=NonNegativeReals)
+        model.PDis = Var(model.BSS, within=NonNegativeReals)
+        model.M = Var(model.BSS, within=Binary)
+
+        # ==== Battery constraints ====
+        def charge_limit(m, i):
+            return m.PCh[i] <= m.P_BSS_max[i] * m.M[i]
+
+        def discharge_limit(m, i):
+            return m.PDis[i] <= m.P_BSS_max[i] * (1 - m.M[i])
+
+        def energy_limits(m, i):
+            return (0, m.E_BSS_init[i] + 0.25 * m.PCh[i] - 0.25 * m.PDis[i], m.E_BSS_max[i])
+
+        model.charge_limit = Constraint(model.BSS, rule=charge_limit)
+        model.discharge_limit = Constraint(model.BSS, rule=discharge_limit)
+        model.energy_limits = Constraint(model.BSS, rule=energy_limits)
+
+        if self.formulation == "ptdf":
+            self._build_ptdf_network(model)
         else:
-            return (
-                sum(model.P_line[j] for j, (f, t) in line_map.items() if t == i)
-                - sum(model.P_line[j] for j, (f, t) in line_map.items() if f == i)
-                == gen_i - load_i + dis - ch
-            )
-
-    model.node_bal = Constraint(model.B, rule=node_balance)
-
-    # ==== Future power imbalance ====
-    model.future_balance = Constraint(
-        expr=delta_ps == model.P_Im - model.P_Ex - sum(model.PCh[i] - model.PDis[i] for i in model.BSS)
-    )
-
-    # ==== Objective ====
-    cost_now = costs["import_now"] * model.P_Im - costs["export_now"] * model.P_Ex
-    cost_next = costs["import_next"] * delta_ps if delta_ps >= 0 else -costs["export_next"] * (-delta_ps)
-    model.obj = Objective(expr=cost_now + cost_next, sense=minimize)
-
-    # ==== Solve ====
-    solver = SolverFactory("glpk")
-    results = solver.solve(model, tee=False)
-
-    if (results.solver.status != SolverStatus.ok) or (results.solver.termination_condition != TerminationCondition.optimal):
-        raise RuntimeError("Solver did not converge")
-
-    return {
-        "objective_value_w": value(model.obj),
-        "bss": [
-            {
-                "bus_id": i,
-                "P_BSS_ch_w": value(model.PCh[i]),
-                "P_BSS_dis_w": value(model.PDis[i]),
-            } for i in model.BSS
-        ]
-    }
+            self._build_angle_network(model)
+
+        # ==== Future power imbalance ====
+        model.future_balance = Constraint(
+            expr=model.delta_ps == model.P_Im - model.P_Ex - sum(model.PCh[i] - model.PDis[i] for i in model.BSS)
+        )
+
+        # ==== Objective ====
+        model.obj = Objective(
+            expr=model.import_now * model.P_Im - model.export_now * model.P_Ex + model.cost_next,
+            sense=minimize,
+        )
+        return model
+
+    def _build_angle_network(self, model):
+        buses, slack_bus, lines, _ = self.key
+
+        model.theta = Var(model.B, initialize=0)
+        model.P_line = Var(model.L, within=Reals, bounds=lambda m, k: (-lines[k][3], lines[k][3]))
+        if slack_bus is not None:
+            model.theta[slack_bus].fix(0)
+
+        # ==== Power flow constraints (DC) ====
+        def line_flow(m, k):
+            from_bus, to_bus, susceptance, _ = lines[k]
+            return m.P_line[k] == susceptance * (m.theta[from_bus] - m.theta[to_bus])
+
+        model.line_flow = Constraint(model.L, rule=line_flow)
+
+        # ==== Nodal power balance ====
+        inflow = {bus: [] for bus in buses}
+        outflow = {bus: [] for bus in buses}
+        for k, (from_bus, to_bus, _, _) in enumerate(lines):
+            outflow[from_bus].append(k)
+            inflow[to_bus].append(k)
+
+        def node_balance(m, i):
+            ch = m.PCh[i] if i in m.BSS else 0
+            dis = m.PDis[i] if i in m.BSS else 0
+            net_flow = sum(m.P_line[k] for k in inflow[i]) - sum(m.P_line[k] for k in outflow[i])
+            if i == slack_bus:
+                net_flow = m.P_Im - m.P_Ex + net_flow
+            return net_flow == m.P_G[i] - m.P_D[i] + dis - ch
+
+        model.node_bal = Constraint(model.B, rule=node_balance)
+
+    def _build_ptdf_network(self, model):
+        buses, slack_bus, lines, _ = self.key
+        self.ptdf = None
+        self.fixed_lines = np.zeros(0, dtype=int)
+        model.base_flow = Param(model.L, initialize=0, mutable=True)
+        model.net_injection = Param(initialize=0, mutable=True)
+        if not buses:
+            return
+
+        # The system balance below only holds for a network connected to the
+        # slack bus, build_ptdf_matrix raises ValueError without a slack bus
+        # or for islanded buses (see the class comment)
+        line_dicts = [{"from_bus_id": f, "to_bus_id": t, "b_siemens": b} for f, t, b, _ in lines]
+        self.ptdf, _ = build_ptdf_matrix(list(buses), line_dicts, slack_bus)
+        self.line_limits = np.array([line[3] for line in lines], dtype=float)
+
+        # ==== Power flow constraints (PTDF) ====
+        id_map = {bus: idx for idx, bus in enumerate(buses)}
+        bss_cols = {i: id_map[i] for i in model.BSS if i in id_map}
+        sensitivity = {
+            k: [(i, -self.ptdf[k, j]) for i, j in bss_cols.items() if abs(self.ptdf[k, j]) > 1e-12]
+            for k in range(len(lines))
+        }
+        controllable = [k for k, terms in sensitivity.items() if terms]
+        # Flows on lines no battery can influence are fixed by the loads and
+        # are checked against their limits before each solve instead
+        self.fixed_lines = np.array([k for k, terms in sensitivity.items() if not terms], dtype=int)
+
+        def line_flow(m, k):
+            flow = m.base_flow[k] + sum(factor * (m.PDis[i] - m.PCh[i]) for i, factor in sensitivity[k])
+            return (-lines[k][3], flow, lines[k][3])
+
+        model.line_flow = Constraint(controllable, rule=line_flow)
+
+        # ==== System power balance ====
+        model.system_balance = Constraint(
+            expr=model.P_Im - model.P_Ex == model.net_injection + sum(model.PDis[i] - model.PCh[i] for i in bss_cols)
+        )
+
+    def update(self, adn_config):
+        start = time.perf_counter()
+        net = as_network(adn_config)
+        if net.topology_key() != self.key:
+            raise ValueError("Network topology differs from the one this engine was built for")
+
+        model = self.model
+        buses, _, _, bss_buses = self.key
+        model.P_G.store_values(dict(zip(buses, net.bus_P_G_w.tolist())))
+        model.P_D.store_values(dict(zip(buses, net.bus_P_D_w.tolist())))
+
+        if self.formulation == "ptdf" and self.ptdf is not None:
+            injection = net.bus_P_G_w - net.bus_P_D_w
+            self.base_flow = -(self.ptdf @ injection)
+            model.base_flow.store_values(dict(enumerate(self.base_flow.tolist())))
+            model.net_injection = float(injection.sum())
+
+        model.P_BSS_max.store_values(dict(zip(bss_buses, net.bss_P_max_w.tolist())))
+        model.E_BSS_max.store_values(dict(zip(bss_buses, net.bss_E_max_wh.tolist())))
+        model.E_BSS_init.store_values(dict(zip(bss_buses, net.bss_E_init_wh.tolist())))
+
+        costs = net.costs
+        delta_ps = net.energy_imbalance_next_W
+        model.import_now = costs["import_now"]
+        model.export_now = costs["export_now"]
+        model.delta_ps = delta_ps
+        model.cost_next = costs["import_next"] * delta_ps if delta_ps >= 0 else -costs["export_next"] * (-delta_ps)
+        self.report.update_s = time.perf_counter() - start
+        if self.solver is not None:
+            STATS.add("update", self.report.update_s)
+
+    def check_fixed_flows(self):
+        if self.formulation == "ptdf" and self.fixed_lines.size:
+            fixed = self.fixed_lines
+            if np.any(np.abs(self.base_flow[fixed]) > self.line_limits[fixed] + 1e-9):
+                raise RuntimeError("Solver did not converge: uncontrollable line flows exceed their limits")
+
+    def solve(self):
+        self.check_fixed_flows()
+        run_solver(self.solver, self.model, [self.model.M], self.problem, self.report)
+        return self.extract()
+
+    def extract(self):
+        start = time.perf_counter()
+        model = self.model
+        ch = np.fromiter((value(model.PCh[i]) for i in model.BSS), dtype=float, count=len(model.BSS))
+        dis = np.fromiter((value(model.PDis[i]) for i in model.BSS), dtype=float, count=len(model.BSS))
+        # Charge and discharge only enter the model through their difference,
+        # so a relaxed solution that does both is netted without changing
+        # the objective or feasibility. This makes the LP relaxation exact
+        # (see solvers.PROBLEMS).
+        ch, dis = np.maximum(ch - dis, 0.0), np.maximum(dis - ch, 0.0)
+        self.report.extract_s = time.perf_counter() - start
+        if self.solver is not None:
+            STATS.add("extract", self.report.extract_s)
+        return OPFResult(
+            objective_value_w=value(model.obj),
+            bss_bus_id=self.bss_ids,
+            P_BSS_ch_w=ch,
+            P_BSS_dis_w=dis,
+            report=replace(self.report),
+        )
+
+
+_engines = {}
+
+
+def get_engine(adn_config, solver=DEFAULT_SOLVER, formulation="angle", problem="auto"):
+    net = as_network(adn_config)
+    key = (net.topology_key(), solver, formulation, problem)
+    engine = _engines.get(key)
+    if engine is not None:
+        engine.update(net)
+        return engine
+
+    if len(_engines) >= MAX_CACHED_ENGINES:
+        _engines.pop(next(iter(_engines)))
+    engine = _engines[key] = DCOPFEngine(net, solver, formulation, problem)
+    return engine
+
+
+def solve_network(net, solver=DEFAULT_SOLVER, formulation="angle", problem="auto", cache=None):
+    if cache is None:
+        return get_engine(net, solver, formulation, problem).solve()
+
+    net = as_network(net)
+    key = cache.key(net, solver, formulation, problem)
+    result = cache.get(key)
+    if result is None:
+        result = get_engine(net, solver, formulation, problem).solve()
+        cache.put(key, result)
+    return result
+
+
+def solve_dc_opf(adn_config, solver=DEFAULT_SOLVER, formulation="angle", problem="auto", cache=None):
+    return solve_network(adn_config, solver, formulation, problem, cache).to_dict()
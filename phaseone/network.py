@@ -0,0 +1,122 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+COST_KEYS = ("import_now", "export_now", "import_next", "export_next")
+
+
+@dataclass
+class ADNArrays:
+    # Column-oriented network description. Inputs are validated once when the
+    # object is built, so engines can use the arrays without further checks.
+    bus_id: np.ndarray
+    bus_P_G_w: np.ndarray
+    bus_P_D_w: np.ndarray
+    slack_bus: object
+    line_from: np.ndarray
+    line_to: np.ndarray
+    line_b: np.ndarray
+    line_P_max_w: np.ndarray
+    bss_bus_id: np.ndarray
+    bss_P_max_w: np.ndarray
+    bss_E_max_wh: np.ndarray
+    bss_E_init_wh: np.ndarray
+    costs: dict = field(default_factory=dict)
+    energy_imbalance_next_W: float = 0.0
+
+    def __post_init__(self):
+        self.bus_id = np.asarray(self.bus_id)
+        self.line_from = np.asarray(self.line_from)
+        self.line_to = np.asarray(self.line_to)
+        self.bss_bus_id = np.asarray(self.bss_bus_id)
+        for name in ("bus_P_G_w", "bus_P_D_w", "line_b", "line_P_max_w", "bss_P_max_w", "bss_E_max_wh", "bss_E_init_wh"):
+            setattr(self, name, np.asarray(getattr(self, name), dtype=float))
+        self.costs = {key: float(self.costs[key]) for key in COST_KEYS}
+        self.energy_imbalance_next_W = float(self.energy_imbalance_next_W)
+        self.validate()
+
+    @classmethod
+    def from_config(cls, adn_config):
+        buses = adn_config["bus"]
+        lines = adn_config["line"]
+        bss_list = adn_config.get("bss", [])
+        slack = [bus["id"] for bus in buses if bus["slack"]]
+        if len(slack) > 1:
+            raise ValueError(f"Expected at most one slack bus, got {slack}")
+        missing = [key for key in COST_KEYS if key not in adn_config["costs"]]
+        if missing:
+            raise ValueError(f"Missing cost entries: {missing}")
+
+        return cls(
+            bus_id=[bus["id"] for bus in buses],
+            bus_P_G_w=[bus["P_G_w"] or 0 for bus in buses],
+            bus_P_D_w=[bus["P_D_w"] or 0 for bus in buses],
+            slack_bus=slack[0] if slack else None,
+            line_from=[line["from_bus_id"] for line in lines],
+            line_to=[line["to_bus_id"] for line in lines],
+            line_b=[line["b_siemens"] for line in lines],
+            line_P_max_w=[line["P_line_max_w"] for line in lines],
+            bss_bus_id=[bss["bus_id"] for bss in bss_list],
+            bss_P_max_w=[bss["P_BSS_max_w"] for bss in bss_list],
+            bss_E_max_wh=[bss["E_BSS_max_wh"] for bss in bss_list],
+            bss_E_init_wh=[bss["E_BSS_init_wh"] for bss in bss_list],
+            costs=adn_config["costs"],
+            energy_imbalance_next_W=adn_config["energy_imbalance_next_W"],
+        )
+
+    def validate(self):
+        n_bus = len(self.bus_id)
+        if not (len(self.bus_P_G_w) == len(self.bus_P_D_w) == n_bus):
+            raise ValueError("Bus columns must have the same length")
+        if not (len(self.line_to) == len(self.line_b) == len(self.line_P_max_w) == len(self.line_from)):
+            raise ValueError("Line columns must have the same length")
+        if not (len(self.bss_P_max_w) == len(self.bss_E_max_wh) == len(self.bss_E_init_wh) == len(self.bss_bus_id)):
+            raise ValueError("BSS columns must have the same length")
+
+        if len(np.unique(self.bus_id)) != n_bus:
+            raise ValueError("Bus ids must be unique")
+        if len(np.unique(self.bss_bus_id)) != len(self.bss_bus_id):
+            raise ValueError("Only one BSS per bus is supported")
+        if self.slack_bus is not None and self.slack_bus not in self.bus_id:
+            raise ValueError(f"Slack bus {self.slack_bus} is not a bus of the network")
+        if len(self.line_from):
+            unknown = np.setdiff1d(np.concatenate([self.line_from, self.line_to]), self.bus_id)
+            if unknown.size:
+                raise ValueError(f"Lines reference unknown buses {unknown.tolist()}")
+
+        if np.any(self.line_P_max_w < 0):
+            raise ValueError("Line limits must be non-negative")
+        if np.any(self.bss_P_max_w < 0):
+            raise ValueError("BSS power limits must be non-negative")
+        if np.any(self.bss_E_init_wh < 0) or np.any(self.bss_E_init_wh > self.bss_E_max_wh):
+            raise ValueError("BSS initial energy must lie between 0 and E_BSS_max_wh")
+
+    def topology_key(self):
+        lines = zip(self.line_from.tolist(), self.line_to.tolist(), self.line_b.tolist(), self.line_P_max_w.tolist())
+        return tuple(self.bus_id.tolist()), self.slack_bus, tuple(lines), tuple(self.bss_bus_id.tolist())
+
+
+def as_network(adn_config):
+    return adn_config if isinstance(adn_config, ADNArrays) else ADNArrays.from_config(adn_config)
+
+
+@dataclass
+class OPFResult:
+    objective_value_w: float
+    bss_bus_id: np.ndarray
+    P_BSS_ch_w: np.ndarray
+    P_BSS_dis_w: np.ndarray
+    report: object = None
+
+    @property
+    def P_BSS_total_w(self):
+        return self.P_BSS_dis_w - self.P_BSS_ch_w
+
+    def to_dict(self):
+        return {
+            "objective_value_w": self.objective_value_w,
+            "bss": [
+                {"bus_id": i, "P_BSS_ch_w": ch, "P_BSS_dis_w": dis}
+                for i, ch, dis in zip(self.bss_bus_id.tolist(), self.P_BSS_ch_w.tolist(), self.P_BSS_dis_w.tolist())
+            ]
+        }
@@ -0,0 +1,109 @@
+import time
+from dataclasses import dataclass, fields
+
+from pyomo.environ import Binary, SolverFactory, SolverStatus, TerminationCondition, UnitInterval
+
+DEFAULT_SOLVER = "auto"
+SOLVER_ALIASES = {
+    "highs": "appsi_highs",
+    "gurobi": "appsi_gurobi",
+    "cplex": "appsi_cplex",
+}
+# "auto" prefers in-process backends over ones that spawn a solver process
+AUTO_ORDER = ("appsi_highs", "glpk", "cbc")
+
+# "milp" keeps the charge/discharge binaries, "lp" and "auto" relax them.
+# Charge and discharge only enter the models through their difference, so
+# netting them in extract() turns an LP solution that does both into a MILP
+# solution with the same objective. The relaxation is therefore exact and
+# "auto" never needs to re-solve the MILP.
+PROBLEMS = ("milp", "lp", "auto")
+
+_available = {}
+
+
+@dataclass
+class SolveReport:
+    backend: str
+    formulation: str
+    problem: str
+    build_s: float = 0.0
+    update_s: float = 0.0
+    solve_s: float = 0.0
+    extract_s: float = 0.0
+
+
+@dataclass
+class SolveStats:
+    # Running totals over all engines of this process that own a solver,
+    # for profiling. Take a copy before and use since() to get the share of
+    # a single call. Solves in pool worker processes are not included.
+    builds: int = 0
+    solves: int = 0
+    build_s: float = 0.0
+    update_s: float = 0.0
+    solve_s: float = 0.0
+    extract_s: float = 0.0
+
+    def add(self, phase, seconds):
+        setattr(self, f"{phase}_s", getattr(self, f"{phase}_s") + seconds)
+        if phase == "build":
+            self.builds += 1
+
+    def since(self, earlier):
+        return SolveStats(**{f.name: getattr(self, f.name) - getattr(earlier, f.name) for f in fields(self)})
+
+
+STATS = SolveStats()
+
+
+def solver_available(name):
+    if name not in _available:
+        _available[name] = bool(SolverFactory(name).available(exception_flag=False))
+    return _available[name]
+
+
+def resolve_solver(name):
+    if name == "auto":
+        for candidate in AUTO_ORDER:
+            if solver_available(candidate):
+                return candidate
+        raise RuntimeError(f"None of the solvers {AUTO_ORDER} is available")
+    return SOLVER_ALIASES.get(name, name)
+
+
+def check_results(results):
+    if (results.solver.status != SolverStatus.ok) or (results.solver.termination_condition != TerminationCondition.optimal):
+        raise RuntimeError(f"Solver did not converge ({results.solver.termination_condition})")
+
+
+def check_problem(problem):
+    if problem not in PROBLEMS:
+        raise ValueError(f"Unknown problem type {problem!r}, expected one of {PROBLEMS}")
+
+
+def relax_binaries(components, relaxed):
+    for component in components:
+        for var in component.values():
+            if var.is_binary() == relaxed:
+                var.domain = UnitInterval if relaxed else Binary
+
+
+def solve_checked(solver, model, **solve_kwargs):
+    # The solution is only loaded after checking the termination condition:
+    # backends like appsi_highs raise their own error when asked to load the
+    # solution of an infeasible model
+    results = solver.solve(model, tee=False, load_solutions=False, **solve_kwargs)
+    check_results(results)
+    model.solutions.load_from(results)
+    return results
+
+
+def run_solver(solver, model, binaries, problem, report, **solve_kwargs):
+    start = time.perf_counter()
+    relax_binaries(binaries, problem != "milp")
+    solve_checked(solver, model, **solve_kwargs)
+    report.problem = "milp" if problem == "milp" else "lp"
+    report.solve_s = time.perf_counter() - start
+    STATS.add("solve", report.solve_s)
+    STATS.solves += 1
@@ -0,0 +1,49 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from phaseone.testing import perturb_loads, synthetic_network
+from phaseone import STATS, SolutionCache, solve_network, solve_network_batch
+
+
+def fleet(seed):
+    return [perturb_loads(synthetic_network(20, n_bss=2, topology="meshed", seed=s), seed=seed) for s in range(8)]
+
+
+def assert_matches_single_solves(nets, results):
+    for net, result in zip(nets, results):
+        expected = solve_network(net)
+        assert result.objective_value_w == pytest.approx(expected.objective_value_w, rel=1e-9, abs=1e-3)
+        np.testing.assert_allclose(result.P_BSS_total_w, expected.P_BSS_total_w, rtol=1e-9, atol=1e-3)
+
+
+@pytest.mark.parametrize("cache_size", [0, 64])
+def test_subsets_reuse_the_fleet_model(cache_size):
+    cache = SolutionCache(cache_size) if cache_size else None
+    rng = np.random.default_rng(0)
+    nets = fleet(0)
+    solve_network_batch(nets, cache=cache)
+    builds = STATS.builds
+    solved = []
+    for seed in range(1, 6):
+        indices = sorted(rng.choice(len(nets), 3, replace=False).tolist(), reverse=seed % 2 == 0)
+        changed = fleet(seed)
+        for i in indices:
+            nets[i] = changed[i]
+        solved.append(([nets[i] for i in indices], solve_network_batch(nets, cache=cache, indices=indices)))
+    assert STATS.builds == builds
+    for subset, results in solved:
+        assert len(results) == len(subset)
+        assert_matches_single_solves(subset, results)
+
+    # The full fleet is solved again after the subsets
+    assert_matches_single_solves(nets, solve_network_batch(nets, cache=cache))
+
+
+def test_cached_subsets_with_duplicate_configs():
+    nets = fleet(0)
+    nets[5] = replace(nets[1])
+    results = solve_network_batch(nets, cache=SolutionCache(64), indices=[5, 1, 2])
+    assert_matches_single_solves([nets[5], nets[1], nets[2]], results)
+    assert solve_network_batch(nets, indices=[]) == []
@@ -0,0 +1,87 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from phaseone import SolutionCache, solve_network
+from phaseone.testing import perturb_loads, synthetic_network
+
+# Loads in whole watts lie in the middle of their quantum
+_net = synthetic_network(20, n_bss=3, topology="meshed", seed=0)
+NET = replace(_net, bus_P_D_w=np.round(_net.bus_P_D_w))
+
+
+def shifted(net, delta):
+    # Same network with every load moved by delta W
+    return replace(net, bus_P_D_w=net.bus_P_D_w + delta)
+
+
+def test_states_within_the_quantum_share_a_key():
+    cache = SolutionCache(quantum=1e-3)
+    key = cache.key(NET, "auto")
+    assert cache.key(shifted(NET, 2e-4), "auto") == key
+    assert cache.key(shifted(NET, -2e-4), "auto") == key
+    assert cache.key(shifted(NET, 2e-3), "auto") != key
+    assert cache.key(replace(NET, costs=dict(NET.costs, import_now=51)), "auto") != key
+    assert cache.key(NET, "milp") != key
+    # A coarser quantum merges states further apart
+    coarse = SolutionCache(quantum=1.0)
+    assert coarse.key(shifted(NET, 0.2), "auto") == coarse.key(NET, "auto")
+    assert coarse.key(shifted(NET, 2.0), "auto") != coarse.key(NET, "auto")
+
+
+def test_hits_and_misses():
+    cache = SolutionCache()
+    result = solve_network(NET, cache=cache)
+    assert cache.stats() == {"hits": 0, "misses": 1, "size": 1, "hit_rate": 0.0}
+    again = solve_network(shifted(NET, 1e-5), cache=cache)
+    assert again is not result
+    assert again.objective_value_w == result.objective_value_w
+    np.testing.assert_array_equal(again.P_BSS_ch_w, result.P_BSS_ch_w)
+    # Stored results cannot be changed through a returned one
+    with pytest.raises(ValueError):
+        again.P_BSS_ch_w[0] = 1.0
+    solve_network(shifted(NET, 10.0), cache=cache)
+    assert cache.stats() == {"hits": 1, "misses": 2, "size": 2, "hit_rate": 1 / 3}
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = SolutionCache(max_entries=3)
+    nets = [perturb_loads(NET, seed=seed) for seed in range(4)]
+    keys = [cache.key(net) for net in nets]
+    results = [solve_network(net) for net in nets]
+    for key, result in zip(keys[:3], results):
+        cache.put(key, result)
+    assert cache.get(keys[0]) is not None  # keys[1] is now the oldest
+    cache.put(keys[3], results[3])
+    assert len(cache) == 3
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) is not None for key in (keys[0], keys[2], keys[3]))
+
+    with pytest.raises(ValueError):
+        SolutionCache(max_entries=0)
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "cache.pkl")
+    cache = SolutionCache(max_entries=8, path=path)
+    nets = [perturb_loads(NET, seed=seed) for seed in range(3)]
+    results = [solve_network(net, cache=cache) for net in nets]
+    cache.save()
+    assert not (tmp_path / "cache.pkl.tmp").exists()
+
+    loaded = SolutionCache(max_entries=8, path=path)
+    assert len(loaded) == 3
+    for net, result in zip(nets, results):
+        cached = loaded.get(loaded.key(net, "auto", "angle", "auto"))
+        assert cached.objective_value_w == result.objective_value_w
+        np.testing.assert_array_equal(cached.P_BSS_ch_w, result.P_BSS_ch_w)
+        np.testing.assert_array_equal(cached.P_BSS_dis_w, result.P_BSS_dis_w)
+        np.testing.assert_array_equal(cached.bss_bus_id, result.bss_bus_id)
+    # The LRU order survives the round trip
+    small = SolutionCache(max_entries=2)
+    small.load(path)
+    assert small.get(loaded.key(nets[0], "auto", "angle", "auto")) is None
+
+    with pytest.raises(ValueError):
+        SolutionCache().save()
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+
+from phaseone.testing import perturb_loads, synthetic_network
+from phaseone import screen_contingencies, utils
+from phaseone.contingency import ContingencyScreener, without_line
+
+
+def lines_of(net):
+    return [
+        {"from_bus_id": f, "to_bus_id": t, "b_siemens": b}
+        for f, t, b in zip(net.line_from.tolist(), net.line_to.tolist(), net.line_b.tolist())
+    ]
+
+
+@pytest.mark.parametrize("topology", ["radial", "meshed"])
+def test_lodf_matches_recomputed_ptdf(topology):
+    net = synthetic_network(40, topology=topology, seed=1)
+    buses = net.bus_id.tolist()
+    ptdf, line_map = utils.build_ptdf_matrix(buses, lines_of(net), net.slack_bus)
+    lodf = utils.lodf_matrix(ptdf, line_map, buses)
+    injection = perturb_loads(net).bus_P_G_w - net.bus_P_D_w
+    flows = ptdf @ injection
+
+    islanding = 0
+    for k in range(len(line_map)):
+        outaged = without_line(net, k)
+        try:
+            post, _ = utils.build_ptdf_matrix(buses, lines_of(outaged), net.slack_bus)
+        except ValueError:
+            # Outages that island the network have a NaN column
+            assert np.all(np.isnan(lodf[:, k]))
+            islanding += 1
+            continue
+        expected = np.insert(post @ injection, k, 0.0)
+        np.testing.assert_allclose(flows + lodf[:, k] * flows[k], expected, rtol=1e-9, atol=1e-6)
+        np.testing.assert_allclose(
+            np.delete(utils.line_outage_ptdf(ptdf, line_map, buses, k), k, axis=0), post, atol=1e-12,
+        )
+    # Every outage of a radial network islands it, a meshed one has both
+    if topology == "radial":
+        assert islanding == len(line_map)
+    else:
+        assert 0 < islanding < len(line_map)
+
+
+def test_screening_matches_brute_force():
+    net = synthetic_network(40, topology="meshed", seed=2)
+    screener = ContingencyScreener(net)
+    flows = screener.flows(net)
+    threshold = np.quantile(np.abs(flows) / net.line_P_max_w, 0.9)
+    report = screen_contingencies(net, threshold=threshold)
+
+    buses = net.bus_id.tolist()
+    injection = net.bus_P_G_w - net.bus_P_D_w
+    critical = {}
+    for k in range(len(net.line_from)):
+        if k in screener.islanding:
+            continue
+        outaged = without_line(net, k)
+        post, _ = utils.build_ptdf_matrix(buses, lines_of(outaged), net.slack_bus)
+        loading = np.abs(post @ injection) / outaged.line_P_max_w
+        if loading.max() > threshold:
+            critical[k] = loading.max()
+
+    assert {c.outage for c in report.critical} == set(critical)
+    for contingency in report.critical:
+        assert contingency.max_loading == pytest.approx(critical[contingency.outage], rel=1e-9)
+    loadings = [c.max_loading for c in report.critical]
+    assert loadings == sorted(loadings, reverse=True)
+    assert {c.outage for c in report.islanding} == set(screener.islanding.tolist())
@@ -0,0 +1,46 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+
+from phaseone.testing import synthetic_network
+from phaseone import partition_zones, solve_network, solve_network_decomposed
+from phaseone.contingency import get_screener
+
+
+def tight_network(n_bus, topology, seed, scale):
+    # Line limits scaled towards the flows so that they bind
+    net = synthetic_network(n_bus, n_bss=n_bus // 5, topology=topology, seed=seed)
+    return replace(net, line_P_max_w=net.line_P_max_w * scale)
+
+
+def solve_or_error(solve, net, **kwargs):
+    try:
+        return solve(net, **kwargs)
+    except RuntimeError:
+        return None
+
+
+@pytest.mark.parametrize("topology", ["radial", "meshed"])
+@pytest.mark.parametrize("seed", range(4))
+def test_decomposed_matches_monolithic(topology, seed):
+    net = tight_network(60, topology, seed, scale=0.05)
+    assert len(partition_zones(net, max_zone_buses=10)) > 1
+    expected = solve_or_error(solve_network, net)
+    result = solve_or_error(solve_network_decomposed, net, max_zone_buses=10)
+    assert (result is None) == (expected is None)
+    if expected is None:
+        return
+    assert result.objective_value_w == pytest.approx(expected.objective_value_w, rel=1e-9, abs=1e-3)
+
+    # The merged dispatch respects every line limit of the full network
+    flows = get_screener(net).flows(net, result)
+    assert np.all(np.abs(flows) <= net.line_P_max_w + 1e-3)
+
+
+def test_feasible_cases_are_covered():
+    solved = [
+        solve_or_error(solve_network_decomposed, tight_network(60, topology, seed, scale=0.05), max_zone_buses=10)
+        for topology in ("radial", "meshed") for seed in range(4)
+    ]
+    assert sum(result is not None for result in solved) >= 4
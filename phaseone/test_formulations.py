@@ -0,0 +1,70 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+from pyomo.environ import value
+
+from phaseone.testing import perturb_loads, synthetic_network
+from phaseone import STATS, DCOPFEngine, get_engine, solve_network
+from phaseone.contingency import get_screener, without_line
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_ptdf_matches_angle_on_meshed_network(seed):
+    net = perturb_loads(synthetic_network(40, n_bss=4, topology="meshed", seed=seed), seed=seed)
+    # Nearly full batteries that have to take up their remaining capacity
+    # (4 * headroom W over the 15 min period), so each one has a single
+    # optimal set point
+    headroom = np.random.default_rng(seed).uniform(100, 600, len(net.bss_bus_id))
+    net = replace(
+        net,
+        bss_E_init_wh=net.bss_E_max_wh - headroom,
+        energy_imbalance_next_W=(net.bus_P_G_w - net.bus_P_D_w).sum() - 2 * 4 * headroom.sum(),
+    )
+    angle_engine = get_engine(net, formulation="angle")
+    angle = angle_engine.solve()
+    ptdf = solve_network(net, formulation="ptdf")
+    assert ptdf.objective_value_w == pytest.approx(angle.objective_value_w, rel=1e-6, abs=1e-3)
+    np.testing.assert_allclose(angle.P_BSS_ch_w, 4 * headroom, atol=1e-6)
+    np.testing.assert_allclose(ptdf.P_BSS_ch_w, angle.P_BSS_ch_w, atol=1e-6)
+    np.testing.assert_allclose(ptdf.P_BSS_dis_w, angle.P_BSS_dis_w, atol=1e-6)
+    # Line flows of the ptdf dispatch against the angle model's flow
+    # variables, which are oriented against the PTDF convention
+    flows = np.array([value(angle_engine.model.P_line[k]) for k in angle_engine.model.L])
+    np.testing.assert_allclose(-get_screener(net).flows(net, ptdf), flows, rtol=1e-9, atol=1e-6)
+
+
+def test_network_without_slack_bus():
+    # Without a slack bus the batteries alone balance the network, which
+    # only the angle formulation can express
+    net = synthetic_network(20, n_bss=3, topology="meshed", seed=0)
+    net = replace(net, slack_bus=None, energy_imbalance_next_W=0.0,
+                  bus_P_D_w=net.bus_P_G_w + np.where(net.bus_id == net.bss_bus_id[0], 1000.0, 0.0))
+    result = solve_network(net, formulation="angle")
+    assert result.P_BSS_total_w.sum() == pytest.approx(1000.0, abs=1e-6)
+    with pytest.raises(ValueError, match="slack bus is required"):
+        DCOPFEngine(net, formulation="ptdf")
+
+
+def test_islanded_network_is_rejected():
+    # Removing line 63 islands buses 43, 70 and 71 from the slack bus
+    net = without_line(synthetic_network(80, n_bss=5, topology="meshed", seed=3), 63)
+    with pytest.raises(RuntimeError, match="Solver did not converge"):
+        solve_network(net, formulation="angle")
+    with pytest.raises(ValueError, match="not connected to the slack bus"):
+        DCOPFEngine(net, formulation="ptdf")
+    with pytest.raises(ValueError, match="not connected to the slack bus"):
+        solve_network(net, formulation="ptdf")
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_netted_relaxation_matches_milp(seed):
+    net = perturb_loads(synthetic_network(30, n_bss=6, topology="meshed", seed=seed), seed=seed)
+    solves = STATS.solves
+    relaxed = solve_network(net, problem="auto")
+    assert STATS.solves == solves + 1
+    milp = solve_network(net, problem="milp")
+    assert relaxed.objective_value_w == pytest.approx(milp.objective_value_w, rel=1e-9, abs=1e-3)
+    # The netted dispatch is a feasible MILP solution
+    assert np.all(np.minimum(relaxed.P_BSS_ch_w, relaxed.P_BSS_dis_w) == 0.0)
+    assert np.all(np.maximum(relaxed.P_BSS_ch_w, relaxed.P_BSS_dis_w) <= net.bss_P_max_w + 1e-6)
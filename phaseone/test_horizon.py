@@ -0,0 +1,99 @@
+from dataclasses import replace
+
+import numpy as np
+import pytest
+from pyomo.environ import Var
+
+from phaseone import DCOPFEngine, MultiPeriodOPFEngine
+from phaseone.testing import network_config, perturb_loads, synthetic_network
+
+HORIZON = 6
+# Alternating prices, so storing energy across periods pays off
+COSTS = {
+    "import_now": [20, 80, 20, 90, 30, 70],
+    "export_now": [10, 70, 10, 80, 20, 60],
+    "import_next": 60,
+    "export_next": 45,
+}
+
+
+def dispatch(result):
+    return {
+        bss["bus_id"]: (np.array(bss["P_BSS_ch_w"]), np.array(bss["P_BSS_dis_w"]), np.array(bss["E_BSS_wh"]))
+        for bss in result["bss"]
+    }
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_stored_energy_links_the_periods(seed):
+    # Small empty batteries, which have to charge before they can discharge
+    net = synthetic_network(20, n_bss=3, topology="meshed", seed=seed)
+    net = replace(net, bss_E_max_wh=np.full(3, 1000.0), bss_E_init_wh=np.zeros(3))
+    result = MultiPeriodOPFEngine(network_config(net, costs=COSTS), HORIZON).solve()
+    at_bound = False
+    for i, (ch, dis, energy) in dispatch(result).items():
+        k = net.bss_bus_id.tolist().index(i)
+        previous = np.concatenate([[net.bss_E_init_wh[k]], energy[:-1]])
+        np.testing.assert_allclose(energy, previous + 0.25 * (ch - dis), atol=1e-6)
+        assert np.all(energy >= -1e-6) and np.all(energy <= net.bss_E_max_wh[k] + 1e-6)
+        assert np.all(np.minimum(ch, dis) == 0.0)
+        assert np.all(np.maximum(ch, dis) <= net.bss_P_max_w[k] + 1e-6)
+        at_bound |= bool(np.isclose(energy.min(), 0.0, atol=1e-6) or np.isclose(energy.max(), net.bss_E_max_wh[k]))
+    # The energy limits bind somewhere, so the coupling shapes the dispatch
+    assert at_bound
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_single_period_matches_dcopf_engine(seed):
+    net = perturb_loads(synthetic_network(20, n_bss=3, topology="meshed", seed=seed), seed=seed)
+    expected = DCOPFEngine(net).solve()
+    result = MultiPeriodOPFEngine(network_config(net), 1).solve()
+    assert result["objective_value_w"] == pytest.approx(expected.objective_value_w, rel=1e-9, abs=1e-3)
+    # The split between the batteries may differ between optima, their total does not
+    total = sum(ch[0] - dis[0] for ch, dis, _ in dispatch(result).values())
+    assert total == pytest.approx((expected.P_BSS_ch_w - expected.P_BSS_dis_w).sum(), abs=1e-6)
+    for k, (ch, dis, energy) in enumerate(dispatch(result).values()):
+        assert energy[0] == pytest.approx(net.bss_E_init_wh[k] + 0.25 * (ch[0] - dis[0]), abs=1e-6)
+
+
+def test_advance_carries_the_battery_state():
+    net = synthetic_network(20, n_bss=3, topology="meshed", seed=1)
+    engine = MultiPeriodOPFEngine(network_config(net, costs=COSTS), HORIZON)
+    first = dispatch(engine.solve())
+
+    # The next window, starting from the stored energy after the first period
+    costs = dict(COSTS, import_now=COSTS["import_now"][1:] + [25], export_now=COSTS["export_now"][1:] + [15])
+    result = engine.advance(network_config(net, costs=costs))
+    soc = np.array([energy[0] for _, _, energy in first.values()])
+    expected = MultiPeriodOPFEngine(network_config(replace(net, bss_E_init_wh=soc), costs=costs), HORIZON).solve()
+    assert result["objective_value_w"] == pytest.approx(expected["objective_value_w"], rel=1e-9, abs=1e-3)
+    for (_, _, energy), (_, _, energy_ref) in zip(dispatch(result).values(), dispatch(expected).values()):
+        np.testing.assert_allclose(energy, energy_ref, atol=1e-6)
+
+    # Without carry_soc the state comes from the config again
+    result = engine.advance(network_config(net, costs=costs), carry_soc=False)
+    expected = MultiPeriodOPFEngine(network_config(net, costs=costs), HORIZON).solve()
+    assert result["objective_value_w"] == pytest.approx(expected["objective_value_w"], rel=1e-9, abs=1e-3)
+
+
+def test_shift_solution_moves_the_warm_start():
+    net = synthetic_network(20, n_bss=3, topology="meshed", seed=0)
+    engine = MultiPeriodOPFEngine(network_config(net, costs=COSTS), HORIZON)
+    engine.solve()
+    model = engine.model
+
+    def period_values(t):
+        return [var.value for var in model.period[t].component_data_objects(Var, sort=True)]
+
+    before = [period_values(t) for t in range(HORIZON)]
+    energy = {(i, t): model.E[i, t].value for i in model.BSS for t in model.T}
+    engine._shift_solution(2)
+    for t in range(HORIZON - 2):
+        assert period_values(t) == before[t + 2]
+        for i in model.BSS:
+            assert model.E[i, t].value == energy[i, t + 2]
+    # The last periods keep their values as a starting point
+    assert period_values(HORIZON - 1) == before[HORIZON - 1]
+
+    with pytest.raises(ValueError, match="advance"):
+        engine.advance(network_config(net, costs=COSTS), steps=HORIZON + 1)
@@ -0,0 +1,99 @@
+from dataclasses import replace
+
+import numpy as np
+
+from .network import ADNArrays
+
+# Synthetic networks shared by the phaseone tests and the benchmarks
+
+TOPOLOGIES = ("radial", "meshed")
+
+
+def synthetic_lines(n_bus, topology="radial", extra_lines=0.2, rng=None):
+    # Random spanning tree (every bus hangs off an earlier one, like a
+    # feeder), plus extra_lines * n_bus random chords for "meshed"
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"Unknown topology {topology!r}, expected one of {TOPOLOGIES}")
+    rng = np.random.default_rng(rng)
+    buses = np.arange(1, n_bus)
+    parents = (rng.random(n_bus - 1) * buses).astype(int)
+    lines = set(zip(parents.tolist(), buses.tolist()))
+    if topology == "meshed":
+        target = len(lines) + int(extra_lines * n_bus)
+        while len(lines) < target and len(lines) < n_bus * (n_bus - 1) // 2:
+            f, t = sorted(rng.choice(n_bus, 2, replace=False).tolist())
+            lines.add((f, t))
+    lines = sorted(lines)
+    return np.array([f for f, _ in lines]), np.array([t for _, t in lines])
+
+
+def synthetic_network(n_bus, n_bss=None, topology="radial", seed=0):
+    # Feasible synthetic ADN: bus 0 is the slack, loads and generation are
+    # random, line limits are loose enough that the slack can always serve
+    # the whole net load. The model's future balance ties the imbalance to the
+    # net generation (with idle batteries), so it is set to exactly that.
+    rng = np.random.default_rng(seed)
+    n_bss = max(1, n_bus // 10) if n_bss is None else n_bss
+    line_from, line_to = synthetic_lines(n_bus, topology, rng=rng)
+    P_G = np.where(rng.random(n_bus) < 0.3, rng.uniform(0, 5000, n_bus), 0.0)
+    P_D = rng.uniform(0, 3000, n_bus)
+    P_G[0] = P_D[0] = 0.0
+    limit = 2 * (P_G.sum() + P_D.sum()) + 3000 * n_bss
+    bss_bus = np.sort(rng.choice(np.arange(1, n_bus), min(n_bss, n_bus - 1), replace=False))
+    E_max = rng.uniform(5000, 20000, len(bss_bus))
+    return ADNArrays(
+        bus_id=np.arange(n_bus),
+        bus_P_G_w=P_G,
+        bus_P_D_w=P_D,
+        slack_bus=0,
+        line_from=line_from,
+        line_to=line_to,
+        line_b=rng.uniform(1, 10, len(line_from)),
+        line_P_max_w=np.full(len(line_from), limit),
+        bss_bus_id=bss_bus,
+        bss_P_max_w=np.full(len(bss_bus), 3000.0),
+        bss_E_max_wh=E_max,
+        bss_E_init_wh=E_max * rng.uniform(0.2, 0.8, len(bss_bus)),
+        costs={"import_now": 50, "export_now": 40, "import_next": 60, "export_next": 45},
+        energy_imbalance_next_W=P_G.sum() - P_D.sum(),
+    )
+
+
+def perturb_loads(net, scale=0.1, seed=0):
+    # Same topology with loads and generation moved by up to +-scale
+    rng = np.random.default_rng(seed)
+    n_bus = len(net.bus_id)
+    P_G = net.bus_P_G_w * rng.uniform(1 - scale, 1 + scale, n_bus)
+    P_D = net.bus_P_D_w * rng.uniform(1 - scale, 1 + scale, n_bus)
+    return replace(net, bus_P_G_w=P_G, bus_P_D_w=P_D, energy_imbalance_next_W=P_G.sum() - P_D.sum())
+
+
+def network_config(net, **series):
+    # Dict config of an ADNArrays, as read by ADNArrays.from_config and
+    # MultiPeriodOPFEngine. series replaces bus columns ("P_G_w", "P_D_w",
+    # one row per bus) or top-level entries, e.g. with per-period lists.
+    buses = [
+        {"id": bus, "P_G_w": float(P_G), "P_D_w": float(P_D), "slack": bus == net.slack_bus}
+        for bus, P_G, P_D in zip(net.bus_id.tolist(), net.bus_P_G_w, net.bus_P_D_w)
+    ]
+    for key in ("P_G_w", "P_D_w"):
+        if key in series:
+            for bus, values in zip(buses, series.pop(key)):
+                bus[key] = values
+    config = {
+        "bus": buses,
+        "line": [
+            {"from_bus_id": f, "to_bus_id": t, "b_siemens": b, "P_line_max_w": limit}
+            for f, t, b, limit in zip(net.line_from.tolist(), net.line_to.tolist(), net.line_b.tolist(),
+                                      net.line_P_max_w.tolist())
+        ],
+        "bss": [
+            {"bus_id": bus, "P_BSS_max_w": P_max, "E_BSS_max_wh": E_max, "E_BSS_init_wh": E_init}
+            for bus, P_max, E_max, E_init in zip(net.bss_bus_id.tolist(), net.bss_P_max_w.tolist(),
+                                                 net.bss_E_max_wh.tolist(), net.bss_E_init_wh.tolist())
+        ],
+        "costs": dict(net.costs),
+        "energy_imbalance_next_W": net.energy_imbalance_next_W,
+    }
+    config.update(series)
+    return config
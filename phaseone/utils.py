@@ -1,29 +1,109 @@
 import numpy as np
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import splu
 
+MAX_CACHED_PTDF = 32
 
-def build_ptdf_matrix(buses, lines, slack_bus):
-    n = len(buses)
-    B = np.zeros((n, n))
+_ptdf_cache = {}
+
+
+def build_incidence(buses, lines):
+    # Line x bus incidence matrix: +1 at the from bus, -1 at the to bus
     id_map = {bus: idx for idx, bus in enumerate(buses)}
-    line_map = {}
+    n_lines = len(lines)
+    rows = np.repeat(np.arange(n_lines), 2)
+    cols = np.array([id_map[bus] for line in lines for bus in (line["from_bus_id"], line["to_bus_id"])], dtype=int)
+    data = np.tile([1.0, -1.0], n_lines)
+    A = sp.csr_matrix((data, (rows, cols)), shape=(n_lines, len(buses)))
+    return A, id_map
 
-    for idx, line in enumerate(lines):
-        i = id_map[line["from_bus_id"]]
-        j = id_map[line["to_bus_id"]]
-        b = line["b_siemens"]
 
-        B[i, i] += b
-        B[j, j] += b
-        B[i, j] -= b
-        B[j, i] -= b
+def build_ptdf_matrix(buses, lines, slack_bus):
+    key = (
+        tuple(buses),
+        slack_bus,
+        tuple((line["from_bus_id"], line["to_bus_id"], line["b_siemens"]) for line in lines),
+    )
+    cached = _ptdf_cache.get(key)
+    if cached is None:
+        if len(_ptdf_cache) >= MAX_CACHED_PTDF:
+            _ptdf_cache.pop(next(iter(_ptdf_cache)))
+        cached = _ptdf_cache[key] = _compute_ptdf(buses, lines, slack_bus)
+    return cached
 
-        line_map[idx] = (line["from_bus_id"], line["to_bus_id"])
+
+def _compute_ptdf(buses, lines, slack_bus):
+    A, id_map = build_incidence(buses, lines)
+    if slack_bus not in id_map:
+        raise ValueError("A slack bus is required to build the PTDF matrix")
+
+    n = len(buses)
+    b = np.array([line["b_siemens"] for line in lines], dtype=float)
+    check_connected(A, b, id_map, slack_bus)
+    B_f = (sp.diags(b) @ A).tocsc()
+    B_bus = (A.T @ B_f).tocsc()
 
     # remove slack row and column
-    slack_idx = id_map[slack_bus]
-    B_reduced = np.delete(np.delete(B, slack_idx, axis=0), slack_idx, axis=1)
+    keep = np.flatnonzero(np.arange(n) != id_map[slack_bus])
+
+    ptdf = np.zeros((len(lines), n))
+    if len(lines) and keep.size:
+        B_reduced = B_bus[keep][:, keep].tocsc()
+        try:
+            lu = splu(B_reduced)
+        except RuntimeError:
+            raise ValueError("Susceptance matrix of the network is singular")
+        # B_reduced is symmetric, so PTDF^T = B_reduced^-1 @ B_f^T
+        ptdf[:, keep] = lu.solve(B_f[:, keep].T.toarray()).T
+
+    line_map = {idx: (line["from_bus_id"], line["to_bus_id"]) for idx, line in enumerate(lines)}
+    ptdf.flags.writeable = False
+    return ptdf, line_map
+
+
+def check_connected(A, b, id_map, slack_bus):
+    # Raises ValueError for buses outside the slack bus's component. A
+    # singular B matrix is not reliably detected by the factorization, which
+    # can return a finite but meaningless PTDF for an islanded network.
+    # Lines without susceptance carry no flow and do not connect buses.
+    connects = A[np.flatnonzero(b != 0)]
+    graph = connects.T @ connects
+    _, labels = connected_components(graph, directed=False)
+    islanded = np.flatnonzero(labels != labels[id_map[slack_bus]])
+    if islanded.size:
+        buses = list(id_map)
+        names = [buses[i] for i in islanded[:10].tolist()]
+        more = f" and {islanded.size - 10} more" if islanded.size > 10 else ""
+        raise ValueError(f"Network is not connected to the slack bus: buses {names}{more} are islanded")
+
+
+def lodf_matrix(ptdf, line_map, buses, outages=None):
+    # Line outage distribution factors for all (or the given) outages at
+    # once: column j holds the change of every line flow per unit of
+    # pre-outage flow on line outages[j]. Outages that island the network
+    # have a NaN column.
+    id_map = {bus: idx for idx, bus in enumerate(buses)}
+    outages = np.arange(len(line_map)) if outages is None else np.asarray(outages, dtype=int)
+    from_idx = np.array([id_map[line_map[k][0]] for k in outages.tolist()], dtype=int)
+    to_idx = np.array([id_map[line_map[k][1]] for k in outages.tolist()], dtype=int)
+    transfer = ptdf[:, from_idx] - ptdf[:, to_idx]
+
+    denom = 1.0 - transfer[outages, np.arange(len(outages))]
+    islanding = np.abs(denom) < 1e-9
+    with np.errstate(divide="ignore", invalid="ignore"):
+        lodf = transfer / np.where(islanding, np.nan, denom)
+    lodf[outages, np.arange(len(outages))] = -1.0
+    lodf[:, islanding] = np.nan
+    return lodf
+
 
-    # pseudo-inverse
-    B_inv = np.linalg.pinv(B_reduced)
+def line_outage_ptdf(ptdf, line_map, buses, outage):
+    # Rank-one update of the PTDF for the loss of a single line
+    lodf = lodf_matrix(ptdf, line_map, buses, [outage])[:, 0]
+    if np.isnan(lodf[outage]):
+        raise ValueError(f"Outage of line {outage} islands the network")
 
-    return B_inv, line_map
+    updated = ptdf + np.outer(lodf, ptdf[outage])
+    updated[outage] = 0.0
+    return updated
@@ -1,6 +1,11 @@
-import collections
-import json
+import csv
+import os
+import numbers
+import numpy as np
 import mosaik_api_v3
+from phasethree.checkpoint import Checkpointer
+from phasethree.profiling import StepProfiler
+from phasethree.sim_logging import TRACE_STEP, SimLogger
 
 META = {
     'type': 'event-based',
@@ -17,15 +22,209 @@ META = {
     ]
 }
 
+FORMATS = ('parquet', 'arrow', 'hdf5', 'csv')
+EXTENSIONS = {
+    '.parquet': 'parquet',
+    '.arrow': 'arrow',
+    '.feather': 'arrow',
+    '.h5': 'hdf5',
+    '.hdf5': 'hdf5',
+    '.csv': 'csv',
+}
+BYTES_PER_VALUE = 16  # int64 time + float64 value
+SUFFIXES = {'parquet': '.parquet', 'arrow': '.arrow', 'hdf5': '.h5', 'csv': '.csv'}
+
+
+def format_available(fmt):
+    try:
+        if fmt in ('parquet', 'arrow'):
+            import pyarrow  # noqa: F401
+        elif fmt == 'hdf5':
+            import h5py  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def resolve_output(path, fmt='auto'):
+    # Picks the output format from the file extension, or the first available
+    # columnar backend if the extension is unknown, falling back to CSV
+    root, ext = os.path.splitext(path)
+    if fmt == 'auto':
+        fmt = EXTENSIONS.get(ext.lower())
+        if fmt is None or not format_available(fmt):
+            fmt = next(f for f in FORMATS if format_available(f))
+    elif fmt not in FORMATS:
+        raise ValueError(f"Unknown output format {fmt!r}, expected one of {FORMATS}")
+    elif not format_available(fmt):
+        raise RuntimeError(f"Output format {fmt!r} needs a package that is not installed")
+    if EXTENSIONS.get(ext.lower()) != fmt:
+        path = root + SUFFIXES[fmt]
+    return path, fmt
+
+
+class SeriesBuffer:
+    # Growable typed column pair (time, value) for one source attribute.
+    # Numeric values are kept as float64 (None -> NaN); the first
+    # non-numeric value switches the value column to object.
+    def __init__(self, capacity=256):
+        self.time = np.empty(capacity, dtype=np.int64)
+        self.value = np.empty(capacity, dtype=np.float64)
+        self.size = 0
+        self.last_time = None  # Last stored time, for downsampling
+
+    def append(self, time, value):
+        if self.size == len(self.time):
+            self.time = np.resize(self.time, 2 * self.size)
+            self.value = np.resize(self.value, 2 * self.size)
+        if value is None:
+            value = np.nan
+        elif self.value.dtype != object and not isinstance(value, numbers.Real):
+            self.value = self.value.astype(object)
+        self.time[self.size] = time
+        self.value[self.size] = value
+        self.size += 1
+        self.last_time = time
+
+    def take(self):
+        # Returns the buffered columns and empties the buffer, keeping its capacity
+        time, value = self.time[:self.size].copy(), self.value[:self.size].copy()
+        self.size = 0
+        return time, value
+
+
+class CSVSink:
+    # Long format: time, src, attr, value
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['time', 'src', 'attr', 'value'])
+
+    def write(self, src, attr, time, value):
+        self.writer.writerows(zip(time.tolist(), [src] * len(time), [attr] * len(time), value.tolist()))
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowSink:
+    # Long format table, one row group / record batch per flushed series.
+    # Non-numeric values go to the 'text' column, with NaN in 'value'.
+    def __init__(self, path, fmt):
+        import pyarrow as pa
+        self.pa = pa
+        self.schema = pa.schema([
+            ('time', pa.int64()),
+            ('src', pa.string()),
+            ('attr', pa.string()),
+            ('value', pa.float64()),
+            ('text', pa.string()),
+        ])
+        if fmt == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+
+    def write(self, src, attr, time, value):
+        pa = self.pa
+        if value.dtype == object:
+            numeric = np.array([isinstance(v, numbers.Real) for v in value], dtype=bool)
+            text = pa.array([None if n else str(v) for n, v in zip(numeric, value)], type=pa.string())
+            value = np.where(numeric, value, np.nan).astype(np.float64)
+        else:
+            text = pa.nulls(len(time), type=pa.string())
+        batch = pa.record_batch([
+            pa.array(time),
+            pa.array([src] * len(time), type=pa.string()),
+            pa.array([attr] * len(time), type=pa.string()),
+            pa.array(value),
+            text,
+        ], schema=self.schema)
+        self.writer.write_table(pa.Table.from_batches([batch]))
+
+    def close(self):
+        self.writer.close()
+
+
+class HDF5Sink:
+    # One group per source attribute with resizable 'time' and 'value' datasets
+    def __init__(self, path):
+        import h5py
+        self.h5py = h5py
+        self.file = h5py.File(path, 'w')
+
+    def write(self, src, attr, time, value):
+        name = f'{src}/{attr}'
+        if value.dtype == object:
+            value = np.array([str(v) for v in value], dtype=object)
+        if name not in self.file:
+            group = self.file.create_group(name)
+            dtype = self.h5py.string_dtype() if value.dtype == object else value.dtype
+            group.create_dataset('time', data=time, maxshape=(None,), chunks=True)
+            group.create_dataset('value', data=value, dtype=dtype, maxshape=(None,), chunks=True)
+            return
+        group = self.file[name]
+        if value.dtype == object and self.h5py.check_string_dtype(group['value'].dtype) is None:
+            # The series turned to text, its numbers are rewritten as text
+            written = np.array([str(v) for v in group['value'][:]], dtype=object)
+            del group['value']
+            group.create_dataset('value', data=written, dtype=self.h5py.string_dtype(), maxshape=(None,), chunks=True)
+        for key, column in (('time', time), ('value', value)):
+            dataset = group[key]
+            start = dataset.shape[0]
+            dataset.resize((start + len(column),))
+            dataset[start:] = column
+
+    def close(self):
+        self.file.close()
+
+
+def open_sink(path, fmt):
+    if fmt == 'csv':
+        return CSVSink(path)
+    if fmt == 'hdf5':
+        return HDF5Sink(path)
+    return ArrowSink(path, fmt)
+
+
 class Collector(mosaik_api_v3.Simulator):
+    # Streams every received value to a columnar file instead of keeping the
+    # whole run in memory. Values are buffered per (source, attribute) in
+    # typed arrays and flushed when the buffers exceed memory_budget_mb or
+    # every flush_interval seconds of simulated time. downsample_s keeps at
+    # most one value per series every downsample_s seconds.
     def __init__(self):
         super().__init__(META)
         self.eid = None
-        self.data = collections.defaultdict(lambda: collections.defaultdict(dict))
+        self.buffers = {}
+        self.counts = {}
+        self.buffered = 0  # Values held in the buffers
         self.data_out_path = None
+        self.fmt = None
+        self.sink = None
+        self.memory_budget = 64 * 2**20
+        self.flush_interval = None
+        self.downsample_s = None
+        self.last_flush = 0
+        self.restore_path = None  # Output of a restored run until it finalizes
+        self.log = SimLogger('Collector')
+        self.profiler = StepProfiler('Collector')
+        self.checkpoint = Checkpointer()
 
-    def init(self, sid, time_resolution, data_out):
-        self.data_out_path = data_out
+    def init(self, sid, time_resolution, data_out='output_data.parquet', format='auto', memory_budget_mb=64,
+             flush_interval=None, downsample_s=None, log_level=None, log_every=1, trace_file=None,
+             profile=False, checkpoint_dir=None, checkpoint_every=3600, restore_from=None):
+        self.sid = sid
+        self.log.configure(log_level, log_every, trace_file)
+        self.profiler.configure(profile, sid=sid)
+        self.data_out_path, self.fmt = resolve_output(data_out, format)
+        self.memory_budget = memory_budget_mb * 2**20
+        self.flush_interval = flush_interval
+        self.downsample_s = downsample_s
+        # Event-based: a snapshot is written at the first step at or after
+        # its time, before that step's inputs are buffered
+        self.checkpoint.configure(sid, checkpoint_dir, checkpoint_every, restore_from)
         return self.meta
 
     def create(self, num, model):
@@ -35,26 +234,195 @@ class Collector(mosaik_api_v3.Simulator):
         return [{'eid': self.eid, 'type': model}]
 
     def step(self, time, inputs, max_advance):
+        start = self.profiler.start()
+        time += self.checkpoint.offset
+        self.log.begin_step(time)
+        self.log.debug('[Collector] Step time %s, inputs received: %s', time, inputs)
+        self.log.trace(TRACE_STEP, len(inputs))
+        self.checkpoint.step(time, self)
         for entity_id, attrs in inputs.items():
             for attr, values in attrs.items():
                 for src, value in values.items():
-                    self.data[src][attr][time] = value
-        
-        print(f"[Collector] Step time {time}, inputs received: {inputs}")
+                    buffer = self.buffers.get((src, attr))
+                    if buffer is None:
+                        buffer = self.buffers[(src, attr)] = SeriesBuffer()
+                        self.counts[(src, attr)] = 0
+                    elif self.downsample_s and buffer.last_time is not None and time - buffer.last_time < self.downsample_s:
+                        continue
+                    buffer.append(time, value)
+                    self.buffered += 1
+
+        interval_due = self.flush_interval is not None and time - self.last_flush >= self.flush_interval
+        if interval_due or self.buffered * BYTES_PER_VALUE >= self.memory_budget:
+            self.flush()
+            self.last_flush = time
+        self.profiler.stop('step', start, time)
         return None
 
+    def flush(self):
+        start = self.profiler.start()
+        if self.sink is None:
+            self.sink = open_sink(self.data_out_path, self.fmt)
+        for (src, attr), buffer in self.buffers.items():
+            if buffer.size:
+                self.counts[(src, attr)] += buffer.size
+                self.sink.write(src, attr, *buffer.take())
+        self.profiler.stop('flush', start, values=self.buffered)
+        self.buffered = 0
+
+    def get_state(self):
+        # Snapshots hold the buffered values and how many values of each
+        # series were already written, the written ones are copied from the
+        # output file on restore
+        arrays = {}
+        series = []
+        for i, ((src, attr), buffer) in enumerate(self.buffers.items()):
+            value = buffer.value[:buffer.size]
+            text = value.dtype == object
+            arrays[f'time_{i}'] = buffer.time[:buffer.size]
+            arrays[f'value_{i}'] = value.astype(str) if text else value
+            series.append([src, attr, self.counts[(src, attr)], buffer.last_time, bool(text)])
+        meta = {'data_out': self.data_out_path, 'series': series, 'last_flush': self.last_flush}
+        return arrays, meta
+
+    def set_state(self, arrays, meta):
+        # The values written before the snapshot are copied into a new file.
+        # When the snapshot's output is also this run's output, the copy
+        # replaces it only once this run finalizes, so a failed restore never
+        # truncates it.
+        counts = {(src, attr): count for src, attr, count, _, _ in meta['series']}
+        if os.path.abspath(self.data_out_path) == os.path.abspath(meta['data_out']):
+            root, ext = os.path.splitext(self.data_out_path)
+            self.restore_path = f'{root}.restored{ext}'
+        self.sink = open_sink(self.restore_path or self.data_out_path, self.fmt)
+        copied = dict.fromkeys(counts, 0)
+        try:
+            if any(counts.values()):
+                for src, attr, time, value in iter_data(meta['data_out']):
+                    remaining = counts.get((src, attr), 0) - copied.get((src, attr), 0)
+                    if remaining > 0:
+                        self.sink.write(src, attr, time[:remaining], value[:remaining])
+                        copied[(src, attr)] += min(remaining, len(time))
+            missing = [f'{src}.{attr}' for (src, attr), count in counts.items() if copied[(src, attr)] < count]
+            if missing:
+                raise ValueError(f'values of {", ".join(missing)} are missing')
+        except (OSError, ValueError, ImportError) as e:
+            self.sink.close()
+            os.remove(self.restore_path or self.data_out_path)
+            # Nothing is written when the world is finalized after this
+            self.sink = self.restore_path = self.data_out_path = None
+            raise RuntimeError(
+                f'Cannot restore {self.sid}: the values written before the snapshot could not be read from '
+                f'{meta["data_out"]} ({e})'
+            ) from e
+
+        for i, (src, attr, count, last_time, text) in enumerate(meta['series']):
+            self.counts[(src, attr)] = count
+            buffer = self.buffers[(src, attr)] = SeriesBuffer()
+            values = arrays[f'value_{i}'].astype(object) if text else arrays[f'value_{i}']
+            for t, v in zip(arrays[f'time_{i}'].tolist(), values.tolist()):
+                buffer.append(t, v)
+            buffer.last_time = last_time
+            self.buffered += buffer.size
+        self.last_flush = meta['last_flush']
+
+    def get_final_data(self):
+        # Number of values written per source attribute
+        return {f'{src}.{attr}': count for (src, attr), count in self.counts.items()}
+
     def finalize(self):
-        print('Collected data:')
-        for sim, sim_data in sorted(self.data.items()):
-            print(f'- {sim}:')
-            for attr, values in sorted(sim_data.items()):
-                vals = [values[key] for key in values]
-                print(f'  - {attr}: {vals}')
-
-        output_file = self.data_out_path or 'output_data.json'
-        with open(output_file, 'w') as f:
-            json.dump(self.data, f, indent=4, default=str)
-        print(f'Data written to {output_file}')
+        if self.data_out_path is not None:
+            self.flush()
+            self.sink.close()
+            if self.restore_path is not None:
+                os.replace(self.restore_path, self.data_out_path)
+        self.log.close()
+        self.log.info('Collected data: %s', self.get_final_data())
+        self.log.info('Data written to %s', self.data_out_path)
+
+
+CHUNK_ROWS = 2**16  # Rows per chunk when streaming an output file
+
+
+def _runs(src, attr, time, value):
+    # Splits rows into runs of the same source attribute
+    start = 0
+    for i in range(1, len(src) + 1):
+        if i == len(src) or src[i] != src[start] or attr[i] != attr[start]:
+            yield src[start], attr[start], time[start:i], value[start:i]
+            start = i
+
+
+def iter_data(path):
+    # Streams a Collector output file as (src, attr, time, value) chunks in
+    # the order they were written, so large outputs are never loaded whole
+    _, fmt = resolve_output(path)
+    if fmt == 'hdf5':
+        import h5py
+        with h5py.File(path, 'r') as f:
+            for src in f:
+                for attr in f[src]:
+                    group = f[src][attr]
+                    value = group['value']
+                    if h5py.check_string_dtype(value.dtype) is not None:
+                        value = value.asstr()  # Text values as str, like the other formats
+                    for start in range(0, group['time'].shape[0], CHUNK_ROWS):
+                        stop = start + CHUNK_ROWS
+                        yield src, attr, group['time'][start:stop], value[start:stop]
+        return
+
+    if fmt == 'csv':
+        with open(path, newline='') as f:
+            reader = csv.reader(f)
+            next(reader, None)
+            while True:
+                rows = [row for _, row in zip(range(CHUNK_ROWS), reader)]
+                if not rows:
+                    return
+                _, src, attr, value = zip(*rows)
+                time = np.array([row[0] for row in rows], dtype=np.int64)
+                yield from _runs(src, attr, time, np.array(value, dtype=object))
+
+    import pyarrow as pa
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        with pq.ParquetFile(path) as source:
+            for batch in source.iter_batches(batch_size=CHUNK_ROWS):
+                yield from _arrow_runs(batch)
+    else:
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield from _arrow_runs(reader.get_batch(i))
+
+
+def _arrow_runs(batch):
+    columns = batch.to_pydict()
+    time = np.array(columns['time'], dtype=np.int64)
+    if batch.column('text').null_count == len(batch):
+        value = np.array(columns['value'], dtype=np.float64)
+    else:
+        value = np.array([v if t is None else t for v, t in zip(columns['value'], columns['text'])], dtype=object)
+    yield from _runs(columns['src'], columns['attr'], time, value)
+
+
+def read_data(path):
+    # Reads a Collector output file back into {(src, attr): (time, value)}
+    _, fmt = resolve_output(path)
+    chunks = {}
+    for src, attr, time, value in iter_data(path):
+        chunks.setdefault((src, attr), []).append((time, value))
+    data = {}
+    for key, parts in chunks.items():
+        time = np.concatenate([time for time, _ in parts])
+        values = np.concatenate([value for _, value in parts])
+        if fmt != 'hdf5':
+            try:
+                values = values.astype(np.float64)
+            except (TypeError, ValueError):
+                pass
+        data[key] = (time, values)
+    return data
 
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+import json
+import os
+
+import numpy as np
+
+META_KEY = '__meta__'
+
+
+def checkpoint_path(directory, time):
+    # Snapshot directory of the simulation time `time` (seconds)
+    return os.path.join(directory, f'{int(time):010d}')
+
+
+def snapshot_time(path):
+    # Simulation time a snapshot directory was taken at
+    return int(os.path.basename(os.path.normpath(path)))
+
+
+def latest_checkpoint(directory):
+    # Newest snapshot directory with as many simulator snapshots as the most
+    # complete one, so a snapshot interrupted while being written is skipped.
+    # None if there is no snapshot.
+    if not os.path.isdir(directory):
+        return None
+    snapshots = {}
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.isdigit() and os.path.isdir(path):
+            snapshots[int(name)] = sum(1 for f in os.listdir(path) if f.endswith('.npz'))
+    if not snapshots:
+        return None
+    size = max(snapshots.values())
+    return checkpoint_path(directory, max(t for t, count in snapshots.items() if count == size))
+
+
+def save_state(path, arrays, meta):
+    # One compressed .npz per simulator with its state arrays and the
+    # metadata as a JSON string. Written to a temporary file first, so an
+    # interrupted write never leaves a truncated snapshot behind.
+    tmp = f'{path}.tmp'
+    with open(tmp, 'wb') as f:
+        np.savez_compressed(f, **arrays, **{META_KEY: np.array(json.dumps(meta))})
+    os.replace(tmp, path)
+
+
+def load_state(path):
+    with np.load(path, allow_pickle=False) as data:
+        arrays = {key: data[key] for key in data.files if key != META_KEY}
+        meta = json.loads(str(data[META_KEY]))
+    return arrays, meta
+
+
+class Checkpointer:
+    # Writes a simulator's state every `every` seconds of simulation time to
+    # <directory>/<time>/<sid>.npz and restores it from such a snapshot
+    # directory to resume or branch a run. A restored world is run by mosaik
+    # from 0 again, so simulators step at their mosaik time plus `offset`,
+    # the time of the snapshot.
+    #
+    # A snapshot at time T holds the state after all steps before T and is
+    # written at the start of the first step at or after T. Time-based
+    # simulators must step at T exactly (every is a multiple of their step
+    # size), as the restored world steps all of them at T.
+
+    def __init__(self):
+        self.sid = None
+        self.directory = None
+        self.every = None
+        self.next_time = None
+        self.offset = 0
+        self.restored = None
+
+    def configure(self, sid, directory=None, every=3600, restore_from=None, step_size=1):
+        self.sid = sid
+        if restore_from is not None:
+            self.restored = load_state(os.path.join(restore_from, f'{sid}.npz'))
+            self.offset = self.restored[1]['time']
+        if directory is None:
+            return
+        if not every or every <= 0 or every % step_size:
+            raise ValueError(f'checkpoint_every must be a positive multiple of the step size ({step_size} s)')
+        self.directory = directory
+        self.every = every
+        self.next_time = self.offset - self.offset % every + every
+
+    def due(self, time):
+        # Snapshot time reached by a step at `time`, or None
+        if self.next_time is None or time < self.next_time:
+            return None
+        due = time - time % self.every
+        self.next_time = due + self.every
+        return due
+
+    def save(self, time, arrays, meta):
+        path = checkpoint_path(self.directory, time)
+        os.makedirs(path, exist_ok=True)
+        save_state(os.path.join(path, f'{self.sid}.npz'), arrays, dict(meta, sid=self.sid, time=int(time)))
+
+    def step(self, time, sim):
+        # Called at the start of every step with the simulation time: applies
+        # the restored snapshot before the first step and writes a snapshot
+        # when one is due. `sim` provides get_state() -> (arrays, meta) and
+        # set_state(arrays, meta).
+        if self.restored is not None:
+            restored, self.restored = self.restored, None
+            sim.set_state(*restored)
+        due = self.due(time)
+        if due is not None:
+            self.save(due, *sim.get_state())
@@ -0,0 +1,203 @@
+import math
+
+import numpy as np
+
+from phaseone import SolutionCache, solve_network_batch
+from phasetwo import PIDControllerBank
+from phasethree.Collector import open_sink, resolve_output
+from phasethree.optimizer_simulator import OptimizerSim, generator_p, load_p
+from phasethree.profile_simulator import ProfileStore, convert_csv, parse_time
+from phasethree.pss_simulator import PSSFleet
+
+PSS_STEP_MODES = ('exact', 'held')
+
+
+class HeadlessScenario:
+    # The Optimizer -> PowerController -> PSS chain of scenario_builder run
+    # in-process on shared arrays, without mosaik. Components are stepped
+    # by a multi-rate scheduler in dependency order, like mosaik does for
+    # time-based simulators: at time t the controllers see the setpoints of
+    # the last optimizer step <= t and the PSS units the controller outputs
+    # of the last controller step <= t. With pss_step='exact' the PSS units
+    # take every 1 s step, which gives the same values as the mosaik run.
+    # pss_step='held' takes one step per controller period and integrates
+    # the held seconds in closed form (PSSFleet.advance_held); it matches up
+    # to floating point rounding and only records at controller steps.
+    #
+    # Like the Collector, which mosaik steps whenever the PSS units step,
+    # every attribute is recorded at each recorded time with the latest
+    # value of its source. Values use the mosaik full ids of the Collector
+    # output ('<sid>.<eid>') so results can be compared or written with
+    # write().
+    #
+    # Loads with 'load_profile' / 'generator_profile' columns are served from
+    # `datafile` like scenario_builder's Profile simulator does (mean of the
+    # rows within each optimizer interval from sim_start on).
+
+    def __init__(self, assets, optimizer_step=900, controller_step=60, pss_step='exact', record_every=1,
+                 solver='auto', problem='auto', batch_mode='stack', workers=None, cache_size=4096, datafile=None,
+                 sim_start='01.01.2016 00:00', date_format='%d.%m.%Y %H:%M'):
+        if pss_step not in PSS_STEP_MODES:
+            raise ValueError(f"Unknown PSS step mode {pss_step!r}, expected one of {PSS_STEP_MODES}")
+        self.optimizer_step = optimizer_step
+        self.controller_step = controller_step
+        self.pss_step = pss_step
+        self.record_every = record_every
+        self.solver = solver
+        self.problem = problem
+        self.batch_mode = batch_mode
+        self.workers = workers
+        self.cache = SolutionCache(cache_size) if cache_size else None
+
+        loads = assets['loads']
+        pss_assets = assets.get('pss', [])
+        n = len(pss_assets)
+
+        # Entity ids in the order scenario_builder creates them
+        self.load_ids = [f'Optimizer-0.Optimizer-{2 * i}' for i in range(len(loads))]
+        self.generator_ids = [f'Optimizer-0.Optimizer-{2 * i + 1}' for i in range(len(loads))]
+        self.optimizer_ids = [f'Optimizer-0.Optimizer-{2 * len(loads) + i}' for i in range(n)]
+        self.controller_ids = [f'Controller-0.Controller-{i}' for i in range(n)]
+        self.pss_ids = [f'PSS-0.PSS_{i}' for i in range(n)]
+
+        self.networks = [
+            OptimizerSim._pss_network({
+                'bus': pss['bus'],
+                'E_PSS_max_wh': pss['E_PSS_max_wh'],
+                'E_PSS_init_wh': pss['E_PSS_init_wh'],
+                'P_PSS_max_w': pss['P_PSS_max_w'],
+            })
+            for pss in pss_assets
+        ]
+        self.setpoints = {attr: np.zeros(n) for attr in ('p_ch_w', 'p_dis_w', 'p_total_w')}
+        self.dirty = True
+        self.load_p = np.zeros(len(loads))
+        self.generator_p = np.zeros(len(loads))
+        self.profiles = [
+            (getattr(self, f'{kind}_p'), i, load[f'{kind}_profile'])
+            for i, load in enumerate(loads) for kind in ('load', 'generator') if f'{kind}_profile' in load
+        ]
+        if self.profiles:
+            if datafile is None:
+                raise ValueError('Assets with load or generator profiles need a datafile')
+            self.store = ProfileStore(convert_csv(datafile, date_format))
+            unknown = sorted({column for _, _, column in self.profiles} - set(self.store.columns))
+            if unknown:
+                raise ValueError(f'Unknown profile columns {unknown}')
+            self.profile_columns = [self.store.columns[column] for _, _, column in self.profiles]
+            self.start = parse_time(sim_start, date_format)
+        self.bank = PIDControllerBank(
+            [pss['K_p'] for pss in pss_assets], [pss['K_i'] for pss in pss_assets], [pss['K_d'] for pss in pss_assets],
+        )
+        self.reference_value = np.zeros(n)
+        self.fleet = PSSFleet()
+        self.fleet.add(
+            n,
+            np.array([pss['pressure_wave_runtime'] for pss in pss_assets], dtype=float),
+            np.array([pss['P_PSS_max_w'] for pss in pss_assets], dtype=float),
+            np.array([pss['E_PSS_init_wh'] for pss in pss_assets], dtype=float),
+        )
+        self.indices = np.arange(n)
+        self.pump_operation = np.zeros(n)
+        self.pss_time = -1
+        self.records = {}
+
+    # ==== Components ====
+
+    def step_optimizer(self, time):
+        # The PSS states have no inputs here, so like OptimizerSim the
+        # setpoints are solved once and kept
+        if self.dirty:
+            results = solve_network_batch(
+                self.networks, solver=self.solver, problem=self.problem, mode=self.batch_mode, workers=self.workers,
+                cache=self.cache,
+            )
+            for i, result in enumerate(results):
+                self.setpoints['p_ch_w'][i] = result.P_BSS_ch_w[0]
+                self.setpoints['p_dis_w'][i] = result.P_BSS_dis_w[0]
+                self.setpoints['p_total_w'][i] = result.P_BSS_total_w[0]
+            self.dirty = False
+        self.load_p[:] = load_p(time)
+        self.generator_p[:] = generator_p(time)
+        if self.profiles:
+            start = self.start + time
+            values = self.store.sample(start, start + self.optimizer_step, self.profile_columns, 'mean')
+            for (target, i, _), value in zip(self.profiles, values.tolist()):
+                target[i] = value
+
+    def step_controller(self, time):
+        self.bank.step_changed(time, self.reference_value, self.setpoints['p_total_w'])
+
+    def step_pss(self, time, held=0):
+        # One step at `time` with the current controller outputs, then
+        # `held` further 1 s steps with the same inputs in closed form
+        if not len(self.indices):
+            return
+        delta = time - self.pss_time
+        self.fleet.step(self.indices, delta, self.bank.get_cumulative_value().copy(), self.pump_operation)
+        self.pss_time = time
+        if time % self.record_every == 0 or held:
+            self.record(time)
+        if held:
+            self.fleet.advance_held(held)
+            self.pss_time += held
+
+    # ==== Scheduler ====
+
+    def run(self, until):
+        # Steps all components up to (excluding) `until` and returns the
+        # recorded values, see results()
+        opt, ctrl = self.optimizer_step, self.controller_step
+        if self.pss_step == 'held':
+            period = math.gcd(opt, ctrl)
+            for time in range(0, until, period):
+                if time % opt == 0:
+                    self.step_optimizer(time)
+                if time % ctrl == 0:
+                    self.step_controller(time)
+                self.step_pss(time, held=min(period, until - time) - 1)
+        else:
+            for time in range(until):
+                if time % opt == 0:
+                    self.step_optimizer(time)
+                if time % ctrl == 0:
+                    self.step_controller(time)
+                self.step_pss(time)
+        return self.results()
+
+    # ==== Results ====
+
+    def record(self, time):
+        columns = [
+            (self.load_ids, 'load_p', self.load_p),
+            (self.generator_ids, 'generator_p', self.generator_p),
+            (self.controller_ids, 'summed_output', self.bank.get_cumulative_value()),
+            (self.controller_ids, 'current_value', self.bank.get_current_value()),
+            (self.pss_ids, 'turbine_generation', self.fleet.column('turbine_generation')),
+            (self.pss_ids, 'stored_energy_wh', self.fleet.column('stored_energy_wh')),
+        ]
+        columns += [(self.optimizer_ids, attr, values) for attr, values in self.setpoints.items()]
+        for ids, attr, values in columns:
+            if ids:
+                times, rows = self.records.setdefault((tuple(ids), attr), ([], []))
+                times.append(time)
+                rows.append(np.array(values, dtype=float))
+
+    def results(self):
+        # {(src, attr): (time, value)} like Collector.read_data
+        data = {}
+        for (ids, attr), (times, rows) in self.records.items():
+            time = np.array(times, dtype=np.int64)
+            values = np.array(rows).reshape(len(times), len(ids))
+            for column, src in enumerate(ids):
+                data[(src, attr)] = (time, values[:, column])
+        return data
+
+    def write(self, path, fmt='auto'):
+        # Writes the results in the Collector's output format
+        path, fmt = resolve_output(path, fmt)
+        sink = open_sink(path, fmt)
+        for (src, attr), (time, values) in sorted(self.results().items()):
+            sink.write(src, attr, time, values)
+        sink.close()
+        return path
@@ -1,6 +1,13 @@
+import time as clock
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import replace
+
+import numpy as np
 import mosaik_api
-import json
-from phaseone import run_dc_opf
+from phaseone import STATS, ADNArrays, SolutionCache, solve_network_batch
+from phasethree.checkpoint import Checkpointer
+from phasethree.profiling import StepProfiler, payload_bytes
+from phasethree.sim_logging import TRACE_GET_DATA, TRACE_STEP, SimLogger
 
 META = {
     'type': 'time-based',
@@ -8,7 +15,9 @@ META = {
         'PSS': {
             'public': True,
             'params': ['bus', 'E_PSS_max_wh', 'E_PSS_init_wh', 'P_PSS_max_w'],
-            'attrs': ['p_ch_w', 'p_dis_w', 'p_total_w'],
+            # E_PSS_init_wh and P_PSS_max_w can also be connected as inputs
+            # (stored energy and available power of the unit)
+            'attrs': ['p_ch_w', 'p_dis_w', 'p_total_w', 'E_PSS_init_wh', 'P_PSS_max_w'],
         },
         'Load': {
             'public': True,
@@ -23,15 +32,78 @@ META = {
     },
 }
 
+# PSS state that can be updated through inputs
+STATE_INPUTS = ('E_PSS_init_wh', 'P_PSS_max_w')
+STEP_SIZE = 900  # 15-minute steps
+EXECUTORS = {'thread': ThreadPoolExecutor, 'process': ProcessPoolExecutor}
+# Entity outputs in snapshots, per model
+CHECKPOINT_OUTPUTS = {
+    'PSS': ('p_ch_w', 'p_dis_w', 'p_total_w') + STATE_INPUTS,
+    'Load': ('load_p',),
+    'Generator': ('generator_p',),
+}
+
+
+def load_p(time):
+    # Dynamically vary load: e.g., sinusoidal pattern over a day
+    return 400.0 + 100.0 * ((time % 86400) / 86400)  # simulate ramp
+
+
+def generator_p(time):
+    # Dynamically vary generation
+    return 500.0 + 100.0 * ((time % 86400) / 43200)  # simulate cycle
+
+
 class OptimizerSim(mosaik_api.Simulator):
     def __init__(self):
         super().__init__(META)
         self.eid_prefix = 'Optimizer'
         self.entities = {}
         self.next_eid = 0
+        self.log = SimLogger('Optimizer')
+        self.profiler = StepProfiler('Optimizer')
+        self.checkpoint = Checkpointer()
 
-    def init(self, sid, time_resolution, **sim_params):
+    def init(self, sid, time_resolution, solver='auto', problem='auto', batch_mode='stack', workers=None,
+             cache_size=4096, cache_path=None, deadband=0.0, executor=None, publish_delay=60, log_level=None,
+             log_every=1, trace_file=None, profile=False, checkpoint_dir=None, checkpoint_every=3600,
+             restore_from=None, **sim_params):
         self.sid = sid
+        self.log.configure(log_level, log_every, trace_file)
+        self.profiler.configure(profile, sid=sid)
+        self.solver = solver
+        self.problem = problem
+        self.batch_mode = batch_mode
+        self.workers = workers
+        # Results of repeated optimizer states are reused (cache_size=0 disables)
+        self.cache = SolutionCache(cache_size, path=cache_path) if cache_size else None
+        # PSS entities are only re-solved when a state input moved by more
+        # than the deadband (W / Wh) since their last solve
+        self.deadband = deadband
+        self.solves = 0
+        self.skipped = 0
+        # With an executor ('thread' or 'process') solves run in the
+        # background: they are submitted at the start of each interval and
+        # published publish_delay seconds later, the previous setpoints are
+        # served until then. Setpoints therefore lag their state inputs by
+        # publish_delay, except in the first interval, which has no previous
+        # setpoints and is solved synchronously. The publish time does not
+        # depend on how long the solve takes (the step waits for it if
+        # needed), so results stay reproducible. Process workers do not
+        # share the solution cache.
+        if executor is not None and executor not in EXECUTORS:
+            raise ValueError(f"Unknown executor {executor!r}, expected one of {tuple(EXECUTORS)}")
+        if executor is not None and not 0 < publish_delay < STEP_SIZE:
+            raise ValueError(f'publish_delay must lie between 0 and {STEP_SIZE} s')
+        self.executor = EXECUTORS[executor](max_workers=1) if executor is not None else None
+        self.executor_type = executor
+        self.publish_delay = publish_delay
+        self.pending = None
+        self.first_solve = True
+        self.latencies = []  # (submit time, solve latency [s], time the step waited for it [s])
+        # Snapshots are taken at interval starts, where no background solve
+        # is in flight (publish_delay < STEP_SIZE)
+        self.checkpoint.configure(sid, checkpoint_dir, checkpoint_every, restore_from, STEP_SIZE)
         return self.meta
 
     def create(self, num, model, **model_params):
@@ -44,6 +116,7 @@ class OptimizerSim(mosaik_api.Simulator):
             outputs = {}
             if model == 'PSS':
                 outputs = {'p_ch_w': 0.0, 'p_dis_w': 0.0, 'p_total_w': 0.0}
+                outputs.update({attr: float(model_params[attr]) for attr in STATE_INPUTS})
             elif model == 'Load':
                 outputs = {'load_p': 0.0}
             elif model == 'Generator':
@@ -54,56 +127,204 @@ class OptimizerSim(mosaik_api.Simulator):
                 'params': model_params,
                 'outputs': outputs,
             }
+            if model == 'PSS':
+                # Validated once here and reused until a state input changes
+                self.entities[eid]['network'] = self._pss_network(model_params)
+                self.entities[eid]['dirty'] = True
             entities.append({'eid': eid, 'type': model})
         return entities
 
     def step(self, time, inputs, max_advance=None):
-        for eid, data in self.entities.items():
-            if data['model'] == 'PSS':
-                config_dict = {
-                    'adn': {
-                        'bus': [],
-                        'bss': [
-                            {
-                                'bus_id': data['params']['bus'],
-                                'E_BSS_max_wh': data['params']['E_PSS_max_wh'],
-                                'E_BSS_init_wh': data['params']['E_PSS_init_wh'],
-                                'P_BSS_max_w': data['params']['P_PSS_max_w'],
-                            }
-                        ],
-                        'line': [],
-                        'costs': {
-                            'import_now': 1.0,
-                            'export_now': 1.0,
-                            'import_next': 1.0,
-                            'export_next': 1.0,
-                        },
-                        'energy_imbalance_next_W': 0.0
-                    }
-                }
-
-                config_str = json.dumps(config_dict)
-                result_json = run_dc_opf(config_str)
-                result = json.loads(result_json)['result']['bss'][0]
-                data['outputs']['p_ch_w'] = result['P_BSS_ch_w']
-                data['outputs']['p_dis_w'] = result['P_BSS_dis_w']
-                data['outputs']['p_total_w'] = result['P_BSS_dis_w'] - result['P_BSS_ch_w']
-
-            elif data['model'] == 'Load':
-                # Dynamically vary load: e.g., sinusoidal pattern over a day
-                data['outputs']['load_p'] = 400.0 + 100.0 * ((time % 86400) / 86400)  # simulate ramp
-
-            elif data['model'] == 'Generator':
-                # Dynamically vary generation
-                data['outputs']['generator_p'] = 500.0 + 100.0 * ((time % 86400) / 43200)  # simulate cycle
-
-        print(f"[step] {self.sid} at time {time}")
-        return time + 900  # 15-minute steps
+        start = self.profiler.start()
+        time += self.checkpoint.offset
+        self.log.begin_step(time)
+        self.log.debug('[step] %s at time %s, inputs: %s', self.sid, time, inputs)
+        self.log.trace(TRACE_STEP, len(inputs))
+        self.checkpoint.step(time, self)
+
+        # Results of a background solve are published at their fixed time
+        if self.pending is not None and time >= self.pending['publish']:
+            self._publish(time)
+
+        # Solve the PSS entities whose state changed in one batched
+        # optimizer call, the others keep their outputs
+        pss_eids = [eid for eid, data in self.entities.items() if data['model'] == 'PSS']
+        for eid in pss_eids:
+            if eid in inputs:
+                self._apply_state(self.entities[eid], inputs[eid])
+
+        if time % STEP_SIZE == 0:
+            dirty = [eid for eid in pss_eids if self.entities[eid]['dirty']]
+            self.solves += len(dirty)
+            self.skipped += len(pss_eids) - len(dirty)
+            self.log.debug('[step] re-solving %s of %s PSS entities', len(dirty), len(pss_eids))
+            if self.executor is not None and not self.first_solve:
+                self._submit(time, pss_eids, dirty)
+            else:
+                self._solve(time, pss_eids, dirty, start)
+            self.first_solve = False
+
+            # Loads and generators follow a connected profile (e.g. a
+            # ProfileSim series) and fall back to the built-in ramps otherwise
+            for eid, data in self.entities.items():
+                if data['model'] == 'Load':
+                    profile = inputs.get(eid, {}).get('load_p')
+                    data['outputs']['load_p'] = float(sum(profile.values())) if profile else load_p(time)
 
+                elif data['model'] == 'Generator':
+                    profile = inputs.get(eid, {}).get('generator_p')
+                    data['outputs']['generator_p'] = float(sum(profile.values())) if profile else generator_p(time)
+
+        self.profiler.stop('step', start, time)
+        next_step = time - time % STEP_SIZE + STEP_SIZE
+        if self.pending is not None:
+            next_step = min(next_step, self.pending['publish'])
+        return next_step - self.checkpoint.offset
+
+    def _fleet(self, pss_eids, eids):
+        # The dirty entities are solved on the model of the whole fleet, so
+        # changing subsets do not build a new batch model each interval
+        position = {eid: i for i, eid in enumerate(pss_eids)}
+        return [self.entities[eid]['network'] for eid in pss_eids], [position[eid] for eid in eids]
+
+    def _solve(self, time, pss_eids, eids, start):
+        networks, indices = self._fleet(pss_eids, eids)
+        if start is not None:
+            stats = replace(STATS)
+            began = self.profiler.start()[0]
+        results = solve_network_batch(
+            networks, solver=self.solver, problem=self.problem, mode=self.batch_mode, workers=self.workers,
+            cache=self.cache, indices=indices,
+        )
+        if start is not None:
+            self.profiler.add_solve_stats(time, began, STATS.since(stats))
+        self._set_outputs(eids, results)
+        for eid in eids:
+            self.entities[eid]['dirty'] = False
+
+    def _submit(self, time, pss_eids, eids):
+        if not eids:
+            return
+        networks, indices = self._fleet(pss_eids, eids)
+        for eid in eids:
+            # Inputs arriving while the solve runs mark the entity again
+            self.entities[eid]['dirty'] = False
+        submitted = clock.perf_counter()
+        future = self.executor.submit(
+            solve_network_batch, networks, solver=self.solver, problem=self.problem, mode=self.batch_mode,
+            workers=self.workers, cache=self.cache if self.executor_type == 'thread' else None, indices=indices,
+        )
+        pending = {'eids': eids, 'time': time, 'publish': time + self.publish_delay, 'submitted': submitted}
+        future.add_done_callback(lambda _: pending.setdefault('done', clock.perf_counter()))
+        pending['future'] = future
+        self.pending = pending
+
+    def _publish(self, time):
+        pending, self.pending = self.pending, None
+        waited = clock.perf_counter()
+        results = pending['future'].result()
+        now = clock.perf_counter()
+        waited = now - waited
+        latency = pending.get('done', now) - pending['submitted']
+        self.latencies.append((pending['time'], latency, waited))
+        self.log.debug('[publish] %s at time %s: solve latency %.3f s, waited %.3f s', self.sid, time, latency, waited)
+        if self.profiler.enabled:
+            self.profiler.add('optimizer.async', pending['time'], pending['submitted'], latency, waited_s=waited)
+        self._set_outputs(pending['eids'], results)
+
+    def _set_outputs(self, eids, results):
+        for eid, result in zip(eids, results):
+            outputs = self.entities[eid]['outputs']
+            outputs['p_ch_w'] = float(result.P_BSS_ch_w[0])
+            outputs['p_dis_w'] = float(result.P_BSS_dis_w[0])
+            outputs['p_total_w'] = float(result.P_BSS_total_w[0])
+
+    def _apply_state(self, entity, entity_inputs):
+        # Replaces the solved state by connected inputs. Changes within the
+        # deadband are ignored, so slow drifts still trigger a re-solve once
+        # they add up.
+        network = entity['network']
+        solved = {'E_PSS_init_wh': float(network.bss_E_init_wh[0]), 'P_PSS_max_w': float(network.bss_P_max_w[0])}
+        state = dict(solved)
+        for attr in STATE_INPUTS:
+            if attr in entity_inputs:
+                state[attr] = float(sum(entity_inputs[attr].values()))
+        state['E_PSS_init_wh'] = min(max(state['E_PSS_init_wh'], 0.0), float(network.bss_E_max_wh[0]))
+        state['P_PSS_max_w'] = max(state['P_PSS_max_w'], 0.0)
+        if any(abs(state[attr] - solved[attr]) > self.deadband for attr in STATE_INPUTS):
+            entity['network'] = replace(
+                network, bss_E_init_wh=np.array([state['E_PSS_init_wh']]), bss_P_max_w=np.array([state['P_PSS_max_w']]),
+            )
+            entity['outputs'].update(state)
+            entity['dirty'] = True
+
+    def get_state(self):
+        arrays = {}
+        for model, attrs in CHECKPOINT_OUTPUTS.items():
+            entities = [data for data in self.entities.values() if data['model'] == model]
+            for attr in attrs:
+                arrays[f'{model}.{attr}'] = np.array([data['outputs'][attr] for data in entities], dtype=float)
+        pss = [data for data in self.entities.values() if data['model'] == 'PSS']
+        arrays['PSS.dirty'] = np.array([data['dirty'] for data in pss], dtype=bool)
+        meta = {
+            'entities': [[eid, data['model']] for eid, data in self.entities.items()],
+            'params': [data['params'] for data in pss],
+            'solves': self.solves,
+            'skipped': self.skipped,
+            'first_solve': self.first_solve,
+        }
+        return arrays, meta
+
+    def set_state(self, arrays, meta):
+        if meta['entities'] != [[eid, data['model']] for eid, data in self.entities.items()]:
+            raise ValueError(f'Snapshot of {self.sid} does not match the created entities')
+        for model, attrs in CHECKPOINT_OUTPUTS.items():
+            entities = [data for data in self.entities.values() if data['model'] == model]
+            for attr in attrs:
+                for data, value in zip(entities, arrays[f'{model}.{attr}'].tolist()):
+                    data['outputs'][attr] = value
+        pss = [data for data in self.entities.values() if data['model'] == 'PSS']
+        for data, params, dirty in zip(pss, meta['params'], arrays['PSS.dirty'].tolist()):
+            outputs = data['outputs']
+            data['network'] = replace(
+                data['network'], bss_E_init_wh=np.array([outputs['E_PSS_init_wh']]),
+                bss_P_max_w=np.array([outputs['P_PSS_max_w']]),
+            )
+            # A branched run with other parameters re-solves the entity
+            data['dirty'] = dirty or params != data['params']
+        self.solves = meta['solves']
+        self.skipped = meta['skipped']
+        self.first_solve = meta.get('first_solve', False)
+
+    @staticmethod
+    def _pss_network(params):
+        return ADNArrays(
+            bus_id=[],
+            bus_P_G_w=[],
+            bus_P_D_w=[],
+            slack_bus=None,
+            line_from=[],
+            line_to=[],
+            line_b=[],
+            line_P_max_w=[],
+            bss_bus_id=[params['bus']],
+            bss_P_max_w=[params['P_PSS_max_w']],
+            bss_E_max_wh=[params['E_PSS_max_wh']],
+            bss_E_init_wh=[params['E_PSS_init_wh']],
+            costs={
+                'import_now': 1.0,
+                'export_now': 1.0,
+                'import_next': 1.0,
+                'export_next': 1.0,
+            },
+            energy_imbalance_next_W=0.0,
+        )
 
 
     def get_data(self, outputs):
-        print(f"[get_data] Outputs requested: {outputs}")
+        start = self.profiler.start()
+        self.log.debug('[get_data] Outputs requested: %s', outputs)
+        self.log.trace(TRACE_GET_DATA, len(outputs))
         data = {}
         for eid, attrs in outputs.items():
             entity = self.entities[eid]
@@ -111,9 +332,26 @@ class OptimizerSim(mosaik_api.Simulator):
             for attr in attrs:
                 value = entity['outputs'].get(attr, 0.0)
                 data[eid][attr] = value
-        print(f"[get_data] Returning: {data}")
+        self.log.debug('[get_data] Returning: %s', data)
+        if start is not None:
+            self.profiler.stop('get_data', start, payload_bytes=payload_bytes(data))
         return data
 
+    def finalize(self):
+        self.log.info('[finalize] %s: %s PSS solves, %s skipped without state changes', self.sid, self.solves, self.skipped)
+        if self.latencies:
+            latency = np.array([entry[1] for entry in self.latencies])
+            waited = sum(entry[2] for entry in self.latencies)
+            self.log.info(
+                '[finalize] %s: %s background solves, latency mean %.3f s / max %.3f s, steps waited %.3f s in total',
+                self.sid, len(latency), latency.mean(), latency.max(), waited,
+            )
+        if self.executor is not None:
+            self.executor.shutdown()
+        self.log.close()
+        if self.cache is not None and self.cache.path is not None:
+            self.cache.save()
+
 
 def main():
     mosaik_api.start_simulation(OptimizerSim())
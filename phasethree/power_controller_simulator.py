@@ -1,53 +1,142 @@
 import mosaik_api
+import numpy as np
+from phasetwo import PIDControllerBank
+from phasethree.checkpoint import Checkpointer
+from phasethree.profiling import StepProfiler, payload_bytes
+from phasethree.sim_logging import TRACE_GET_DATA, TRACE_STEP, SimLogger
 
 META = {
     'api_version': '3.0',
     'type': 'time-based',
     'models': {
-        'Controller': {
+        'PowerController': {
             'public': True,
-            'params': [],
-            'attrs': ['dummy_output'],
+            'params': ['K_p', 'K_i', 'K_d', 'reference_value', 'max_integral', 'min_integral', 'max_cumulative', 'min_cumulative'],
+            'attrs': ['process_value', 'reference_value', 'summed_output', 'current_value'],
         }
     },
 }
 
+# Controller state in snapshots, the gains and limits come from the scenario
+# so a branched run can change them
+CHECKPOINT_ARRAYS = ('integral', 'previous_error', 'current_value', 'cumulative_value', 'last_time', 'settled')
+
 class ControllerSim(mosaik_api.Simulator):
     def __init__(self):
         super().__init__(META)
-        self.entities = {}
+        self.entities = {}  # Maps EIDs to indices in the controller bank
         self.eid_prefix = 'Controller'
+        self.bank = None
+        self.reference_value = np.zeros(0)
+        self.process_value = np.zeros(0)
+        self.step_size = 60
+        self.log = SimLogger('Controller')
+        self.profiler = StepProfiler('Controller')
+        self.checkpoint = Checkpointer()
 
-    def init(self, sid, time_resolution, **sim_params):
+    def init(self, sid, time_resolution, step_size=60, log_level=None, log_every=1, trace_file=None, profile=False,
+             checkpoint_dir=None, checkpoint_every=3600, restore_from=None, **sim_params):
         self.sid = sid
+        self.step_size = step_size
+        self.log.configure(log_level, log_every, trace_file)
+        self.profiler.configure(profile, sid=sid)
+        self.checkpoint.configure(sid, checkpoint_dir, checkpoint_every, restore_from, step_size)
         return self.meta
 
-    def create(self, num, model, **model_params):
+    def create(self, num, model, K_p, K_i, K_d, reference_value=0.0, max_integral=None, min_integral=None,
+               max_cumulative=None, min_cumulative=None):
+        bank = PIDControllerBank(
+            [K_p] * num, K_i, K_d,
+            max_cumulative=max_cumulative, min_cumulative=min_cumulative,
+            min_integral=min_integral, max_integral=max_integral,
+        )
+        if self.bank is None:
+            self.bank = bank
+            indices = range(num)
+        else:
+            indices = self.bank.extend(bank)
+        self.reference_value = np.concatenate([self.reference_value, np.full(num, reference_value, dtype=float)])
+        self.process_value = np.concatenate([self.process_value, np.zeros(num)])
+
         entities = []
-        for i in range(num):
-            eid = f'{self.eid_prefix}-{i}'
-            self.entities[eid] = {'dummy_output': 0.0}
+        for index in indices:
+            eid = f'{self.eid_prefix}-{index}'
+            self.entities[eid] = index
             entities.append({'eid': eid, 'type': model})
         return entities
 
     def step(self, time, inputs, max_advance=None):
-        print(f"[step] {self.sid} at time {time}")
-        return time + 60  # 1-minute timestep
+        start = self.profiler.start()
+        time += self.checkpoint.offset
+        self.checkpoint.step(time, self)
+        self.log.begin_step(time)
+        self.log.debug('[step] %s at time %s, inputs: %s', self.sid, time, inputs)
+        self.log.trace(TRACE_STEP, len(inputs))
+        for eid, attrs in inputs.items():
+            index = self.entities[eid]
+            if 'process_value' in attrs:
+                self.process_value[index] = sum(attrs['process_value'].values())
+            if 'reference_value' in attrs:
+                self.reference_value[index] = sum(attrs['reference_value'].values())
+
+        # Controllers at rest with unchanged inputs are not recomputed
+        if self.bank is not None:
+            self.bank.step_changed(time, self.reference_value, self.process_value)
+        self.profiler.stop('step', start, time)
+        return time + self.step_size - self.checkpoint.offset  # 1-minute timestep by default
 
     def get_data(self, outputs):
-        print(f"[get_data] Outputs requested: {outputs}")
+        start = self.profiler.start()
+        self.log.debug('[get_data] Outputs requested: %s', outputs)
+        self.log.trace(TRACE_GET_DATA, len(outputs))
         data = {}
+        columns = {}
         for eid, attrs in outputs.items():
-            model = self.entities[eid]
+            index = self.entities[eid]
             data[eid] = {}
             for attr in attrs:
-                if attr == 'summed_output':
-                    data[eid][attr] = model.summed_output  # Or whatever variable you use
-                elif attr == 'current_value':
-                    data[eid][attr] = model.current_value  # Same here
-        print(f"[get_data] Returning: {data}")
+                if attr not in columns:
+                    columns[attr] = self._column(attr).tolist()
+                data[eid][attr] = columns[attr][index]
+        self.log.debug('[get_data] Returning: %s', data)
+        if start is not None:
+            self.profiler.stop('get_data', start, payload_bytes=payload_bytes(data))
         return data
 
+    def get_state(self):
+        if self.bank is None:
+            return {}, {'entities': []}
+        arrays = {name: getattr(self.bank, name) for name in CHECKPOINT_ARRAYS + ('kp', 'ki', 'kd')}
+        arrays.update(reference_value=self.reference_value, process_value=self.process_value)
+        return arrays, {'entities': list(self.entities)}
+
+    def set_state(self, arrays, meta):
+        if meta['entities'] != list(self.entities):
+            raise ValueError(f'Snapshot of {self.sid} does not match the created controllers')
+        if self.bank is None:
+            return
+        for name in CHECKPOINT_ARRAYS:
+            setattr(self.bank, name, arrays[name].astype(getattr(self.bank, name).dtype))
+        # Controllers with changed gains are stepped again even if at rest
+        for name in ('kp', 'ki', 'kd'):
+            self.bank.settled &= arrays[name] == getattr(self.bank, name)
+        self.reference_value = arrays['reference_value'].copy()
+        self.process_value = arrays['process_value'].copy()
+
+    def finalize(self):
+        self.log.close()
+
+    def _column(self, attr):
+        if attr == 'summed_output':
+            return self.bank.get_cumulative_value()
+        if attr == 'current_value':
+            return self.bank.get_current_value()
+        if attr == 'process_value':
+            return self.process_value
+        if attr == 'reference_value':
+            return self.reference_value
+        raise ValueError(f"Unknown output attribute {attr}")
+
 
 def main():
     mosaik_api.start_simulation(ControllerSim())
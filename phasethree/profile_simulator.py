@@ -0,0 +1,287 @@
+import calendar
+import csv
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime
+
+import numpy as np
+import mosaik_api_v3
+from phasethree.checkpoint import Checkpointer
+
+STORE_FORMATS = ('npy', 'parquet')
+RESAMPLE_MODES = ('hold', 'mean')
+CHUNK_ROWS = 65536
+
+
+def parse_time(text, date_format):
+    # UTC epoch seconds. Naive timestamps are taken as UTC, ones with an
+    # offset are converted to it.
+    text = text.strip()
+    try:
+        date = datetime.strptime(text, date_format) if date_format else datetime.fromisoformat(text)
+    except ValueError:
+        date = datetime.fromisoformat(text)
+    return calendar.timegm(date.utctimetuple())
+
+
+def _read_header(datafile, delimiter):
+    # mosaik_csv layout: an optional line with the model name, then the
+    # header (date column + one column per attribute, '#' starts a comment)
+    with open(datafile, newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        first = next(reader)
+        model, header, skip = ('Data', first, 1) if len(first) > 1 else (first[0].strip(), next(reader), 2)
+    attrs = [column.split('#')[0].strip() for column in header[1:]]
+    return model, attrs, skip
+
+
+def _is_data_row(row):
+    # Blank and whitespace-only lines are skipped
+    return any(field.strip() for field in row)
+
+
+def _is_current(meta_path, source):
+    try:
+        with open(meta_path) as f:
+            return json.load(f).get('source') == source
+    except (OSError, ValueError):
+        return False
+
+
+def convert_csv(datafile, date_format=None, delimiter=',', store_format='npy'):
+    # Converts a mosaik_csv style file once into a columnar store next to it
+    # (<datafile>.profile/ with NPY arrays, or <datafile>.parquet) and
+    # returns its path. The store is reused while the CSV is unchanged.
+    # Several processes (e.g. sweep workers) may convert the same file at
+    # once: each writes to a temporary name that is moved into place, so a
+    # store that another process already reads is never rewritten.
+    if store_format not in STORE_FORMATS:
+        raise ValueError(f"Unknown store format {store_format!r}, expected one of {STORE_FORMATS}")
+    path = f'{datafile}.profile' if store_format == 'npy' else f'{datafile}.parquet'
+    stat = os.stat(datafile)
+    source = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    meta_path = os.path.join(path, 'meta.json') if store_format == 'npy' else f'{path}.json'
+    if _is_current(meta_path, source):
+        return path
+
+    model, attrs, skip = _read_header(datafile, delimiter)
+    with open(datafile, newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        for _ in range(skip):
+            next(reader)
+        n_rows = sum(1 for row in reader if _is_data_row(row))
+
+    # Parse in chunks straight into the output arrays
+    directory, name = os.path.split(os.path.abspath(path))
+    tmp = tempfile.mkdtemp(prefix=f'.{name}.', dir=directory)
+    if store_format == 'npy':
+        times = np.lib.format.open_memmap(os.path.join(tmp, 'time.npy'), mode='w+', dtype=np.int64, shape=(n_rows,))
+        values = np.lib.format.open_memmap(os.path.join(tmp, 'values.npy'), mode='w+', dtype=np.float64, shape=(n_rows, len(attrs)))
+    else:
+        times = np.empty(n_rows, dtype=np.int64)
+        values = np.empty((n_rows, len(attrs)))
+
+    with open(datafile, newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        for _ in range(skip):
+            next(reader)
+        row_index = 0
+        chunk = []
+        for row in reader:
+            if _is_data_row(row):
+                chunk.append(row)
+            if len(chunk) == CHUNK_ROWS:
+                _store_chunk(chunk, row_index, times, values, date_format)
+                row_index += len(chunk)
+                chunk = []
+        _store_chunk(chunk, row_index, times, values, date_format)
+
+    if np.any(np.diff(times) <= 0):
+        shutil.rmtree(tmp)
+        raise ValueError(f"Timestamps in {datafile} must be strictly increasing")
+
+    meta = {'model': model, 'attrs': attrs, 'source': source}
+    if store_format == 'npy':
+        times.flush()
+        values.flush()
+        del times, values
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        _replace_dir(tmp, path, meta_path, source)
+    else:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table({'time': times, **{attr: values[:, i] for i, attr in enumerate(attrs)}})
+        pq.write_table(table, os.path.join(tmp, 'store.parquet'), compression='none')
+        with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        # The table is moved first, so a current meta file always describes it
+        os.replace(os.path.join(tmp, 'store.parquet'), path)
+        os.replace(os.path.join(tmp, 'meta.json'), meta_path)
+        shutil.rmtree(tmp)
+    return path
+
+
+def _replace_dir(tmp, path, meta_path, source):
+    # Directories cannot be replaced atomically while the target exists, so
+    # an outdated store is renamed away first (processes that mapped it keep
+    # their open files). If another process moved a current store into
+    # place in the meantime, that one is kept.
+    for _ in range(3):
+        try:
+            os.rename(tmp, path)
+            return
+        except OSError:
+            if _is_current(meta_path, source):
+                shutil.rmtree(tmp)
+                return
+        outdated = tempfile.mkdtemp(prefix=f'.{os.path.basename(path)}.old.', dir=os.path.dirname(tmp))
+        try:
+            os.replace(path, outdated)
+        except FileNotFoundError:
+            pass
+        shutil.rmtree(outdated, ignore_errors=True)
+    os.rename(tmp, path)
+
+
+def _store_chunk(chunk, start, times, values, date_format):
+    if not chunk:
+        return
+    end = start + len(chunk)
+    times[start:end] = [parse_time(row[0], date_format) for row in chunk]
+    values[start:end] = np.array([[float(v) if v.strip() else np.nan for v in row[1:]] for row in chunk])
+
+
+class ProfileStore:
+    # Columnar time series: `time` holds UTC epoch seconds of each row,
+    # `values` one column per attribute. NPY stores are memory-mapped, so
+    # only the rows that are actually served are read from disk.
+    def __init__(self, path):
+        if path.endswith('.parquet'):
+            import pyarrow.parquet as pq
+            with open(f'{path}.json') as f:
+                meta = json.load(f)
+            table = pq.read_table(path, memory_map=True)
+            self.time = table.column('time').to_numpy()
+            self.values = np.column_stack([table.column(attr).to_numpy() for attr in meta['attrs']])
+        else:
+            with open(os.path.join(path, 'meta.json')) as f:
+                meta = json.load(f)
+            self.time = np.load(os.path.join(path, 'time.npy'), mmap_mode='r')
+            self.values = np.load(os.path.join(path, 'values.npy'), mmap_mode='r')
+        self.model = meta['model']
+        self.attrs = meta['attrs']
+        self.columns = {attr: i for i, attr in enumerate(self.attrs)}
+
+    def resolution(self):
+        # Typical spacing of the rows in seconds
+        return int(np.median(np.diff(self.time[:1000]))) if len(self.time) > 1 else 1
+
+    def sample(self, start, end, columns, how='hold'):
+        # Values of `columns` for the interval [start, end): the last row at
+        # or before start ('hold'), or the mean of the rows inside the
+        # interval ('mean', falling back to 'hold' if there are none)
+        first = max(int(np.searchsorted(self.time, start, side='right')) - 1, 0)
+        if how == 'mean':
+            last = int(np.searchsorted(self.time, end, side='left'))
+            inside = int(np.searchsorted(self.time, start, side='left'))
+            if last > inside:
+                return np.asarray(self.values[inside:last, columns]).mean(axis=0)
+        return np.asarray(self.values[first, columns])
+
+
+class ProfileSim(mosaik_api_v3.Simulator):
+    # Drop-in for mosaik_csv's CSV simulator that serves values from a
+    # columnar store instead of parsing the CSV on every run. Entities of
+    # the file's model expose all columns as attributes like mosaik_csv;
+    # 'Series' entities (param `column`) expose a single column as 'value',
+    # so thousands of bus profiles can be served from one array slice per
+    # step. Values are resampled to `step_size` ('hold' or 'mean').
+    def __init__(self):
+        super().__init__({'type': 'time-based', 'models': {}})
+        self.store = None
+        self.start = 0
+        self.step_size = None
+        self.resample = 'hold'
+        self.entities = {}  # Maps EIDs to column indices (None for all columns)
+        self.series_columns = []
+        self.current = None
+        self.current_series = None
+        self.checkpoint = Checkpointer()
+
+    def init(self, sid, time_resolution, sim_start, datafile, date_format=None, type='time-based', delimiter=',',
+             step_size=None, resample='hold', store_format='npy', checkpoint_dir=None, checkpoint_every=3600,
+             restore_from=None):
+        if resample not in RESAMPLE_MODES:
+            raise ValueError(f"Unknown resample mode {resample!r}, expected one of {RESAMPLE_MODES}")
+        if type != 'time-based':
+            raise ValueError('ProfileSim only supports time-based stepping')
+        self.sid = sid
+        self.time_resolution = float(time_resolution)
+        self.store = ProfileStore(convert_csv(datafile, date_format, delimiter, store_format))
+        self.start = parse_time(sim_start, date_format)
+        self.step_size = step_size or max(int(self.store.resolution() / self.time_resolution), 1)
+        self.resample = resample
+        # Profiles have no state, their snapshot only carries the time a
+        # restored run continues at
+        self.checkpoint.configure(sid, checkpoint_dir, checkpoint_every, restore_from, self.step_size)
+
+        self.meta['models'][self.store.model] = {'public': True, 'params': [], 'attrs': self.store.attrs}
+        self.meta['models']['Series'] = {'public': True, 'params': ['column'], 'attrs': ['value']}
+        return self.meta
+
+    def create(self, num, model, column=None):
+        entities = []
+        if model == 'Series':
+            columns = [column] * num if isinstance(column, str) else list(column)
+            if len(columns) != num:
+                raise ValueError('Need one column per Series entity')
+            for name in columns:
+                if name not in self.store.columns:
+                    raise ValueError(f'Unknown column {name!r}')
+                eid = f'Series_{len(self.entities)}'
+                self.entities[eid] = len(self.series_columns)
+                self.series_columns.append(self.store.columns[name])
+                entities.append({'eid': eid, 'type': model})
+            return entities
+
+        if model != self.store.model:
+            raise ValueError(f'Invalid model "{model}"')
+        for _ in range(num):
+            eid = f'{model}_{len(self.entities)}'
+            self.entities[eid] = None
+            entities.append({'eid': eid, 'type': model})
+        return entities
+
+    def step(self, time, inputs, max_advance):
+        time += self.checkpoint.offset
+        self.checkpoint.step(time, self)
+        start = self.start + time * self.time_resolution
+        end = start + self.step_size * self.time_resolution
+        if any(column is None for column in self.entities.values()):
+            self.current = dict(zip(self.store.attrs, self.store.sample(start, end, slice(None), self.resample).tolist()))
+        if self.series_columns:
+            self.current_series = self.store.sample(start, end, self.series_columns, self.resample).tolist()
+        return time + self.step_size - self.checkpoint.offset
+
+    def get_state(self):
+        return {}, {}
+
+    def set_state(self, arrays, meta):
+        pass
+
+    def get_data(self, outputs):
+        data = {}
+        for eid, attrs in outputs.items():
+            column = self.entities[eid]
+            if column is None:
+                data[eid] = {attr: self.current[attr] for attr in attrs}
+            else:
+                data[eid] = {attr: self.current_series[column] for attr in attrs}
+        return data
+
+
+if __name__ == '__main__':
+    mosaik_api_v3.start_simulation(ProfileSim())
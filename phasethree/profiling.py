@@ -0,0 +1,166 @@
+import json
+import time
+
+# Enabled profilers of the simulators running in this process, by sid.
+# run_profiled clears it after reporting, so every world reports only its
+# own simulators.
+PROFILERS = {}
+
+OPTIMIZER_PHASES = ("build", "update", "solve", "extract")
+# Events that mosaik calls directly; anything else is nested inside them
+TOP_LEVEL_EVENTS = ("step", "get_data")
+
+
+class StepProfiler:
+    # Records wall and CPU time of a simulator's step/get_data calls (and
+    # any other named event) when enabled. Totals are kept per event;
+    # individual events are kept for the timeline up to `max_events`.
+    # Simulators call start() at the top of a call and stop() before
+    # returning; both are no-ops while profiling is disabled.
+    def __init__(self, name):
+        self.name = name
+        self.sid = name
+        self.enabled = False
+        self.max_events = 0
+        self.totals = {}
+        self.events = []
+        self.time = 0  # Simulation time of the last step
+
+    def configure(self, enabled=False, max_events=1_000_000, sid=None):
+        # Reports are keyed by sid, so several instances of a simulator are
+        # kept apart
+        self.enabled = bool(enabled)
+        self.max_events = max_events
+        if sid is not None:
+            self.sid = sid
+        self.reset()
+        if self.enabled:
+            PROFILERS[self.sid] = self
+
+    def start(self):
+        if not self.enabled:
+            return None
+        return time.perf_counter(), time.process_time()
+
+    def stop(self, event, start, sim_time=None, **args):
+        # Records the event begun at `start`; args (e.g. payload_bytes) are
+        # summed per event and attached to the timeline entry. Without
+        # sim_time the event belongs to the last step.
+        if start is None:
+            return
+        if sim_time is None:
+            sim_time = self.time
+        self.time = sim_time
+        wall = time.perf_counter() - start[0]
+        cpu = time.process_time() - start[1]
+        self.add(event, sim_time, start[0], wall, cpu, **args)
+
+    def add(self, event, sim_time, began, wall, cpu=0.0, **args):
+        totals = self.totals.get(event)
+        if totals is None:
+            totals = self.totals[event] = {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_wall_s": 0.0}
+        totals["count"] += 1
+        totals["wall_s"] += wall
+        totals["cpu_s"] += cpu
+        totals["max_wall_s"] = max(totals["max_wall_s"], wall)
+        for key, value in args.items():
+            totals[key] = totals.get(key, 0) + value
+        if len(self.events) < self.max_events:
+            self.events.append((event, sim_time, began, wall, args))
+
+    def add_solve_stats(self, sim_time, began, stats):
+        # Splits an optimizer call into its build/update/solve/extract phases
+        # (a phaseone.SolveStats delta). The phases run one after another, so
+        # they are laid out back to back from `began` on the timeline.
+        for phase in OPTIMIZER_PHASES:
+            seconds = getattr(stats, f"{phase}_s")
+            if seconds > 0:
+                self.add(f"optimizer.{phase}", sim_time, began, seconds)
+                began += seconds
+        totals = self.totals.setdefault("optimizer.solve", {"count": 0, "wall_s": 0.0, "cpu_s": 0.0, "max_wall_s": 0.0})
+        totals["solves"] = totals.get("solves", 0) + stats.solves
+        totals["builds"] = totals.get("builds", 0) + stats.builds
+
+    def reset(self):
+        self.totals = {}
+        self.events = []
+
+
+def payload_bytes(data):
+    # Size of a get_data response as mosaik would send it over the wire
+    return len(json.dumps(data, default=str))
+
+
+def summary(total_wall_s=None):
+    # Per simulator and event totals of all enabled profilers. With the
+    # total run time, the part not spent inside simulator calls is reported
+    # as mosaik overhead (scheduling, data exchange, waiting).
+    report = {sid: profiler.totals for sid, profiler in PROFILERS.items()}
+    if total_wall_s is not None:
+        inside = sum(
+            totals["wall_s"]
+            for events in report.values()
+            for event, totals in events.items()
+            if event in TOP_LEVEL_EVENTS
+        )
+        report["mosaik"] = {"overhead": {"count": 1, "wall_s": total_wall_s - inside, "cpu_s": 0.0, "max_wall_s": 0.0}}
+        report["total_wall_s"] = total_wall_s
+    return report
+
+
+def format_summary(report):
+    lines = [f"{'simulator':<14}{'event':<20}{'count':>9}{'wall [s]':>12}{'cpu [s]':>12}{'mean [ms]':>12}{'max [ms]':>12}"]
+    for name, events in report.items():
+        if not isinstance(events, dict):
+            continue
+        for event, totals in sorted(events.items()):
+            count = totals["count"]
+            mean = 1e3 * totals["wall_s"] / count if count else 0.0
+            extra = "  ".join(f"{key}={totals[key]}" for key in sorted(totals) if key not in ("count", "wall_s", "cpu_s", "max_wall_s"))
+            lines.append(
+                f"{name:<14}{event:<20}{count:>9}{totals['wall_s']:>12.3f}{totals['cpu_s']:>12.3f}"
+                f"{mean:>12.3f}{1e3 * totals['max_wall_s']:>12.3f}  {extra}".rstrip()
+            )
+    if "total_wall_s" in report:
+        lines.append(f"total wall time: {report['total_wall_s']:.3f} s")
+    return "\n".join(lines)
+
+
+def write_chrome_trace(path):
+    # Complete ("X") events in the Chrome trace event format, one thread per
+    # simulator; open in chrome://tracing, Perfetto or speedscope
+    events = []
+    origin = min((profiler.events[0][2] for profiler in PROFILERS.values() if profiler.events), default=0.0)
+    for tid, (sid, profiler) in enumerate(PROFILERS.items()):
+        events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": sid}})
+        for event, sim_time, began, wall, args in profiler.events:
+            events.append({
+                "name": event,
+                "cat": profiler.name,
+                "ph": "X",
+                "pid": 1,
+                "tid": tid,
+                "ts": 1e6 * (began - origin),
+                "dur": 1e6 * wall,
+                "args": dict(args, sim_time=sim_time),
+            })
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+def run_profiled(world, until, report_path=None, trace_path=None, **run_kwargs):
+    # world.run() followed by the profiling summary of all simulators that
+    # were started with profile=True. Prints the summary, optionally writes
+    # it as JSON to report_path and the timeline to trace_path, then forgets
+    # the profilers of this world.
+    start = time.perf_counter()
+    world.run(until=until, **run_kwargs)
+    report = summary(time.perf_counter() - start)
+    print(format_summary(report))
+    if report_path is not None:
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=4)
+    if trace_path is not None:
+        write_chrome_trace(trace_path)
+    PROFILERS.clear()
+    return report
@@ -1,6 +1,11 @@
 import mosaik_api_v3
+import copy
 import math
+import numpy as np
 import matplotlib.pyplot as plt
+from phasethree.checkpoint import Checkpointer
+from phasethree.profiling import StepProfiler, payload_bytes
+from phasethree.sim_logging import TRACE_GET_DATA, TRACE_STEP, SimLogger
 
 META = {
     "type": "time-based",
@@ -13,23 +18,66 @@ META = {
     }
 }
 
+# Unit state in snapshots, the unit parameters come from the scenario
+CHECKPOINT_ARRAYS = ("last_input", "last_time", "value", "energy", "pump_operation")
+
 
 class PSSSimulator(mosaik_api_v3.Simulator):
 
     def __init__(self):
         super().__init__(META)
         self.eid_prefix = "PSS_"
-        self.entities = {}  # Maps EIDS to PSS instances
+        self.entities = {}  # Maps EIDS to indices in the fleet arrays
+        self.fleet = PSSFleet()
         self.time = -1
+        self.adaptive = False
+        self.tolerance = 1e-3
+        self.max_step = 900
+        self.step_size = 1
+        self.log = SimLogger("PSS")
+        self.profiler = StepProfiler("PSS")
+        self.checkpoint = Checkpointer()
 
-    def init(self, sid, time_resolution=1.0, eid_prefix=None):
+    def init(self, sid, time_resolution=1.0, eid_prefix=None, step_size=1, adaptive=False, tolerance=1e-3, max_step=900,
+             log_level=None, log_every=1, trace_file=None, profile=False, checkpoint_dir=None, checkpoint_every=3600,
+             restore_from=None):
         if float(time_resolution) != 1:
             raise ValueError("Unsupported Time resolution")
         
         if eid_prefix is not None:
             self.eid_prefix = eid_prefix
+
+        # With step_size > 1 the simulator steps every `step_size` seconds and
+        # integrates the seconds in between in closed form (see held_step).
+        # For valve and pump inputs that only change at multiples of
+        # step_size (e.g. step_size=60 behind a 60 s controller) the results
+        # at the step times equal the 1 s reference up to floating point
+        # rounding (relative error below 1e-9); inputs changing in between
+        # are sampled at the step times.
+        if step_size < 1:
+            raise ValueError("step_size must be at least 1 second")
+        self.step_size = int(step_size)
+
+        # In adaptive mode the simulator only steps when new inputs arrive or
+        # the transfer function transient decays below `tolerance` (in W),
+        # at most every `max_step` seconds. The seconds in between are
+        # integrated in closed form as if held inputs arrived every second.
+        self.adaptive = adaptive
+        self.tolerance = tolerance
+        self.max_step = max_step
+        if adaptive:
+            self.meta = copy.deepcopy(self.meta)
+            self.meta["type"] = "hybrid"
+            self.meta["models"]["PSS"]["trigger"] = ["valve_opening", "pump_operation"]
         
+        self.log.configure(log_level, log_every, trace_file)
+        self.profiler.configure(profile, sid=sid)
         self.sid = sid
+
+        # Adaptive steps are not aligned to the snapshot times
+        if adaptive and (checkpoint_dir is not None or restore_from is not None):
+            raise ValueError("Snapshots are not supported in adaptive mode")
+        self.checkpoint.configure(sid, checkpoint_dir, checkpoint_every, restore_from, self.step_size)
         return self.meta
 
     def create(self, num, model, **model_params):
@@ -39,58 +87,213 @@ class PSSSimulator(mosaik_api_v3.Simulator):
         next_eid = len(self.entities)
         entities = []
 
-        for i in range(next_eid, next_eid + num):
-            model_instance = PSS(wave_rt, nominal_power, energy)
+        indices = self.fleet.add(num, wave_rt, nominal_power, energy)
+        for i, index in zip(range(next_eid, next_eid + num), indices):
             eid = "%s%d" % (self.eid_prefix, i)
-            self.entities[eid] = model_instance
+            self.entities[eid] = index
             entities.append({"eid": eid, "type": model})
         return entities
 
 
 
     def step(self, time, inputs, max_advance):
+        start = self.profiler.start()
+        time += self.checkpoint.offset
+        self.log.begin_step(time)
+        self.log.debug("[step] %s at time %s, inputs: %s", self.sid, time, inputs)
+        self.log.trace(TRACE_STEP, len(inputs))
+        self.checkpoint.step(time, self)
         delta = time - self.time
-        # Check for new delta and do step for each model instance
-        for eid, model_instance in list(self.entities.items()):
-            if eid in inputs:
-                attrs = inputs[eid]
-                assert len(attrs["valve_opening"].keys()) == 1
-                assert len(attrs["pump_operation"].keys()) == 1
-                input_signal = list(attrs["valve_opening"].values())[0]
-                pump_operation = list(attrs["valve_opening"].values())[0]
-                transfer_function_time = delta
-                if input_signal == model_instance.last_input:
-                    transfer_function_time += model_instance.last_time
-                model_instance.compute_at_time(transfer_function_time, input_signal)
-                model_instance.compute_storage_change(pump_operation, delta)
+        # Gather the inputs and advance all receiving units in one update
+        indices = []
+        valve_openings = []
+        pump_operations = []
+        for eid, attrs in inputs.items():
+            assert len(attrs["valve_opening"].keys()) == 1
+            indices.append(self.entities[eid])
+            valve_openings.append(list(attrs["valve_opening"].values())[0])
+            pump_operation = attrs.get("pump_operation", {})
+            assert len(pump_operation.keys()) <= 1
+            pump_operations.append(list(pump_operation.values())[0] if pump_operation else 0.0)
+        indices = np.array(indices, dtype=int)
+        valve_openings = np.array(valve_openings, dtype=float)
+        pump_operations = np.array(pump_operations, dtype=float)
+
+        if self.adaptive:
+            next_step = self.adaptive_step(delta, indices, valve_openings, pump_operations)
+        elif self.step_size > 1:
+            self.held_step(delta, indices, valve_openings, pump_operations)
+            next_step = self.step_size
+        else:
+            if indices.size:
+                self.fleet.step(indices, delta, valve_openings, pump_operations)
+            next_step = 1
         self.time = time
-        print(f"[step] {self.sid} at time {time}")
-        return time + 1
+        self.profiler.stop("step", start, time)
+        return time + next_step - self.checkpoint.offset
+
+    def adaptive_step(self, delta, indices, valve_openings, pump_operations):
+        self.held_step(delta, indices, valve_openings, pump_operations)
+        settle = self.fleet.settle_steps(self.tolerance)
+        return self.max_step if settle is None else int(min(max(settle, 1), self.max_step))
+
+    def held_step(self, delta, indices, valve_openings, pump_operations):
+        # Replay the skipped seconds with the held inputs, then take the
+        # current second with the new inputs like a 1 s step would
+        if delta > 1:
+            self.fleet.advance_held(delta - 1)
+
+        valve = self.fleet.last_input.copy()
+        pump = self.fleet.pump_operation.copy()
+        valve[indices] = valve_openings
+        pump[indices] = pump_operations
+        active = np.flatnonzero(~np.isnan(valve))
+        if active.size:
+            self.fleet.step(active, 1, valve[active], pump[active])
 
 
     def get_data(self, outputs):
-        print(f"[get_data] Outputs requested: {outputs}")
+        start = self.profiler.start()
+        self.log.debug("[get_data] Outputs requested: %s", outputs)
+        self.log.trace(TRACE_GET_DATA, len(outputs))
         data = {}
+        columns = {}
         for eid, attrs in list(outputs.items()):
-            model = self.entities[eid]
-            # data["time"] = self.time
+            index = self.entities[eid]
             data[eid] = {}
             for attr in attrs:
-                if attr not in self.meta["models"]["PSS"]["attrs"]:
-                    raise ValueError("Unknown output attribute %s" % attr)
-                if attr == "total_output":
-                    data[eid][attr] = -model.get_value() + model.pump_operation
-                if attr == "stored_energy_wh":
-                    data[eid][attr] = model.get_energy()
-                if attr == "turbine_generation":
-                    data[eid][attr] = model.get_value()
-        print(f"[get_data] Returning: {data}")
+                if attr not in columns:
+                    if attr not in self.meta["models"]["PSS"]["attrs"]:
+                        raise ValueError("Unknown output attribute %s" % attr)
+                    columns[attr] = self.fleet.column(attr).tolist()
+                data[eid][attr] = columns[attr][index]
+        self.log.debug("[get_data] Returning: %s", data)
+        if start is not None:
+            self.profiler.stop("get_data", start, payload_bytes=payload_bytes(data))
         return data
 
+    def get_state(self):
+        arrays = {name: getattr(self.fleet, name) for name in CHECKPOINT_ARRAYS}
+        return arrays, {"entities": list(self.entities), "last_step": self.time}
+
+    def set_state(self, arrays, meta):
+        if meta["entities"] != list(self.entities):
+            raise ValueError("Snapshot of %s does not match the created PSS units" % self.sid)
+        for name in CHECKPOINT_ARRAYS:
+            setattr(self.fleet, name, arrays[name].astype(float))
+        self.time = meta["last_step"]
+
+    def finalize(self):
+        self.log.close()
+
+
+
+class PSSFleet:
+    # Array-backed state of many PSS units. Follows the same equations as
+    # PSS, but advances all units that received inputs in one vectorized
+    # update.
+
+    def __init__(self):
+        self.pressure_wave_runtime = np.zeros(0)
+        self.nominal_power = np.zeros(0)
+        self.last_input = np.zeros(0)  # NaN until the first input
+        self.last_time = np.zeros(0)
+        self.value = np.zeros(0)
+        self.energy = np.zeros(0)
+        self.pump_operation = np.zeros(0)
+
+    def __len__(self):
+        return len(self.value)
+
+    def add(self, num, pressure_wave_runtime, nominal_power, energy):
+        start = len(self)
+
+        def grow(array, fill):
+            return np.concatenate([array, np.full(num, fill, dtype=float)])
+
+        self.pressure_wave_runtime = grow(self.pressure_wave_runtime, pressure_wave_runtime)
+        self.nominal_power = grow(self.nominal_power, nominal_power)
+        self.last_input = grow(self.last_input, np.nan)
+        self.last_time = grow(self.last_time, 0.0)
+        self.value = grow(self.value, 0.0)
+        self.energy = grow(self.energy, energy)
+        self.pump_operation = grow(self.pump_operation, 0.0)
+        return range(start, start + num)
+
+    def step(self, indices, delta, valve_opening, pump_operation):
+        # Transfer function time keeps running while the input is unchanged
+        transfer_function_time = np.where(valve_opening == self.last_input[indices], self.last_time[indices] + delta, delta)
+        self.compute_at_time(indices, transfer_function_time, valve_opening)
+        self.compute_storage_change(indices, pump_operation, delta)
+
+    def compute_at_time(self, indices, time, input):
+        time_scale = 1000
+        t = time * time_scale
+        output = 1 - 3 * np.exp(-1 / self.pressure_wave_runtime[indices] * t)
+        nominal_power = self.nominal_power[indices]
+        scaled_output = output * input / nominal_power
+        self.last_time[indices] = time
+        self.last_input[indices] = input
+        self.value[indices] += scaled_output * nominal_power
+
+    def compute_storage_change(self, indices, pump_operation, delta):
+        # delta in seconds
+        delta_in_h = delta / 3600
+        self.pump_operation[indices] = pump_operation
+        self.energy[indices] -= self.value[indices] * delta_in_h
+        self.energy[indices] -= pump_operation * delta_in_h
+
+    def advance_held(self, steps):
+        # Closed form of `steps` 1 s steps with every unit's last input held:
+        # the transient term sums to a geometric series in exp(-c).
+        indices = np.flatnonzero(~np.isnan(self.last_input))
+        if steps <= 0 or not indices.size:
+            return
+
+        time_scale = 1000
+        valve = self.last_input[indices]
+        c = time_scale / self.pressure_wave_runtime[indices]
+        q = np.exp(-c * self.last_time[indices])
+        r = np.exp(-c)
+        one_minus_r = -np.expm1(-c)
+        # sum_{i=1..n} r^i and sum_{k=1..n} sum_{i=1..k} r^i
+        g1 = r * -np.expm1(-c * steps) / one_minus_r
+        g2 = r * (steps - g1) / one_minus_r
+
+        value = self.value[indices]
+        summed_value = steps * value + valve * (steps * (steps + 1) / 2 - 3 * q * g2)
+        self.value[indices] = value + valve * (steps - 3 * q * g1)
+        self.energy[indices] -= (summed_value + steps * self.pump_operation[indices]) / 3600
+        self.last_time[indices] += steps
+
+    def settle_steps(self, tolerance):
+        # Seconds until the transient 3 * input * exp(-t / runtime) of every
+        # unit is below tolerance, or None if all have settled
+        held = ~np.isnan(self.last_input)
+        amplitude = 3 * np.abs(self.last_input[held])
+        c = 1000 / self.pressure_wave_runtime[held]
+        with np.errstate(divide="ignore"):
+            steps = np.ceil(np.log(amplitude / tolerance) / c - self.last_time[held])
+        steps = steps[steps >= 1]
+        return int(steps.min()) if steps.size else None
+
+    def column(self, attr):
+        if attr == "total_output":
+            return -self.value + self.pump_operation
+        if attr == "stored_energy_wh":
+            return self.energy
+        if attr == "turbine_generation":
+            return self.value
+        if attr == "valve_opening":
+            return np.nan_to_num(self.last_input)
+        if attr == "pump_operation":
+            return self.pump_operation
+        raise ValueError("Unknown output attribute %s" % attr)
 
 
 class PSS():
-    
+    __slots__ = ("pressure_wave_runtime", "nominal_power", "last_input", "last_time", "value", "energy", "pump_operation")
+
     def __init__(self, pressure_wave_runtime, nominal_power, energy):
         self.pressure_wave_runtime = pressure_wave_runtime
         self.nominal_power = nominal_power
@@ -113,6 +316,7 @@ class PSS():
     def compute_storage_change(self, pump_operation, delta):
         # delta in seconds
         delta_in_h = delta / 3600
+        self.pump_operation = pump_operation
         self.energy -= self.value * delta_in_h  
         self.energy -= pump_operation * delta_in_h  
 
@@ -1,3 +1,4 @@
+import argparse
 import sys
 import os
 
@@ -5,11 +6,39 @@ import os
 sys.path.append(os.path.dirname(__file__))
 
 from scenario_builder import create_scenario
-
-world = create_scenario('/Users/divyasabu/Desktop/phasethree/input_files')
+from phasethree.checkpoint import latest_checkpoint, snapshot_time
+from phasethree.profiling import run_profiled
 
 END = 3600 * 24  # Simulation time (e.g., one day)
 
-world.run(until=END)
+# Input directory can be given on the command line (see sweep.py for parameter studies).
+# Snapshots are only written with --checkpoint-dir, --restore continues the
+# run from a snapshot directory ('latest' picks the newest one in --checkpoint-dir)
+# --profile and --trace report the time spent in each simulator (see profiling.run_profiled)
+parser = argparse.ArgumentParser(description='Run the co-simulation scenario.')
+parser.add_argument('base_dir', nargs='?', default='/Users/divyasabu/Desktop/phasethree/input_files',
+                    help='directory with asset_description.json and data_power.csv')
+parser.add_argument('--checkpoint-dir', default=None, help='write snapshots of all simulators to this directory')
+parser.add_argument('--checkpoint-every', type=int, default=3600, help='snapshot interval in seconds')
+parser.add_argument('--restore', default=None, metavar='SNAPSHOT_DIR', help="snapshot directory or 'latest'")
+parser.add_argument('--profile', nargs='?', const='', default=None, metavar='REPORT_JSON',
+                    help='print the time spent per simulator call, optionally also written as JSON')
+parser.add_argument('--trace', default=None, metavar='TRACE_JSON', help='write a Chrome trace of the simulator calls')
+args = parser.parse_args()
+
+restore_from = args.restore
+if restore_from == 'latest':
+    if args.checkpoint_dir is None:
+        parser.error('--restore latest needs --checkpoint-dir')
+    restore_from = latest_checkpoint(args.checkpoint_dir)
+start = snapshot_time(restore_from) if restore_from else 0
+
+profile = args.profile is not None or args.trace is not None
+world = create_scenario(args.base_dir, checkpoint_dir=args.checkpoint_dir, checkpoint_every=args.checkpoint_every,
+                        restore_from=restore_from, profile=profile)
+if profile:
+    run_profiled(world, END - start, report_path=args.profile or None, trace_path=args.trace)
+else:
+    world.run(until=END - start)
 
 # monitored_data contains simulation outputs
\ No newline at end of file
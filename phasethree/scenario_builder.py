@@ -4,9 +4,17 @@ import os
 import optimizer_simulator
 
 
-def create_scenario(base_dir):
+def create_scenario(base_dir, assets=None, datafile=None, data_out='output_data.parquet', checkpoint_dir=None,
+                    checkpoint_every=3600, restore_from=None, profile=False):
+    # assets and datafile override asset_description.json and data_power.csv
+    # from base_dir (used by the sweep runner for per-run parameters).
+    # With checkpoint_dir the simulators write snapshots of their state every
+    # checkpoint_every seconds, restore_from (a snapshot directory, see
+    # checkpoint.latest_checkpoint) continues from one. A restored world
+    # starts at the snapshot time, run it until END - snapshot_time(...).
+    # profile=True times the simulator calls, see profiling.run_profiled.
     sim_config = {
-        'CSV': {'python': 'mosaik_csv:CSV'},
+        'Profile': {'python': 'profile_simulator:ProfileSim'},
         'PyPower': {'python': 'mosaik_components.mosaik_pypower.mosaik:PyPower'},
         'Optimizer': {'python': 'optimizer_simulator:OptimizerSim'},
         'Controller': {'python': 'power_controller_simulator:ControllerSim'},
@@ -17,24 +25,31 @@ def create_scenario(base_dir):
     world = mosaik.World(sim_config)
 
     # Load asset description file
-    with open(os.path.join(base_dir, 'asset_description.json'), 'r') as f:
-        assets = json.load(f)
+    if assets is None:
+        with open(os.path.join(base_dir, 'asset_description.json'), 'r') as f:
+            assets = json.load(f)
+
+    snapshots = {'checkpoint_dir': checkpoint_dir, 'checkpoint_every': checkpoint_every, 'restore_from': restore_from}
 
     # Start simulators
-    csv_sim = world.start(
-    'CSV',
-    datafile=os.path.join(base_dir, 'data_power.csv'),
+    # Profiles are converted once to a memory-mapped store next to the CSV
+    profile_sim = world.start(
+    'Profile',
+    datafile=datafile or os.path.join(base_dir, 'data_power.csv'),
     sim_start='01.01.2016 00:00',         # Simulation start time (edit if needed)
     date_format='%d.%m.%Y %H:%M',         # Format of timestamps in CSV (edit if needed)
     delimiter=',',                        # Use ';' if your CSV uses semicolons
-    type='time-based'                     # Tells the simulator to use timestamps
+    type='time-based',                    # Tells the simulator to use timestamps
+    step_size=900,                        # Served at the optimizer rate
+    resample='mean',                      # Average of the rows within each step
+    **snapshots
 )
 
     pypower_sim = world.start('PyPower', step_size=60)
-    optimizer_sim = world.start('Optimizer')
-    controller_sim = world.start('Controller')
-    pss_sim = world.start('PSS')
-    collector_sim = world.start('Collector', data_out='output_data.json')
+    optimizer_sim = world.start('Optimizer', profile=profile, **snapshots)
+    controller_sim = world.start('Controller', profile=profile, **snapshots)
+    pss_sim = world.start('PSS', profile=profile, **snapshots)
+    collector_sim = world.start('Collector', data_out=data_out, profile=profile, **snapshots)
     monitor = collector_sim.Monitor.create(1)[0]
 
 
@@ -49,6 +64,11 @@ def create_scenario(base_dir):
         world.connect(l, monitor, 'load_p')
        # monitored_data['monitored data'][g.eid] = ['generator_p']
         world.connect(g, monitor, 'generator_p')
+        # Optional profile columns replace the built-in load/generation ramps
+        if 'load_profile' in load:
+            world.connect(profile_sim.Series.create(1, column=load['load_profile'])[0], l, ('value', 'load_p'))
+        if 'generator_profile' in load:
+            world.connect(profile_sim.Series.create(1, column=load['generator_profile'])[0], g, ('value', 'generator_p'))
 
     # Create and connect PSS and Controller
     for idx, pss in enumerate(assets.get('pss', [])):
@@ -0,0 +1,78 @@
+import logging
+import struct
+import time as _time
+
+import numpy as np
+
+# Binary trace records: wall clock (perf_counter), event, simulation time,
+# number of entities involved. 21 bytes each, read back with read_trace().
+TRACE_STEP = 1
+TRACE_GET_DATA = 2
+TRACE_RECORD = struct.Struct('<dBqI')
+TRACE_DTYPE = np.dtype([('wall', '<f8'), ('event', 'u1'), ('time', '<i8'), ('count', '<u4')])
+
+LOG_FORMAT = '%(asctime)s %(name)s %(levelname)s %(message)s'
+
+
+class SimLogger:
+    # Per-simulator logger ('phasethree.<name>'). Messages use logging's lazy
+    # %-style arguments, so request/response dicts are only formatted when a
+    # record is actually emitted. debug() is additionally sampled: only every
+    # `every`-th step (and the get_data calls following it) is logged.
+    # trace() appends fixed-size binary records to `trace_file`, which is
+    # cheap enough to leave on for long runs.
+    def __init__(self, name):
+        self.logger = logging.getLogger(f'phasethree.{name}')
+        self.every = 1
+        self.steps = 0
+        self.sampled = False
+        self.time = 0  # Simulation time of the current step
+        self.trace_file = None
+
+    def configure(self, level=None, every=1, trace_file=None):
+        if every < 1:
+            raise ValueError("Logging interval must be at least 1 step")
+        if level is not None:
+            self.logger.setLevel(level.upper() if isinstance(level, str) else level)
+            # Give the records somewhere to go unless the application has
+            # configured logging itself
+            parent = logging.getLogger('phasethree')
+            if not parent.handlers and not logging.getLogger().handlers:
+                handler = logging.StreamHandler()
+                handler.setFormatter(logging.Formatter(LOG_FORMAT))
+                parent.addHandler(handler)
+        self.every = every
+        if trace_file is not None:
+            self.close()
+            self.trace_file = open(trace_file, 'wb')
+
+    def begin_step(self, sim_time):
+        # Called once per step; decides whether this step is logged
+        self.time = sim_time
+        self.sampled = self.steps % self.every == 0 and self.logger.isEnabledFor(logging.DEBUG)
+        self.steps += 1
+        return self.sampled
+
+    def debug(self, msg, *args):
+        if self.sampled:
+            self.logger.debug(msg, *args)
+
+    def info(self, msg, *args):
+        self.logger.info(msg, *args)
+
+    def warning(self, msg, *args):
+        self.logger.warning(msg, *args)
+
+    def trace(self, event, count):
+        if self.trace_file is not None:
+            self.trace_file.write(TRACE_RECORD.pack(_time.perf_counter(), event, int(self.time), count))
+
+    def close(self):
+        if self.trace_file is not None:
+            self.trace_file.close()
+            self.trace_file = None
+
+
+def read_trace(path):
+    # Returns the records of a trace file as a structured array
+    return np.fromfile(path, dtype=TRACE_DTYPE)
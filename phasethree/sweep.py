@@ -0,0 +1,200 @@
+import argparse
+import copy
+import csv
+import itertools
+import json
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+# scenario_builder and the simulators it loads are imported as top-level
+# modules, like in run.py
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from phasethree.checkpoint import snapshot_time
+from phasethree.Collector import read_data, resolve_output
+
+# Parameters that are applied to every PSS entry of the asset description
+PSS_PARAMS = ('K_p', 'K_i', 'K_d', 'pressure_wave_runtime', 'E_PSS_max_wh', 'E_PSS_init_wh', 'P_PSS_max_w')
+# Selects the load profile CSV (absolute or relative to base_dir)
+PROFILE_PARAM = 'datafile'
+
+
+def grid(**axes):
+    # Cartesian product of the given values, e.g. grid(K_p=[0.1, 0.2], K_i=[0, 1])
+    names = list(axes)
+    return [dict(zip(names, values)) for values in itertools.product(*(axes[name] for name in names))]
+
+
+def sample(n, seed=0, **ranges):
+    # n random parameter sets. A (low, high) tuple samples uniformly, a list
+    # picks one of its values
+    rng = np.random.default_rng(seed)
+    runs = [{} for _ in range(n)]
+    for name, spec in ranges.items():
+        if isinstance(spec, tuple):
+            values = rng.uniform(spec[0], spec[1], n).tolist()
+        else:
+            values = [spec[i] for i in rng.integers(len(spec), size=n)]
+        for run, value in zip(runs, values):
+            run[name] = value
+    return runs
+
+
+def apply_params(assets, params):
+    unknown = set(params) - set(PSS_PARAMS) - {PROFILE_PARAM}
+    if unknown:
+        raise ValueError(f"Unknown sweep parameters {sorted(unknown)}, expected some of {PSS_PARAMS + (PROFILE_PARAM,)}")
+    assets = copy.deepcopy(assets)
+    for pss in assets.get('pss', []):
+        for name in PSS_PARAMS:
+            if name in params:
+                pss[name] = params[name]
+    return assets
+
+
+def kpis(data):
+    # Summary per collected attribute over all sources: mean, min and max of
+    # all values and the sum of the last values (e.g. total stored energy)
+    result = {}
+    attrs = sorted({attr for _, attr in data})
+    for attr in attrs:
+        series = [values for (_, a), (_, values) in data.items() if a == attr and values.dtype != object and len(values)]
+        if not series:
+            continue
+        values = np.concatenate(series)
+        result[f'{attr}_mean'] = float(np.nanmean(values))
+        result[f'{attr}_min'] = float(np.nanmin(values))
+        result[f'{attr}_max'] = float(np.nanmax(values))
+        result[f'{attr}_final_sum'] = float(sum(s[-1] for s in series))
+    return result
+
+
+def run_one(base_dir, run_dir, params, until, restore_from=None):
+    # Runs one world with its own output directory. kpis.json is written
+    # last and marks the run as finished for resume. With restore_from the
+    # run branches off a snapshot (e.g. of a warmed-up base run) instead of
+    # simulating the time before it again.
+    from scenario_builder import create_scenario
+
+    os.makedirs(run_dir, exist_ok=True)
+    with open(os.path.join(base_dir, 'asset_description.json')) as f:
+        assets = apply_params(json.load(f), params)
+    datafile = params.get(PROFILE_PARAM)
+    if datafile is not None:
+        datafile = os.path.join(base_dir, datafile)
+    data_out, _ = resolve_output(os.path.join(run_dir, 'output_data.parquet'))
+
+    start = time.perf_counter()
+    world = create_scenario(base_dir, assets=assets, datafile=datafile, data_out=data_out, restore_from=restore_from)
+    world.run(until=until - (snapshot_time(restore_from) if restore_from else 0), print_progress=False)
+    result = {'status': 'ok', 'wall_time_s': time.perf_counter() - start}
+    result.update(kpis(read_data(data_out)))
+
+    with open(os.path.join(run_dir, 'kpis.json'), 'w') as f:
+        json.dump(result, f, indent=4)
+    return result
+
+
+def _run_safe(base_dir, run_dir, params, until, restore_from=None):
+    try:
+        return run_one(base_dir, run_dir, params, until, restore_from)
+    except Exception as e:
+        with open(os.path.join(run_dir, 'error.txt'), 'w') as f:
+            f.write(traceback.format_exc())
+        return {'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+
+
+def run_sweep(base_dir, runs, out_dir, until=86400, workers=None, resume=True, restore_from=None):
+    # Runs every parameter set of `runs` as an independent world in a
+    # process pool. Run i writes to out_dir/run-<i>/ (params.json, the
+    # Collector output, kpis.json). With resume, runs that already have a
+    # kpis.json are not repeated; their parameters must match. With
+    # restore_from all runs branch off that snapshot directory and the
+    # parameters only apply from its time on. Returns the rows of
+    # out_dir/kpis.csv (one per run: id, parameters, KPIs).
+    os.makedirs(out_dir, exist_ok=True)
+    results = {}
+    pending = []
+    for i, params in enumerate(runs):
+        run_id = f'run-{i:05d}'
+        run_dir = os.path.join(out_dir, run_id)
+        params_path = os.path.join(run_dir, 'params.json')
+        kpis_path = os.path.join(run_dir, 'kpis.json')
+        if resume and os.path.exists(params_path):
+            with open(params_path) as f:
+                if json.load(f) != params:
+                    raise ValueError(f"{run_dir} was run with different parameters, use a new out_dir or resume=False")
+            if os.path.exists(kpis_path):
+                with open(kpis_path) as f:
+                    results[run_id] = json.load(f)
+                continue
+        os.makedirs(run_dir, exist_ok=True)
+        with open(params_path, 'w') as f:
+            json.dump(params, f, indent=4)
+        pending.append((run_id, run_dir, params))
+
+    print(f'[sweep] {len(runs)} runs, {len(runs) - len(pending)} already done, {len(pending)} to run')
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(_run_safe, base_dir, run_dir, params, until, restore_from): run_id
+                for run_id, run_dir, params in pending
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                run_id = futures[future]
+                results[run_id] = future.result()
+                print(f'[sweep] {run_id} {results[run_id]["status"]} ({done}/{len(pending)})')
+
+    rows = [dict(run_id=f'run-{i:05d}', **params, **results[f'run-{i:05d}']) for i, params in enumerate(runs)]
+    write_table(os.path.join(out_dir, 'kpis.csv'), rows)
+    return rows
+
+
+def write_table(path, rows):
+    columns = list(dict.fromkeys(key for row in rows for key in row))
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def _parse_values(text):
+    values = []
+    for item in text.split(','):
+        try:
+            values.append(float(item))
+        except ValueError:
+            values.append(item)
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run scenario_builder worlds over a parameter grid or random samples.')
+    parser.add_argument('base_dir', help='directory with asset_description.json and data_power.csv')
+    parser.add_argument('--out', default='sweep_output')
+    parser.add_argument('--until', type=int, default=86400)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--grid', action='append', default=[], metavar='NAME=V1,V2,...', help='grid axis')
+    parser.add_argument('--range', action='append', default=[], metavar='NAME=LOW,HIGH', help='uniform sampling range')
+    parser.add_argument('--samples', type=int, default=0, help='number of random samples of the --range parameters')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-resume', action='store_true')
+    parser.add_argument('--restore', default=None, metavar='SNAPSHOT_DIR', help='branch all runs off this snapshot')
+    args = parser.parse_args(argv)
+
+    axes = {name: _parse_values(values) for name, values in (item.split('=', 1) for item in args.grid)}
+    ranges = {name: tuple(_parse_values(values)) for name, values in (item.split('=', 1) for item in args.range)}
+    runs = grid(**axes)
+    if args.samples:
+        samples = sample(args.samples, args.seed, **ranges)
+        runs = [dict(point, **s) for point in runs for s in samples]
+    run_sweep(args.base_dir, runs, args.out, args.until, args.workers, resume=not args.no_resume, restore_from=args.restore)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from phasethree.checkpoint import checkpoint_path, latest_checkpoint, load_state, save_state, snapshot_time
+from phasethree.testing import ASSETS, run_mosaik
+
+pytest.importorskip('mosaik')
+
+UNTIL = 1800
+RESTORE = 900
+FLUSH = 300  # The Collector writes values before the snapshots
+
+
+@pytest.fixture(scope='module')
+def full_run(tmp_path_factory):
+    # Full run writing a snapshot every 900 s
+    directory = tmp_path_factory.mktemp('full')
+    data_out = str(directory / 'out.csv')
+    results = run_mosaik(ASSETS, data_out, UNTIL, flush_interval=FLUSH, checkpoint_dir=str(directory / 'checkpoints'),
+                         checkpoint_every=900)
+    return directory, data_out, results
+
+
+def assert_same_results(results, expected):
+    assert set(results) == set(expected)
+    for key, (time, values) in expected.items():
+        np.testing.assert_array_equal(results[key][0], time, err_msg=str(key))
+        np.testing.assert_array_equal(results[key][1], values, err_msg=str(key))
+
+
+def test_latest_checkpoint(full_run):
+    directory, _, _ = full_run
+    latest = latest_checkpoint(str(directory / 'checkpoints'))
+    assert snapshot_time(latest) == RESTORE
+    assert latest_checkpoint(str(directory / 'missing')) is None
+
+
+def test_restore_matches_the_full_run(full_run, tmp_path):
+    directory, data_out, expected = full_run
+    snapshot = checkpoint_path(str(directory / 'checkpoints'), RESTORE)
+    # Restoring into a separate output copies the values written before the
+    # snapshot and leaves the snapshot's output alone
+    before = open(data_out, 'rb').read()
+    results = run_mosaik(ASSETS, str(tmp_path / 'restored.csv'), UNTIL - RESTORE, flush_interval=FLUSH,
+                         restore_from=snapshot)
+    assert_same_results(results, expected)
+    assert open(data_out, 'rb').read() == before
+
+
+def copy_snapshot(full_run, tmp_path):
+    # Snapshots and output of the full run in tmp_path, with the Collector
+    # snapshot referring to the copied output
+    directory, data_out, _ = full_run
+    shutil.copytree(directory / 'checkpoints', tmp_path / 'checkpoints')
+    shutil.copy(data_out, tmp_path / 'out.csv')
+    snapshot = checkpoint_path(str(tmp_path / 'checkpoints'), RESTORE)
+    path = os.path.join(snapshot, 'Collector-0.npz')
+    arrays, meta = load_state(path)
+    save_state(path, arrays, dict(meta, data_out=str(tmp_path / 'out.csv')))
+    return snapshot, tmp_path / 'out.csv'
+
+
+def test_restore_into_the_snapshot_output(full_run, tmp_path):
+    # A run stopped after the snapshot, resumed into its own output file
+    snapshot, data_out = copy_snapshot(full_run, tmp_path)
+    results = run_mosaik(ASSETS, str(data_out), UNTIL - RESTORE, flush_interval=FLUSH, restore_from=snapshot)
+    assert_same_results(results, full_run[2])
+    assert not os.path.exists(tmp_path / 'out.restored.csv')
+
+
+def test_unreadable_output_refuses_the_restore(full_run, tmp_path):
+    snapshot, data_out = copy_snapshot(full_run, tmp_path)
+    # The output lost values written before the snapshot, e.g. in a crash
+    data_out.write_bytes(data_out.read_bytes()[:200])
+    damaged = data_out.read_bytes()
+    with pytest.raises(Exception, match='Cannot restore'):
+        run_mosaik(ASSETS, str(data_out), UNTIL - RESTORE, flush_interval=FLUSH, restore_from=snapshot)
+    assert data_out.read_bytes() == damaged
+    assert not os.path.exists(tmp_path / 'out.restored.csv')
@@ -0,0 +1,96 @@
+import numpy as np
+import pytest
+
+from phasethree.Collector import FORMATS, Collector, format_available, read_data, resolve_output
+
+pytest.importorskip('mosaik_api_v3')
+
+STEPS = 40
+
+
+def inputs(time):
+    # A numeric, a partly non-numeric and an empty series
+    return {'Monitor': {
+        'p': {'PSS-0.PSS_0': time / 3},
+        'state': {'PSS-0.PSS_0': 'on' if time % 2 else 1.5},
+        'q': {'Grid-0.node': None},
+    }}
+
+
+def collect(path, fmt='auto', steps=STEPS, **params):
+    collector = Collector()
+    collector.init('Collector-0', 1, data_out=str(path), format=fmt, **params)
+    collector.create(1, 'Monitor')
+    flushed = []
+    for time in range(steps):
+        collector.step(time, inputs(time), None)
+        flushed.append(sum(collector.counts.values()))
+    collector.finalize()
+    return collector, flushed
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_sink_round_trip(tmp_path, fmt):
+    if not format_available(fmt):
+        pytest.skip(f'{fmt} backend is not installed')
+    # A small budget writes the series in several chunks
+    collector, _ = collect(tmp_path / 'out', fmt, memory_budget_mb=20 * 16 / 2**20)
+    assert collector.data_out_path == resolve_output(str(tmp_path / 'out'), fmt)[0]
+    data = read_data(collector.data_out_path)
+    times = np.arange(STEPS)
+    assert set(data) == {('PSS-0.PSS_0', 'p'), ('PSS-0.PSS_0', 'state'), ('Grid-0.node', 'q')}
+    for time, _ in data.values():
+        np.testing.assert_array_equal(time, times)
+    np.testing.assert_array_equal(data[('PSS-0.PSS_0', 'p')][1], times / 3)
+    assert np.all(np.isnan(data[('Grid-0.node', 'q')][1]))
+    # Text values come back as text, numbers as numbers or their text (CSV, HDF5)
+    state = data[('PSS-0.PSS_0', 'state')][1]
+    assert state[1::2].tolist() == ['on'] * (STEPS // 2)
+    assert [float(value) for value in state[::2]] == [1.5] * (STEPS // 2)
+    assert collector.get_final_data() == {'PSS-0.PSS_0.p': STEPS, 'PSS-0.PSS_0.state': STEPS, 'Grid-0.node.q': STEPS}
+
+
+@pytest.mark.parametrize('fmt', FORMATS)
+def test_series_turning_to_text_after_a_flush(tmp_path, fmt):
+    if not format_available(fmt):
+        pytest.skip(f'{fmt} backend is not installed')
+    collector = Collector()
+    collector.init('Collector-0', 1, data_out=str(tmp_path / 'out'), format=fmt, memory_budget_mb=4 * 16 / 2**20)
+    collector.create(1, 'Monitor')
+    for time in range(10):
+        collector.step(time, {'Monitor': {'state': {'PSS-0.PSS_0': 'on' if time >= 6 else float(time)}}}, None)
+    collector.finalize()
+    state = read_data(collector.data_out_path)[('PSS-0.PSS_0', 'state')][1]
+    assert [float(value) for value in state[:6]] == list(range(6))
+    assert state[6:].tolist() == ['on'] * 4
+
+
+def test_memory_budget_triggers_flushes(tmp_path):
+    # Three values per step, the budget holds 30
+    _, flushed = collect(tmp_path / 'out.csv', memory_budget_mb=30 * 16 / 2**20)
+    assert flushed[8] == 0
+    assert flushed[9] == 30
+    assert flushed[19] == 60
+    _, flushed = collect(tmp_path / 'default.csv')
+    assert flushed[-1] == 0  # Everything is written on finalize only
+
+
+def test_flush_interval(tmp_path):
+    _, flushed = collect(tmp_path / 'out.csv', flush_interval=10)
+    assert flushed[9] == 0
+    assert flushed[10] == 33
+    assert flushed[20] == 63
+    assert sum(len(time) for time, _ in read_data(str(tmp_path / 'out.csv')).values()) == 3 * STEPS
+
+
+def test_downsampling_keeps_one_value_per_interval(tmp_path):
+    collector, _ = collect(tmp_path / 'out.csv', downsample_s=7)
+    data = read_data(collector.data_out_path)
+    for time, _ in data.values():
+        np.testing.assert_array_equal(time, np.arange(0, STEPS, 7))
+    np.testing.assert_array_equal(data[('PSS-0.PSS_0', 'p')][1], np.arange(0, STEPS, 7) / 3)
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match='Unknown output format'):
+        resolve_output(str(tmp_path / 'out.csv'), 'xlsx')
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from phasethree.headless import HeadlessScenario
+from phasethree.testing import ASSETS, run_mosaik
+
+pytest.importorskip('mosaik')
+
+UNTIL = 960  # two optimizer intervals
+
+
+@pytest.fixture(scope='module')
+def mosaik_results(tmp_path_factory):
+    return run_mosaik(ASSETS, str(tmp_path_factory.mktemp('mosaik') / 'out.csv'), UNTIL)
+
+
+def test_headless_matches_mosaik(mosaik_results):
+    results = HeadlessScenario(ASSETS).run(UNTIL)
+    assert set(results) == set(mosaik_results)
+    for key, (time, values) in mosaik_results.items():
+        np.testing.assert_array_equal(results[key][0], time, err_msg=str(key))
+        np.testing.assert_array_equal(results[key][1], values.astype(float), err_msg=str(key))
+
+
+def test_held_pss_steps_match_exact(mosaik_results):
+    results = HeadlessScenario(ASSETS, pss_step='held').run(UNTIL)
+    for key, (time, values) in results.items():
+        expected_time, expected = mosaik_results[key]
+        rows = np.searchsorted(expected_time, time)
+        np.testing.assert_array_equal(expected_time[rows], time)
+        np.testing.assert_allclose(values, expected[rows].astype(float), rtol=1e-9, atol=1e-6, err_msg=str(key))
+
+
+def test_headless_serves_profiles_like_mosaik(tmp_path):
+    datafile = tmp_path / 'data_power.csv'
+    rows = ['Data', 'date,house,pv']
+    rows += [f'01.01.2016 {m // 60:02d}:{m % 60:02d},{300 + m % 97},{150 + 7 * (m % 13)}' for m in range(0, 60, 5)]
+    datafile.write_text('\n'.join(rows) + '\n')
+    assets = dict(ASSETS, loads=[{'bus': 1, 'load_profile': 'house', 'generator_profile': 'pv'}, {'bus': 2}])
+
+    expected = run_mosaik(assets, str(tmp_path / 'out.csv'), UNTIL, str(datafile))
+    results = HeadlessScenario(assets, datafile=str(datafile)).run(UNTIL)
+    assert set(results) == set(expected)
+    for key, (time, values) in expected.items():
+        np.testing.assert_array_equal(results[key][0], time, err_msg=str(key))
+        np.testing.assert_array_equal(results[key][1], values.astype(float), err_msg=str(key))
+    load = results[('Optimizer-0.Optimizer-0', 'load_p')][1]
+    assert load[0] != load[-1]
+
+
+def test_profiles_need_a_datafile():
+    assets = dict(ASSETS, loads=[{'bus': 1, 'load_profile': 'house'}])
+    with pytest.raises(ValueError, match='datafile'):
+        HeadlessScenario(assets)
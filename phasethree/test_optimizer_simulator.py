@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip('mosaik_api')
+
+from phasethree.optimizer_simulator import OptimizerSim
+
+PSS = [
+    {'bus': 1, 'E_PSS_max_wh': 1e6, 'E_PSS_init_wh': 5e5, 'P_PSS_max_w': 1e5},
+    {'bus': 2, 'E_PSS_max_wh': 2e6, 'E_PSS_init_wh': 1e6, 'P_PSS_max_w': 2e5},
+]
+ATTRS = ['p_ch_w', 'p_dis_w', 'p_total_w']
+# State inputs at the interval starts, each one changes the setpoints
+INPUTS = {
+    0: {},
+    900: {'Optimizer-0': {'E_PSS_init_wh': {'src': 1e4}}, 'Optimizer-1': {'P_PSS_max_w': {'src': 5e4}}},
+    1800: {'Optimizer-1': {'P_PSS_max_w': {'src': 1.5e5}}},
+}
+
+
+def make_sim(**params):
+    sim = OptimizerSim()
+    sim.init('Optimizer', 1, cache_size=0, **params)
+    for pss in PSS:
+        sim.create(1, 'PSS', **pss)
+    return sim
+
+
+def outputs(sim):
+    return sim.get_data({f'Optimizer-{i}': ATTRS for i in range(len(PSS))})
+
+
+def run(sim, until):
+    # Outputs after every step, keyed by step time, and the requested next steps
+    values, steps = {}, {}
+    time = 0
+    while time < until:
+        steps[time] = sim.step(time, INPUTS.get(time, {}))
+        values[time] = outputs(sim)
+        time = steps[time]
+    sim.finalize()
+    return values, steps
+
+
+def test_async_results_are_published_after_the_delay():
+    expected, sync_steps = run(make_sim(), 2700)
+    assert sync_steps == {0: 900, 900: 1800, 1800: 2700}
+    assert any(value != 0.0 for data in expected[0].values() for value in data.values())
+    assert expected[0] != expected[900] != expected[1800]
+
+    values, steps = run(make_sim(executor='thread', publish_delay=60), 2700)
+    # The first interval is solved synchronously, later solves are served
+    # publish_delay seconds after their interval start
+    assert steps == {0: 900, 900: 960, 960: 1800, 1800: 1860, 1860: 2700}
+    assert values[0] == expected[0]
+    assert values[900] == expected[0]
+    assert values[960] == expected[900]
+    assert values[1800] == expected[900]
+    assert values[1860] == expected[1800]
@@ -0,0 +1,40 @@
+import calendar
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+from phasethree.profile_simulator import ProfileStore, convert_csv, parse_time
+
+pytest.importorskip('mosaik_api_v3')
+
+DATE_FORMAT = '%d.%m.%Y %H:%M'
+START = calendar.timegm(datetime(2016, 1, 1).timetuple())
+
+
+def test_blank_and_whitespace_lines_are_skipped(tmp_path):
+    datafile = tmp_path / 'data_power.csv'
+    datafile.write_text('Data\ndate,house,pv\n'
+                        '01.01.2016 00:00,300,10\n'
+                        '   \n'
+                        '01.01.2016 00:15,310,\n'
+                        '\n'
+                        ' , \n'
+                        '01.01.2016 00:30,320,30\n'
+                        '\t\n')
+    store = ProfileStore(convert_csv(str(datafile), DATE_FORMAT))
+    assert store.attrs == ['house', 'pv']
+    np.testing.assert_array_equal(store.time, START + np.array([0, 900, 1800]))
+    np.testing.assert_array_equal(store.values, [[300, 10], [310, np.nan], [320, 30]])
+
+
+def test_parse_time_converts_offsets_to_utc():
+    assert parse_time('2016-01-01T00:00:00', None) == START
+    assert parse_time('2016-01-01T01:00:00+01:00', None) == START
+    assert parse_time('2015-12-31T19:30:00-04:30', None) == START
+    assert parse_time('2016-01-01T00:00:00Z', None) == START
+    assert parse_time('01.01.2016 02:00 +0200', DATE_FORMAT + ' %z') == START
+    # Rows with and without an offset in one file keep their order
+    rows = ['2016-01-01T00:00:00', '2016-01-01T01:30:00+01:00', '2016-01-01T00:45:00']
+    times = [parse_time(text, None) for text in rows]
+    assert times == [START, START + 1800, START + 2700]
@@ -0,0 +1,40 @@
+import json
+
+import pytest
+
+from phasethree import profiling
+import phasethree.testing  # noqa: F401 (puts the simulator modules on sys.path)
+
+mosaik = pytest.importorskip('mosaik')
+
+UNTIL = 600
+
+
+def profiled_world(tmp_path):
+    # Two instances of the same simulator
+    world = mosaik.World({'PSS': {'python': 'pss_simulator:PSSSimulator'}}, skip_greetings=True)
+    for _ in range(2):
+        world.start('PSS', step_size=60, profile=True).PSS.create(
+            1, nominal_power=1e5, pressure_wave_runtime=1.5, initial_stored_energy_wh=5e5,
+        )
+    trace = tmp_path / 'trace.json'
+    report = profiling.run_profiled(world, UNTIL, report_path=tmp_path / 'report.json', trace_path=trace,
+                                    print_progress=False)
+    return report, trace
+
+
+@pytest.mark.parametrize('run', range(2))
+def test_report_per_simulator_instance(tmp_path, run):
+    # Worlds run one after another in a process report only their own steps
+    report, trace = profiled_world(tmp_path)
+    assert set(report) == {'PSS-0', 'PSS-1', 'mosaik', 'total_wall_s'}
+    for sid in ('PSS-0', 'PSS-1'):
+        assert report[sid]['step']['count'] == UNTIL // 60
+    inside = sum(report[sid][event]['wall_s'] for sid in ('PSS-0', 'PSS-1') for event in ('step', 'get_data')
+                 if event in report[sid])
+    assert report['mosaik']['overhead']['wall_s'] == pytest.approx(report['total_wall_s'] - inside)
+    assert profiling.PROFILERS == {}
+
+    assert json.loads((tmp_path / 'report.json').read_text())['PSS-1']['step']['count'] == UNTIL // 60
+    threads = [e['args']['name'] for e in json.loads(trace.read_text())['traceEvents'] if e['ph'] == 'M']
+    assert threads == ['PSS-0', 'PSS-1']
@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+from phasethree.pss_simulator import PSS, PSSFleet, PSSSimulator
+from phasethree.testing import ASSETS, run_mosaik
+
+UNITS = [
+    {"nominal_power": 1e5, "pressure_wave_runtime": 1.5, "initial_stored_energy_wh": 5e5},
+    {"nominal_power": 2e5, "pressure_wave_runtime": 0.7, "initial_stored_energy_wh": 1e6},
+    {"nominal_power": 5e4, "pressure_wave_runtime": 2.9, "initial_stored_energy_wh": 2e5},
+]
+ATTRS = ("turbine_generation", "stored_energy_wh", "total_output")
+
+
+def make_sim(**params):
+    sim = PSSSimulator()
+    sim.init("PSS-0", **params)
+    for unit in UNITS:
+        sim.create(1, "PSS", **unit)
+    return sim
+
+
+def schedule(until, period, seed=0):
+    # Valve and pump inputs per unit, piecewise constant on `period`
+    rng = np.random.default_rng(seed)
+    steps = until // period + 1
+    return rng.uniform(0, 1, (steps, len(UNITS))), rng.uniform(0, 1e3, (steps, len(UNITS))), period
+
+
+def inputs_at(time, inputs):
+    valve, pump, period = inputs
+    row = time // period
+    return {
+        f"PSS_{i}": {"valve_opening": {"src": valve[row, i]}, "pump_operation": {"src": pump[row, i]}}
+        for i in range(len(UNITS))
+    }
+
+
+def outputs(sim):
+    data = sim.get_data({f"PSS_{i}": list(ATTRS) for i in range(len(UNITS))})
+    return np.array([[data[f"PSS_{i}"][attr] for attr in ATTRS] for i in range(len(UNITS))])
+
+
+def reference(inputs, until):
+    sim = make_sim()
+    values = {}
+    for time in range(until):
+        sim.step(time, inputs_at(time, inputs), None)
+        values[time] = outputs(sim)
+    return values
+
+
+def test_fleet_matches_scalar_pss():
+    fleet = PSSFleet()
+    units = [PSS(u["pressure_wave_runtime"], u["nominal_power"], u["initial_stored_energy_wh"]) for u in UNITS]
+    for u in UNITS:
+        fleet.add(1, u["pressure_wave_runtime"], u["nominal_power"], u["initial_stored_energy_wh"])
+    valve, pump, _ = schedule(600, 60)
+    indices = np.arange(len(UNITS))
+    for time in range(600):
+        row = time // 60
+        fleet.step(indices, 1, valve[row], pump[row])
+        for i, unit in enumerate(units):
+            delta_time = unit.last_time + 1 if unit.last_input == valve[row, i] else 1
+            unit.compute_at_time(delta_time, valve[row, i])
+            unit.compute_storage_change(pump[row, i], 1)
+    np.testing.assert_allclose(fleet.value, [unit.value for unit in units], rtol=1e-12)
+    np.testing.assert_allclose(fleet.energy, [unit.energy for unit in units], rtol=1e-12)
+
+
+def test_advance_held_matches_one_second_steps():
+    valve, pump, _ = schedule(0, 1)
+    stepped, held = PSSFleet(), PSSFleet()
+    for fleet in (stepped, held):
+        for u in UNITS:
+            fleet.add(1, u["pressure_wave_runtime"], u["nominal_power"], u["initial_stored_energy_wh"])
+        fleet.step(np.arange(len(UNITS)), 1, valve[0], pump[0])
+    for _ in range(500):
+        stepped.step(np.arange(len(UNITS)), 1, valve[0], pump[0])
+    held.advance_held(500)
+    for name in ("value", "energy", "last_time"):
+        np.testing.assert_allclose(getattr(held, name), getattr(stepped, name), rtol=1e-9)
+
+
+def test_adaptive_matches_one_second_reference():
+    # Adaptive steps at its own schedule or when an input changes (the
+    # triggers mosaik would wake it for)
+    until = 1800
+    inputs = schedule(until, 60, seed=1)
+    expected = reference(inputs, until)
+
+    sim = make_sim(adaptive=True, tolerance=1e-6, max_step=300)
+    time = 0
+    steps = 0
+    while time < until:
+        next_time = sim.step(time, inputs_at(time, inputs), None)
+        np.testing.assert_allclose(outputs(sim), expected[time], rtol=1e-9)
+        time = min(next_time, time - time % 60 + 60)
+        steps += 1
+    assert steps < until
+
+
+def test_adaptive_world_matches_fixed_step_world(tmp_path):
+    # In a mosaik world the hybrid simulator is woken by the controller's
+    # new valve openings instead of stepping every second
+    pytest.importorskip("mosaik")
+    until = 600
+    fixed = run_mosaik(ASSETS, str(tmp_path / "fixed.csv"), until)
+    adaptive = run_mosaik(ASSETS, str(tmp_path / "adaptive.csv"), until,
+                          pss_params={"adaptive": True, "tolerance": 1e-3, "max_step": 300})
+    for key, (time, values) in fixed.items():
+        if not key[0].startswith("PSS-0."):
+            continue
+        adaptive_time, adaptive_values = adaptive[key]
+        assert len(adaptive_time) <= until // 60
+        rows = np.searchsorted(time, adaptive_time)
+        np.testing.assert_array_equal(time[rows], adaptive_time)
+        np.testing.assert_allclose(adaptive_values.astype(float), values[rows].astype(float), rtol=1e-9, atol=1e-3,
+                                   err_msg=str(key))
+    meta = PSSSimulator().init("PSS-0", adaptive=True)
+    assert meta["type"] == "hybrid"
+    assert meta["models"]["PSS"]["trigger"] == ["valve_opening", "pump_operation"]
+
+
+@pytest.mark.parametrize("step_size", [60, 900])
+def test_large_steps_match_one_second_reference(step_size):
+    # Inputs that only change on the step grid give the 1 s values at every
+    # step time
+    until = 3600
+    inputs = schedule(until, step_size, seed=2)
+    expected = reference(inputs, until)
+
+    sim = make_sim(step_size=step_size)
+    time = 0
+    while time < until:
+        next_time = sim.step(time, inputs_at(time, inputs), None)
+        assert next_time == time + step_size
+        np.testing.assert_allclose(outputs(sim), expected[time], rtol=1e-9)
+        time = next_time
@@ -0,0 +1,86 @@
+import logging
+
+import numpy as np
+import pytest
+
+from phasethree.sim_logging import TRACE_GET_DATA, TRACE_RECORD, TRACE_STEP, SimLogger, read_trace
+
+
+class Formatted:
+    # Argument that counts how often it is formatted
+    def __init__(self):
+        self.calls = 0
+
+    def __str__(self):
+        self.calls += 1
+        return 'inputs'
+
+
+def test_debug_is_sampled_and_lazy(caplog):
+    log = SimLogger('test_sampling')
+    log.configure('DEBUG', every=3)
+    inputs = Formatted()
+    with caplog.at_level(logging.DEBUG, logger='phasethree.test_sampling'):
+        sampled = []
+        formatted = []
+        for time in range(10):
+            sampled.append(log.begin_step(time * 60))
+            calls = inputs.calls
+            log.debug('step at %s: %s', log.time, inputs)
+            formatted.append(inputs.calls > calls)
+    assert sampled == [time % 3 == 0 for time in range(10)]
+    # Skipped steps never format their arguments
+    assert formatted == sampled
+    assert [record.getMessage() for record in caplog.records] == [f'step at {t}: inputs' for t in (0, 180, 360, 540)]
+
+    # Above DEBUG nothing is sampled or formatted
+    log.configure('INFO', every=1)
+    caplog.clear()
+    calls = inputs.calls
+    with caplog.at_level(logging.INFO, logger='phasethree.test_sampling'):
+        assert not log.begin_step(600)
+        log.debug('step: %s', inputs)
+        log.info('done')
+    assert [record.getMessage() for record in caplog.records] == ['done']
+    assert inputs.calls == calls
+
+    with pytest.raises(ValueError):
+        log.configure(every=0)
+
+
+def test_trace_round_trip(tmp_path):
+    path = tmp_path / 'trace.bin'
+    log = SimLogger('test_trace')
+    log.configure(trace_file=str(path))
+    events = [(TRACE_STEP, 0, 3), (TRACE_GET_DATA, 0, 2), (TRACE_STEP, 60, 3), (TRACE_STEP, 2**40, 2**32 - 1)]
+    for event, time, count in events:
+        log.begin_step(time)
+        log.trace(event, count)
+    log.close()
+    assert path.stat().st_size == len(events) * TRACE_RECORD.size
+
+    records = read_trace(str(path))
+    assert [(int(r['event']), int(r['time']), int(r['count'])) for r in records] == events
+    assert np.all(np.diff(records['wall']) >= 0)
+    # Without a trace file nothing is written
+    log.trace(TRACE_STEP, 1)
+
+
+def test_simulator_trace(tmp_path):
+    pytest.importorskip('mosaik_api_v3')
+    from phasethree.pss_simulator import PSSSimulator
+
+    path = tmp_path / 'pss.trace'
+    sim = PSSSimulator()
+    sim.init('PSS-0', log_every=5, trace_file=str(path))
+    sim.create(2, 'PSS', nominal_power=1e5, pressure_wave_runtime=1.5, initial_stored_energy_wh=5e5)
+    inputs = {'PSS_0': {'valve_opening': {'src': 0.5}}}
+    for time in range(4):
+        sim.step(time, inputs, None)
+        sim.get_data({'PSS_0': ['turbine_generation'], 'PSS_1': ['turbine_generation']})
+    sim.finalize()
+
+    records = read_trace(str(path))
+    assert records['event'].tolist() == [TRACE_STEP, TRACE_GET_DATA] * 4
+    assert records['time'].tolist() == [0, 0, 1, 1, 2, 2, 3, 3]
+    assert records['count'].tolist() == [1, 2] * 4
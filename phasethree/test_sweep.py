@@ -0,0 +1,82 @@
+import csv
+import json
+import os
+
+import numpy as np
+import pytest
+
+from phasethree import sweep
+from phasethree.testing import ASSETS
+
+pytest.importorskip('mosaik')
+
+
+def test_grid_and_sample_expansion():
+    assert sweep.grid(K_p=[0.1, 0.2], K_i=[0, 1]) == [
+        {'K_p': 0.1, 'K_i': 0}, {'K_p': 0.1, 'K_i': 1}, {'K_p': 0.2, 'K_i': 0}, {'K_p': 0.2, 'K_i': 1},
+    ]
+    assert sweep.grid() == [{}]
+
+    runs = sweep.sample(50, seed=3, K_p=(0.1, 0.2), datafile=['a.csv', 'b.csv'])
+    assert runs == sweep.sample(50, seed=3, K_p=(0.1, 0.2), datafile=['a.csv', 'b.csv'])
+    assert all(0.1 <= run['K_p'] <= 0.2 for run in runs)
+    assert {run['datafile'] for run in runs} == {'a.csv', 'b.csv'}
+
+
+def test_apply_params():
+    assets = sweep.apply_params(ASSETS, {'K_p': 0.5, 'datafile': 'x.csv'})
+    assert [pss['K_p'] for pss in assets['pss']] == [0.5, 0.5]
+    assert ASSETS['pss'][0]['K_p'] != 0.5
+    with pytest.raises(ValueError, match='Unknown sweep parameters'):
+        sweep.apply_params(ASSETS, {'K_x': 1})
+
+
+def test_kpis_aggregate_over_sources():
+    data = {
+        ('PSS-0.PSS_0', 'stored_energy_wh'): (np.arange(3), np.array([5.0, 4.0, 3.0])),
+        ('PSS-0.PSS_1', 'stored_energy_wh'): (np.arange(3), np.array([1.0, np.nan, 2.0])),
+        ('PSS-0.PSS_0', 'state'): (np.arange(2), np.array(['on', 'off'], dtype=object)),
+        ('PSS-0.PSS_1', 'p'): (np.zeros(0, dtype=np.int64), np.zeros(0)),
+    }
+    assert sweep.kpis(data) == {
+        'stored_energy_wh_mean': 3.0,
+        'stored_energy_wh_min': 1.0,
+        'stored_energy_wh_max': 5.0,
+        'stored_energy_wh_final_sum': 5.0,
+    }
+
+
+def test_resume_runs_only_unfinished_points(tmp_path):
+    pytest.importorskip('mosaik_components.mosaik_pypower')  # Started by scenario_builder
+    base_dir = tmp_path / 'base'
+    base_dir.mkdir()
+    (base_dir / 'asset_description.json').write_text(json.dumps(ASSETS))
+    rows = ['Data', 'date,house'] + [f'01.01.2016 00:{m:02d},{300 + m}' for m in range(0, 60, 15)]
+    (base_dir / 'data_power.csv').write_text('\n'.join(rows) + '\n')
+    out = tmp_path / 'sweep'
+    runs = sweep.grid(K_p=[1e-3, 2e-3])
+
+    # An interrupted sweep: run 0 finished, run 1 was started
+    for i, params in enumerate(runs):
+        run_dir = out / f'run-{i:05d}'
+        run_dir.mkdir(parents=True)
+        (run_dir / 'params.json').write_text(json.dumps(params))
+    finished = {'status': 'ok', 'wall_time_s': 1.0, 'p_total_w_mean': 42.0}
+    (out / 'run-00000' / 'kpis.json').write_text(json.dumps(finished))
+
+    rows = sweep.run_sweep(str(base_dir), runs, str(out), until=900, workers=1)
+    assert rows[0] == dict(run_id='run-00000', K_p=1e-3, **finished)
+    # Only the unfinished run was simulated
+    assert rows[1]['run_id'] == 'run-00001' and rows[1]['K_p'] == 2e-3
+    assert rows[1]['status'] == 'ok', (out / 'run-00001' / 'error.txt').read_text()
+    assert list((out / 'run-00001').glob('output_data.*'))
+    assert not list((out / 'run-00000').glob('output_data.*'))
+    assert rows[1]['stored_energy_wh_final_sum'] > 0
+    with open(out / 'kpis.csv', newline='') as f:
+        table = list(csv.DictReader(f))
+    assert [row['run_id'] for row in table] == ['run-00000', 'run-00001']
+    assert table[0]['p_total_w_mean'] == '42.0'
+
+    # Other parameters for an existing run are refused
+    with pytest.raises(ValueError, match='different parameters'):
+        sweep.run_sweep(str(base_dir), sweep.grid(K_p=[5e-3]), str(out), until=900, workers=1)
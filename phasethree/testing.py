@@ -0,0 +1,66 @@
+import os
+import sys
+
+from phasethree.Collector import read_data
+
+# mosaik loads the simulators as top-level modules, like run.py
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+ASSETS = {
+    'loads': [{'bus': 1}, {'bus': 2}],
+    'pss': [
+        {'bus': 1, 'E_PSS_max_wh': 1e6, 'E_PSS_init_wh': 5e5, 'P_PSS_max_w': 1e5, 'K_p': 1e-3, 'K_i': 1e-5,
+         'K_d': 1e-4, 'pressure_wave_runtime': 1.5},
+        {'bus': 2, 'E_PSS_max_wh': 2e6, 'E_PSS_init_wh': 1e6, 'P_PSS_max_w': 2e5, 'K_p': 2e-3, 'K_i': 0.0,
+         'K_d': 0.0, 'pressure_wave_runtime': 0.7},
+    ],
+}
+
+
+def run_mosaik(assets, data_out, until, datafile=None, flush_interval=None, pss_params=None, **snapshots):
+    # Same simulators and wiring as scenario_builder, without PyPower.
+    # snapshots (checkpoint_dir, checkpoint_every, restore_from) go to every
+    # simulator, pss_params (e.g. adaptive=True) to the PSS simulator.
+    import mosaik
+
+    world = mosaik.World({
+        'Profile': {'python': 'profile_simulator:ProfileSim'},
+        'Optimizer': {'python': 'optimizer_simulator:OptimizerSim'},
+        'Controller': {'python': 'power_controller_simulator:ControllerSim'},
+        'PSS': {'python': 'pss_simulator:PSSSimulator'},
+        'Collector': {'python': 'Collector:Collector'},
+    }, skip_greetings=True)
+    if datafile is not None:
+        profile_sim = world.start('Profile', datafile=datafile, sim_start='01.01.2016 00:00',
+                                  date_format='%d.%m.%Y %H:%M', step_size=900, resample='mean', **snapshots)
+    optimizer_sim = world.start('Optimizer', **snapshots)
+    controller_sim = world.start('Controller', **snapshots)
+    pss_sim = world.start('PSS', **(pss_params or {}), **snapshots)
+    monitor = world.start('Collector', data_out=data_out, flush_interval=flush_interval, **snapshots).Monitor.create(1)[0]
+    for load in assets['loads']:
+        l = optimizer_sim.Load.create(1, bus=load['bus'])[0]
+        g = optimizer_sim.Generator.create(1, bus=load['bus'])[0]
+        world.connect(l, monitor, 'load_p')
+        world.connect(g, monitor, 'generator_p')
+        if 'load_profile' in load:
+            world.connect(profile_sim.Series.create(1, column=load['load_profile'])[0], l, ('value', 'load_p'))
+        if 'generator_profile' in load:
+            world.connect(profile_sim.Series.create(1, column=load['generator_profile'])[0], g, ('value', 'generator_p'))
+    for pss in assets['pss']:
+        p = optimizer_sim.PSS.create(1, bus=pss['bus'], E_PSS_max_wh=pss['E_PSS_max_wh'],
+                                     E_PSS_init_wh=pss['E_PSS_init_wh'], P_PSS_max_w=pss['P_PSS_max_w'])[0]
+        pc = controller_sim.PowerController.create(1, K_p=pss['K_p'], K_i=pss['K_i'], K_d=pss['K_d'])[0]
+        turbine = pss_sim.PSS.create(1, nominal_power=pss['P_PSS_max_w'],
+                                     pressure_wave_runtime=pss['pressure_wave_runtime'],
+                                     initial_stored_energy_wh=pss['E_PSS_init_wh'])[0]
+        world.connect(p, pc, ('p_total_w', 'process_value'))
+        world.connect(pc, turbine, ('summed_output', 'valve_opening'))
+        world.connect(p, monitor, 'p_ch_w', 'p_dis_w', 'p_total_w')
+        world.connect(pc, monitor, 'summed_output', 'current_value')
+        world.connect(turbine, monitor, 'turbine_generation', 'stored_energy_wh')
+    try:
+        world.run(until=until, print_progress=False)
+    except BaseException:
+        world.shutdown()
+        raise
+    return read_data(data_out)
@@ -0,0 +1,130 @@
+import numpy as np
+
+ANTI_WINDUP_MODES = ("clamp", "conditional")
+STATE_ARRAYS = (
+    "kp", "ki", "kd", "integral", "previous_error", "current_value", "cumulative_value", "last_time",
+    "max_integral", "min_integral", "max_cumulative", "min_cumulative", "conditional", "settled",
+)
+
+
+def _limits(values, n, default):
+    # None (globally or per controller) means unbounded
+    if values is None:
+        return np.full(n, default)
+    values = np.broadcast_to(np.asarray(values, dtype=object), (n,))
+    return np.array([default if v is None else v for v in values], dtype=float)
+
+
+class PIDControllerBank:
+    # N PIDController instances whose gains, state and limits live in NumPy
+    # arrays, so all of them are stepped with one vectorized call. With the
+    # default "clamp" anti-windup the results match PIDController exactly;
+    # "conditional" additionally stops integrating while the cumulative value
+    # sits at a limit and the error pushes it further out.
+    def __init__(self, kp, ki, kd, initial_time=0, max_cumulative=None, min_cumulative=None, min_integral=None, max_integral=None,
+                 anti_windup="clamp"):
+        self.kp = np.atleast_1d(np.asarray(kp, dtype=float)).copy()
+        n = len(self.kp)
+        self.ki = np.broadcast_to(np.asarray(ki, dtype=float), (n,)).copy()
+        self.kd = np.broadcast_to(np.asarray(kd, dtype=float), (n,)).copy()
+
+        self.integral = np.zeros(n)
+        self.previous_error = np.zeros(n)
+        self.current_value = np.zeros(n)
+        self.cumulative_value = np.zeros(n)
+
+        self.last_time = np.broadcast_to(np.asarray(initial_time, dtype=float), (n,)).copy()
+
+        self.max_integral = _limits(max_integral, n, np.inf)
+        self.min_integral = _limits(min_integral, n, -np.inf)
+        self.max_cumulative = _limits(max_cumulative, n, np.inf)
+        self.min_cumulative = _limits(min_cumulative, n, -np.inf)
+
+        modes = np.broadcast_to(np.asarray(anti_windup, dtype=object), (n,))
+        unknown = set(modes) - set(ANTI_WINDUP_MODES)
+        if unknown:
+            raise ValueError(f"Unknown anti-windup modes {sorted(unknown)}, expected one of {ANTI_WINDUP_MODES}")
+        self.conditional = modes == "conditional"
+
+        # True where the last step left integral and cumulative value
+        # unchanged with a constant error, i.e. the controller is at rest
+        self.settled = np.zeros(n, dtype=bool)
+
+    def __len__(self):
+        return len(self.kp)
+
+    def extend(self, other):
+        # Appends the controllers of another bank and returns their indices
+        start = len(self)
+        for name in STATE_ARRAYS:
+            setattr(self, name, np.concatenate([getattr(self, name), getattr(other, name)]))
+        return range(start, len(self))
+
+    def step(self, current_time, reference_value, process_value, indices=None):
+        # Steps all controllers, or only those at `indices`
+        idx = slice(None) if indices is None else np.asarray(indices)
+        error = np.asarray(reference_value, dtype=float) - np.asarray(process_value, dtype=float)
+
+        # Determine time difference (assume 1 on first call or bad input)
+        delta_time = current_time - self.last_time[idx]
+        delta_time = np.where(delta_time <= 0, 1, delta_time)
+
+        # --- Proportional ---
+        p_term = self.kp[idx] * error
+
+        previous_error = self.previous_error[idx]
+        previous_cumulative = self.cumulative_value[idx]
+
+        # --- Integral ---
+        integral = self.integral[idx]
+        updated = integral + error * delta_time
+        conditional = self.conditional[idx]
+        if conditional.any():
+            cumulative = self.cumulative_value[idx]
+            saturated = ((cumulative >= self.max_cumulative[idx]) & (error > 0)) | ((cumulative <= self.min_cumulative[idx]) & (error < 0))
+            updated = np.where(conditional & saturated, integral, updated)
+        updated = np.minimum(updated, self.max_integral[idx])
+        updated = np.maximum(updated, self.min_integral[idx])
+        self.integral[idx] = updated
+        i_term = self.ki[idx] * updated
+
+        # --- Derivative ---
+        d_term = self.kd[idx] * (error - previous_error) / delta_time
+
+        # --- Output ---
+        current_value = p_term + i_term + d_term
+        self.current_value[idx] = current_value
+
+        # --- Cumulative value ---
+        cumulative = self.cumulative_value[idx] + current_value
+        cumulative = np.minimum(cumulative, self.max_cumulative[idx])
+        cumulative = np.maximum(cumulative, self.min_cumulative[idx])
+        self.cumulative_value[idx] = cumulative
+
+        # Update state
+        self.settled[idx] = (error == previous_error) & (updated == integral) & (cumulative == previous_cumulative)
+        self.previous_error[idx] = error
+        self.last_time[idx] = current_time
+        return current_value
+
+    def step_changed(self, current_time, reference_value, process_value):
+        # Like step() for all controllers, but controllers that are at rest
+        # and see the same error again are only moved to current_time, as
+        # stepping them would leave their state unchanged. Returns the
+        # indices that were stepped.
+        error = np.asarray(reference_value, dtype=float) - np.asarray(process_value, dtype=float)
+        error = np.broadcast_to(error, self.kp.shape)
+        at_rest = self.settled & (error == self.previous_error)
+        self.last_time[at_rest] = current_time
+        active = np.flatnonzero(~at_rest)
+        if active.size:
+            reference = np.broadcast_to(np.asarray(reference_value, dtype=float), self.kp.shape)[active]
+            process = np.broadcast_to(np.asarray(process_value, dtype=float), self.kp.shape)[active]
+            self.step(current_time, reference, process, indices=active)
+        return active
+
+    def get_current_value(self):
+        return self.current_value
+
+    def get_cumulative_value(self):
+        return self.cumulative_value
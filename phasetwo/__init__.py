@@ -1,4 +1,5 @@
 # phasetwo/__init__.py
 
 from .PIDController import PIDController
+from .PIDControllerBank import PIDControllerBank
 
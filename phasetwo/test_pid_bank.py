@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+from phasetwo import PIDController, PIDControllerBank
+
+KP = [0.5, 1e-3, 2.0, 0.1, 0.0, 1.0]
+KI = [0.1, 1e-5, 0.0, 0.5, 0.2, 0.01]
+KD = [0.05, 0.0, 0.3, 0.0, 0.1, 0.2]
+LIMITS = {
+    "max_cumulative": [1.0, None, 5.0, 2.0, None, 0.5],
+    "min_cumulative": [0.0, None, -5.0, None, -1.0, 0.0],
+    "max_integral": [None, 10.0, None, 3.0, 2.0, None],
+    "min_integral": [-10.0, None, None, -3.0, None, -1.0],
+}
+# Repeated and decreasing times exercise the dt <= 0 fallback
+TIMES = [0, 1, 2, 2, 5, 4, 10, 11, 12, 20, 20, 21] + list(range(30, 90, 3))
+
+
+def scalar_controllers(initial_time=0):
+    return [
+        PIDController(KP[i], KI[i], KD[i], initial_time, **{name: values[i] for name, values in LIMITS.items()})
+        for i in range(len(KP))
+    ]
+
+
+def process_values(seed=0):
+    # Piecewise constant, so controllers saturate and come to rest
+    rng = np.random.default_rng(seed)
+    blocks = rng.normal(0, 3, (len(TIMES) // 8 + 1, len(KP)))
+    return [blocks[k // 8] for k in range(len(TIMES))]
+
+
+def assert_matches(bank, controllers):
+    for name in ("current_value", "cumulative_value", "integral", "previous_error", "last_time"):
+        expected = np.array([getattr(controller, name) for controller in controllers], dtype=float)
+        np.testing.assert_array_equal(getattr(bank, name), expected, err_msg=name)
+
+
+@pytest.mark.parametrize("initial_time", [0, 7])
+def test_bank_matches_scalar_controllers(initial_time):
+    bank = PIDControllerBank(KP, KI, KD, initial_time, **LIMITS)
+    controllers = scalar_controllers(initial_time)
+    for time, process in zip(TIMES, process_values()):
+        bank.step(time, 0.5, process)
+        for controller, value in zip(controllers, process.tolist()):
+            controller.step(time, 0.5, value)
+        assert_matches(bank, controllers)
+
+
+def test_bank_steps_subsets():
+    bank = PIDControllerBank(KP, KI, KD, **LIMITS)
+    controllers = scalar_controllers()
+    for k, (time, process) in enumerate(zip(TIMES, process_values(1))):
+        indices = np.arange(k % 3, len(KP), 2)
+        bank.step(time, 0.0, process[indices], indices=indices)
+        for i in indices.tolist():
+            controllers[i].step(time, 0.0, float(process[i]))
+        assert_matches(bank, controllers)
+
+
+def test_step_changed_matches_stepping_every_controller():
+    bank = PIDControllerBank(KP, KI, KD, **LIMITS)
+    controllers = scalar_controllers()
+    skipped = 0
+    for time, process in zip(TIMES, process_values(2)):
+        active = bank.step_changed(time, 1.0, process)
+        skipped += len(KP) - len(active)
+        for controller, value in zip(controllers, process.tolist()):
+            controller.step(time, 1.0, value)
+        assert_matches(bank, controllers)
+    assert skipped > 0
+
+
+def test_conditional_anti_windup_holds_integral_when_saturated():
+    bank = PIDControllerBank([0.0], [1.0], [0.0], max_cumulative=1.0, anti_windup="conditional")
+    for time in range(1, 6):
+        bank.step(time, 1.0, 0.0)
+    # Saturated after the first step, so the integral stops growing
+    assert bank.cumulative_value[0] == 1.0
+    assert bank.integral[0] == 1.0